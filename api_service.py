@@ -1,16 +1,35 @@
 import torch
 from torch import nn
-from transformers import AutoTokenizer, BertModel
-from flask import Flask, request, jsonify, g, render_template, session, redirect, url_for
+from transformers import AutoTokenizer, BertModel, BertConfig
+from flask import Flask, request, jsonify, g, render_template, session, redirect, url_for, has_request_context, Response
 import argparse
+import base64
+import bisect
+import cProfile
 from mysql.connector import pooling
-from datetime import datetime
+from mysql.connector.errors import PoolError
+from datetime import datetime, timedelta
 import ipaddress
 import hashlib
 import math
 import os
 import functools
 import logging
+import atexit
+import gc
+import gzip
+import signal
+import socket
+import sys
+import tempfile
+import queue
+import threading
+import time
+import json
+import sqlite3
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 
 # .env dosyasını yükle
@@ -58,31 +77,53 @@ MODEL = None
 TOKENIZER = None
 LABELS = ["non", "prof", "grp", "ind", "oth"]
 DB_POOL = None
+DB_POOL_SIZE = 10
+DB_POOL_TIMEOUT = 2.0
+SCHEDULER = None
+BATCH_CHUNK_SIZE = 32
+PREDICTION_CACHE = None
+MODEL_VERSION = None
+FAST_TIER = None
+INFERENCE_EXECUTOR = None
+API_KEY_CACHE = None
+USAGE_WRITER = None
+IP_RATE_LIMITER = None
+QUOTA_LEASES = None
+USAGE_RETENTION = None
+QUOTA_RESET = None
+METRICS = None
+REQUEST_PROFILER = None
+SERVER_TIMING = True
 
 # Admin şifresi
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")  # Güvenlik için .env dosyasından alınmalı
 
 # Model sınıfını tanımla
 class HierarchicalOffensiveClassifier(nn.Module):
-    def __init__(self, model_name, num_labels=5, vocab_size=None):
+    def __init__(self, model_name, num_labels=5, vocab_size=None, config=None):
         super(HierarchicalOffensiveClassifier, self).__init__()
         
-        # vocab_size parametresi mevcutsa ve bu bir string ise (model yolu), tokenizer'ı yükleyip kelime dağarcığı boyutunu alalım
-        if isinstance(model_name, str) and vocab_size is None:
-            try:
-                tokenizer = AutoTokenizer.from_pretrained(model_name)
-                vocab_size = len(tokenizer)
-                logger.info(f"Tokenizer kelime dağarcığı boyutu: {vocab_size}")
-            except Exception as e:
-                logger.warning(f"Tokenizer yüklenemedi, varsayılan BERT kelime dağarcığı boyutu kullanılacak: {e}")
-                vocab_size = None
-        
-        # BERT modelini yükle, vocab_size varsa kullan
-        config_kwargs = {}
-        if vocab_size is not None:
-            config_kwargs['vocab_size'] = vocab_size
+        # config verilirse ağırlıkları yüklemeden yalnızca model iskeletini oluştur
+        if config is not None:
+            self.bert = BertModel(config)
+        else:
+            # vocab_size parametresi mevcutsa ve bu bir string ise (model yolu), tokenizer'ı yükleyip kelime dağarcığı boyutunu alalım
+            if isinstance(model_name, str) and vocab_size is None:
+                try:
+                    tokenizer = AutoTokenizer.from_pretrained(model_name)
+                    vocab_size = len(tokenizer)
+                    logger.info(f"Tokenizer kelime dağarcığı boyutu: {vocab_size}")
+                except Exception as e:
+                    logger.warning(f"Tokenizer yüklenemedi, varsayılan BERT kelime dağarcığı boyutu kullanılacak: {e}")
+                    vocab_size = None
             
-        self.bert = BertModel.from_pretrained(model_name, **config_kwargs)
+            # BERT modelini yükle, vocab_size varsa kullan
+            config_kwargs = {}
+            if vocab_size is not None:
+                config_kwargs['vocab_size'] = vocab_size
+                
+            self.bert = BertModel.from_pretrained(model_name, **config_kwargs)
+        
         self.dropout = nn.Dropout(0.1)
         self.num_labels = num_labels
         
@@ -96,15 +137,28 @@ class HierarchicalOffensiveClassifier(nn.Module):
         
         # Zorluk tahmini (X etiketi için)
         self.difficulty_classifier = nn.Linear(self.bert.config.hidden_size, 2)
+        
+        # Ara katmanlardaki erken çıkış sınıflandırıcıları (train.py --early_exit_layers ile eğitilir)
+        self.early_exit_threshold = None
+        self.exit_classifiers = nn.ModuleDict({
+            str(layer): build_exit_classifier(self.bert.config.hidden_size)
+            for layer in getattr(self.bert.config, 'early_exit_layers', None) or []
+        })
     
     def forward(self, input_ids, attention_mask, token_type_ids=None):
+        if self.early_exit_threshold is not None and len(self.exit_classifiers) > 0 and not self.training:
+            return self.forward_early_exit(input_ids, attention_mask, token_type_ids)
+        
         outputs = self.bert(
             input_ids=input_ids,
             attention_mask=attention_mask,
             token_type_ids=token_type_ids
         )
         
-        pooled_output = outputs.pooler_output
+        return self.classify(outputs.pooler_output)
+    
+    def classify(self, pooled_output):
+        """Havuzlanmış temsilden tüm sınıflandırma başlıklarının çıktılarını üret"""
         pooled_output = self.dropout(pooled_output)
         
         # Çıktılar
@@ -121,32 +175,765 @@ class HierarchicalOffensiveClassifier(nn.Module):
             'multi_label_logits': multi_label_logits,
             'difficulty_logits': difficulty_logits
         }
+    
+    def forward_early_exit(self, input_ids, attention_mask, token_type_ids=None):
+        """
+        Katmanları tek tek çalıştırır; bir ara çıkış sınıflandırıcısının "saldırgan değil"
+        güveni early_exit_threshold değerini geçen örnekler o katmanda batch'ten çıkar.
+        
+        Çıkış sınıflandırıcıları yalnızca saldırganlık için eğitildiğinden çıkan örneklerde
+        diğer başlıklar hesaplanmaz: logitleri sıfırdır ve 'early_exit' ile işaretlenir.
+        Saldırgan olabilecek örnekler tüm katmanlardan geçer. Her örneğin çıktığı katman
+        'exit_layer' olarak döndürülür.
+        """
+        num_layers = len(self.bert.encoder.layer)
+        hidden_states = self.bert.embeddings(input_ids=input_ids, token_type_ids=token_type_ids)
+        
+        # Dolgu maskesini dikkat skorlarına eklenecek biçime getir
+        extended_mask = (1.0 - attention_mask[:, None, None, :].to(hidden_states.dtype)) * torch.finfo(hidden_states.dtype).min
+        
+        active = torch.arange(input_ids.size(0))
+        finished = []
+        
+        for depth, layer in enumerate(self.bert.encoder.layer, start=1):
+            layer_output = layer(hidden_states, attention_mask=extended_mask)
+            hidden_states = layer_output[0] if isinstance(layer_output, tuple) else layer_output
+            
+            if depth == num_layers:
+                outputs = self.classify(self.bert.pooler(hidden_states))
+                outputs['early_exit'] = torch.zeros(active.numel(), dtype=torch.bool)
+                outputs['exit_layer'] = torch.full((active.numel(),), depth, dtype=torch.long)
+                finished.append((active, outputs))
+                break
+            if str(depth) not in self.exit_classifiers:
+                continue
+            
+            exit_logits = self.exit_classifiers[str(depth)](hidden_states[:, 0])
+            exiting = torch.softmax(exit_logits, dim=-1)[:, 0] >= self.early_exit_threshold
+            if not exiting.any():
+                continue
+            
+            count = int(exiting.sum())
+            outputs = {
+                'offensive_logits': exit_logits[exiting],
+                'targeted_logits': exit_logits.new_zeros((count, self.targeted_classifier.out_features)),
+                'target_type_logits': exit_logits.new_zeros((count, self.target_type_classifier.out_features)),
+                'multi_label_logits': exit_logits.new_zeros((count, self.multi_label_classifier.out_features)),
+                'difficulty_logits': exit_logits.new_zeros((count, self.difficulty_classifier.out_features)),
+                'early_exit': torch.ones(count, dtype=torch.bool),
+                'exit_layer': torch.full((count,), depth, dtype=torch.long)
+            }
+            finished.append((active[exiting], outputs))
+            
+            # Çıkan örnekleri sonraki katmanlardan çıkar
+            remaining = ~exiting
+            active = active[remaining]
+            hidden_states = hidden_states[remaining]
+            extended_mask = extended_mask[remaining]
+            if active.numel() == 0:
+                break
+        
+        # Çıktıları orijinal batch sırasına geri diz
+        order = torch.argsort(torch.cat([indices for indices, _ in finished]))
+        return {
+            key: torch.cat([outputs[key] for _, outputs in finished], dim=0)[order]
+            for key in finished[0][1]
+        }
+
+def build_exit_classifier(hidden_size):
+    """Ara katmandaki [CLS] temsilinden saldırganlık tahmini yapan küçük sınıflandırıcı"""
+    return nn.Sequential(nn.Linear(hidden_size, hidden_size), nn.Tanh(), nn.Linear(hidden_size, 2))
+
+# Model çıktılarının sabit sırası (ONNX grafiği bu sırayla dışa aktarılır)
+OUTPUT_NAMES = ['offensive_logits', 'targeted_logits', 'target_type_logits', 'multi_label_logits', 'difficulty_logits']
+
+class OnnxExportWrapper(nn.Module):
+    """ONNX dışa aktarımı için sözlük yerine sabit sıralı demet döndüren sarmalayıcı"""
+    def __init__(self, model):
+        super(OnnxExportWrapper, self).__init__()
+        self.model = model
+    
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        return tuple(outputs[name] for name in OUTPUT_NAMES)
+
+def export_onnx_model(model, tokenizer, output_path, opset_version=17):
+    """Encoder ve beş sınıflandırma başlığını dinamik batch/dizi eksenleriyle ONNX grafiğine aktar"""
+    sample = tokenizer(["Örnek metin"], return_tensors="pt", padding=True, truncation=True, max_length=128)
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes.update({name: {0: 'batch'} for name in OUTPUT_NAMES})
+    
+    wrapper = OnnxExportWrapper(model).eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            tuple(sample[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            dynamo=False
+        )
+    logger.info(f"ONNX modeli dışa aktarıldı: {output_path}")
+
+class OnnxRuntimeModel:
+    """
+    ONNX Runtime CPU oturumunu torch modeliyle aynı arayüzle sunan çıkarım arka ucu.
+    
+    Çağrıldığında torch modelindeki gibi çıktı adlarından tensörlere bir sözlük
+    döndürür; böylece tahmin ve yorumlama fonksiyonları değişmeden kullanılır.
+    """
+    def __init__(self, onnx_path, num_threads=None):
+        self.onnx_path = onnx_path
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.error("onnxruntime yüklü değil, pip install onnxruntime ile kurabilirsiniz.")
+            raise
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        logger.info(f"ONNX Runtime oturumu oluşturuldu: {onnx_path}")
+    
+    def eval(self):
+        return self
+    
+    def __call__(self, input_ids, attention_mask, token_type_ids=None):
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': token_type_ids}
+        outputs = self.session.run(OUTPUT_NAMES, {name: feeds[name].numpy() for name in self.input_names})
+        return {name: torch.from_numpy(output) for name, output in zip(OUTPUT_NAMES, outputs)}
+
+class ServiceMetrics:
+    """
+    Prometheus uyumlu servis metrikleri (prometheus_client isteğe bağlıdır).
+    
+    İstek aşamalarının süreleri tek bir histogramda `stage` etiketiyle tutulur. Etiket
+    çocukları önceden oluşturulduğundan bir gözlem etiket araması yapmaz ve birkaç
+    mikrosaniyede tamamlanır. Pre-fork modunda prometheus_client çok süreçli kipte çalışır:
+    her işçi değerlerini multiprocess_dir altındaki kendi mmap dosyalarına yazar ve /metrics
+    hangi işçiye gelirse gelsin tüm süreçlerin toplamını döndürür.
+    """
+    STAGES = ("auth", "db_lookup", "quota_reserve", "tokenize", "forward", "postprocess", "accounting", "db_commit")
+    STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+    DB_WAIT_BUCKETS = (0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    
+    def __init__(self, multiprocess_dir=None):
+        self.multiprocess_dir = multiprocess_dir
+        if multiprocess_dir:
+            # Önceki çalıştırmadan kalan dosyalar toplamlara karışmasın
+            os.makedirs(multiprocess_dir, exist_ok=True)
+            for name in os.listdir(multiprocess_dir):
+                if name.endswith(".db"):
+                    os.remove(os.path.join(multiprocess_dir, name))
+            # prometheus_client çok süreçli kipi ilk içe aktarımda ortam değişkeninden seçer
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiprocess_dir
+        
+        try:
+            import prometheus_client
+        except ImportError:
+            logger.error("prometheus_client yüklü değil, pip install prometheus_client ile kurabilirsiniz.")
+            raise
+        
+        self._client = prometheus_client
+        self._registry = prometheus_client.CollectorRegistry()
+        registry = self._registry
+        
+        self.stage_seconds = prometheus_client.Histogram(
+            "temizdil_stage_duration_seconds", "İstek aşamalarının süresi (saniye)",
+            ["stage"], buckets=self.STAGE_BUCKETS, registry=registry
+        )
+        self._stages = {stage: self.stage_seconds.labels(stage) for stage in self.STAGES}
+        
+        self.requests = prometheus_client.Counter(
+            "temizdil_http_requests", "Endpoint, metot ve durum koduna göre istek sayısı",
+            ["endpoint", "method", "status"], registry=registry
+        )
+        self.request_seconds = prometheus_client.Histogram(
+            "temizdil_http_request_duration_seconds", "Endpoint bazında toplam istek süresi (saniye)",
+            ["endpoint"], buckets=self.REQUEST_BUCKETS, registry=registry
+        )
+        self._request_children = {}
+        
+        self.batch_size = prometheus_client.Histogram(
+            "temizdil_inference_batch_size", "Tek çağrıda modele giren metin sayısı",
+            buckets=self.BATCH_SIZE_BUCKETS, registry=registry
+        )
+        self.db_pool_wait = prometheus_client.Histogram(
+            "temizdil_db_pool_wait_seconds", "Havuzdan bağlantı alma süresi (saniye)",
+            buckets=self.DB_WAIT_BUCKETS, registry=registry
+        )
+        self.model_load_seconds = prometheus_client.Gauge(
+            "temizdil_model_load_seconds", "Model ve tokenizer yükleme süresi (saniye)",
+            multiprocess_mode="max", registry=registry
+        )
+        logger.info(f"Prometheus metrikleri açık{f' (çok süreçli: {multiprocess_dir})' if multiprocess_dir else ''}")
+    
+    def observe_stage(self, stage, seconds):
+        self._stages[stage].observe(seconds)
+    
+    def observe_request(self, endpoint, method, status, seconds):
+        key = (endpoint, method, status)
+        children = self._request_children.get(key)
+        if children is None:
+            children = self._request_children[key] = (
+                self.requests.labels(endpoint, method, str(status)),
+                self.request_seconds.labels(endpoint)
+            )
+        children[0].inc()
+        children[1].observe(seconds)
+    
+    def render(self):
+        """Tüm metrikleri text exposition formatında döndür; çok süreçli kipte süreçler toplanır"""
+        if self.multiprocess_dir:
+            from prometheus_client import multiprocess
+            registry = self._client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=self.multiprocess_dir)
+        else:
+            registry = self._registry
+        return self._client.generate_latest(registry), self._client.CONTENT_TYPE_LATEST
+    
+    def mark_process_dead(self, pid):
+        """Sonlanan işçinin canlı gauge değerlerini toplamdan çıkar (sayaçlar korunur)"""
+        if self.multiprocess_dir:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid, self.multiprocess_dir)
+
+# Server-Timing başlığı için isteğin aşama süreleri; model çağrısı başka bir iş parçacığında
+# çalışsa da süreler call_with_stage_timings ile çağıran isteğin sözlüğüne yazılır
+STAGE_TIMINGS = threading.local()
+SERVER_TIMING_ENDPOINTS = ("predict", "batch_predict")
+
+def observe_stage(stage, started):
+    """time.perf_counter() ile başlatılan aşamanın süresini metriklere ve isteğin Server-Timing sözlüğüne kaydet"""
+    elapsed = time.perf_counter() - started
+    if METRICS is not None:
+        METRICS.observe_stage(stage, elapsed)
+    timings = getattr(STAGE_TIMINGS, "current", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def merge_stage_timings(timings):
+    """Başka bir iş parçacığında ölçülen aşama sürelerini geçerli isteğe ekle"""
+    current = getattr(STAGE_TIMINGS, "current", None)
+    if current is not None:
+        for stage, seconds in timings.items():
+            current[stage] = current.get(stage, 0.0) + seconds
+
+def call_with_stage_timings(timings, fn, *args):
+    """fn(*args) çağrısı sırasında ölçülen aşama sürelerini timings sözlüğüne topla"""
+    previous = getattr(STAGE_TIMINGS, "current", None)
+    STAGE_TIMINGS.current = timings
+    try:
+        return fn(*args)
+    finally:
+        STAGE_TIMINGS.current = previous
+
+class RequestProfiler:
+    """
+    Admin tarafından açılan, sonraki N tahmin isteğini profilleyen yardımcı.
+    
+    Mod cprofile ise cProfile, torch ise torch.profiler kullanılır ve her istek için
+    output_dir altına bir dosya yazılır (.prof ya da Chrome trace .json). Profilleyiciler
+    aynı anda tek oturumu desteklediğinden aynı anda yalnızca bir istek profillenir.
+    Profillenen istekte model çağrısı zamanlayıcıya ve çıkarım yürütücüsüne gönderilmez,
+    istek iş parçacığında çalışır ki profil ileri geçişi de kapsasın. Durum süreç içidir;
+    pre-fork modunda yalnızca admin isteğini alan işçi profillenir.
+    """
+    MODES = ("cprofile", "torch")
+    MAX_REQUESTS = 100
+    
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._mode = None
+        self._remaining = 0
+        self._active = False
+        self._sequence = 0
+        self._recent = deque(maxlen=20)
+    
+    def arm(self, count, mode="cprofile"):
+        """Sonraki count tahmin isteğini profille (0: kapat)"""
+        if mode not in self.MODES:
+            raise ValueError(f"mode şunlardan biri olmalı: {', '.join(self.MODES)}")
+        if isinstance(count, bool) or not isinstance(count, int) or not 0 <= count <= self.MAX_REQUESTS:
+            raise ValueError(f"requests 0 ile {self.MAX_REQUESTS} arasında bir tam sayı olmalı")
+        
+        if count > 0:
+            os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            self._mode = mode if count > 0 else None
+            self._remaining = count
+        logger.info(f"Profilleyici {'açıldı' if count > 0 else 'kapatıldı'} (mod={mode}, istek={count}, klasör={self.output_dir})")
+    
+    def start(self, endpoint):
+        """İstek profillenecekse profilleyiciyi başlat ve oturumu döndür"""
+        # Kapalıyken kilit alınmaz
+        if self._remaining <= 0 or endpoint not in SERVER_TIMING_ENDPOINTS:
+            return None
+        
+        with self._lock:
+            if self._remaining <= 0 or self._active:
+                return None
+            self._remaining -= 1
+            self._active = True
+            self._sequence += 1
+            mode, sequence = self._mode, self._sequence
+        
+        try:
+            if mode == "torch":
+                profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                profiler.__enter__()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except Exception as e:
+            logger.error(f"Profilleyici başlatılamadı: {e}")
+            with self._lock:
+                self._active = False
+            return None
+        
+        return mode, sequence, profiler
+    
+    def finish(self, profile_session, endpoint):
+        """Profilleyiciyi durdur ve sonucu dosyaya yaz"""
+        mode, sequence, profiler = profile_session
+        name = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{sequence}-{endpoint}"
+        
+        try:
+            if mode == "torch":
+                profiler.__exit__(None, None, None)
+                path = os.path.join(self.output_dir, f"{name}.json")
+                profiler.export_chrome_trace(path)
+            else:
+                profiler.disable()
+                path = os.path.join(self.output_dir, f"{name}.prof")
+                profiler.dump_stats(path)
+            self._recent.append(path)
+            logger.info(f"Profil yazıldı: {path}")
+        except Exception as e:
+            logger.error(f"Profil yazılırken hata: {e}")
+        finally:
+            with self._lock:
+                self._active = False
+    
+    def stats(self):
+        """Profilleyici durumu ve son yazılan dosyalar"""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "mode": self._mode,
+                "remaining": self._remaining,
+                "active": self._active,
+                "output_dir": self.output_dir,
+                "recent_files": list(self._recent)
+            }
+
+def is_profiling():
+    """Geçerli istek profilleniyor mu"""
+    return has_request_context() and g.get('profile_session') is not None
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    STAGE_TIMINGS.current = {} if SERVER_TIMING and request.endpoint in SERVER_TIMING_ENDPOINTS else None
+    if REQUEST_PROFILER is not None:
+        g.profile_session = REQUEST_PROFILER.start(request.endpoint)
+
+@app.teardown_request
+def finish_request_profiling(exc):
+    STAGE_TIMINGS.current = None
+    profile_session = g.pop('profile_session', None)
+    if profile_session is not None:
+        REQUEST_PROFILER.finish(profile_session, request.endpoint)
+
+# after_request fonksiyonları ters sırayla çalışır; aşağıdakiler commit_db_session'dan sonra
+# çalışsın ve commit süresini ve commit hatasıyla değişen son durum kodunu görsün diye önce tanımlanır
+@app.after_request
+def add_server_timing(response):
+    """Tahmin yanıtlarına aşama sürelerini içeren Server-Timing başlığını ekle"""
+    timings = getattr(STAGE_TIMINGS, "current", None)
+    if timings is not None:
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+        entries.append(f"total;dur={(time.perf_counter() - g.request_started) * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    """İstek sayısını ve toplam süreyi endpoint ve durum koduna göre kaydet"""
+    if METRICS is not None and 'request_started' in g:
+        METRICS.observe_request(request.endpoint or "not_found", request.method, response.status_code,
+                                time.perf_counter() - g.request_started)
+    return response
 
 # Veritabanı işlemleri
-def init_db_pool():
+def init_db_pool(create_tables=True):
     """MySQL bağlantı havuzu oluştur"""
     global DB_POOL
     
     try:
         DB_POOL = pooling.MySQLConnectionPool(
             pool_name="api_pool",
-            pool_size=5,
+            pool_size=DB_POOL_SIZE,
             host=os.getenv("DB_HOST", "localhost"),
             user=os.getenv("DB_USER", "root"),
             password=os.getenv("DB_PASSWORD", ""),
             database=os.getenv("DB_NAME", "temizdil_api")
         )
-        logger.info("Veritabanı bağlantı havuzu oluşturuldu")
+        logger.info(f"Veritabanı bağlantı havuzu oluşturuldu (boyut: {DB_POOL_SIZE})")
         
         # Veritabanı şemasını kontrol et ve gerekirse oluştur
-        create_schema()
+        if create_tables:
+            create_schema()
     except Exception as e:
         logger.error(f"Veritabanı bağlantı havuzu oluşturulurken hata: {e}")
         raise
 
+def close_db_pool():
+    """Havuzdaki bağlantıları kapat ve havuzu bırak (fork öncesinde ebeveyn süreçte kullanılır)"""
+    global DB_POOL, DB_POOL_SLOTS
+    
+    if DB_POOL is None:
+        return
+    
+    # Boştaki bağlantılar havuzdan alınıp kapatılır; havuza geri verilmedikleri için
+    # havuz boşalır ve işçiler ebeveynin soketlerini devralmaz
+    while True:
+        try:
+            conn = DB_POOL.get_connection()
+        except PoolError:
+            break
+        except Exception as e:
+            logger.warning(f"Veritabanı bağlantıları kapatılırken hata: {e}")
+            break
+        try:
+            conn.disconnect()
+        except Exception as e:
+            logger.warning(f"Veritabanı bağlantısı kapatılırken hata: {e}")
+    DB_POOL = None
+    DB_POOL_SLOTS = None
+
+DB_POOL_STATS = {"checkouts": 0, "waits": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+DB_POOL_STATS_LOCK = threading.Lock()
+
+# Havuzdaki boş bağlantı sayısını izleyen semafor; havuz doluyken yoklamak yerine
+# bağlantı geri verilene kadar bloklanılır. (havuz, semafor) çifti olarak tutulur.
+DB_POOL_SLOTS = None
+DB_POOL_SLOTS_LOCK = threading.Lock()
+
+def db_pool_slots():
+    """Geçerli havuzun semaforunu döndür (havuz değiştiyse yeniden oluştur)"""
+    global DB_POOL_SLOTS
+    
+    with DB_POOL_SLOTS_LOCK:
+        if DB_POOL_SLOTS is None or DB_POOL_SLOTS[0] is not DB_POOL:
+            DB_POOL_SLOTS = (DB_POOL, threading.BoundedSemaphore(DB_POOL.pool_size))
+        return DB_POOL_SLOTS[1]
+
+class PoolConnection:
+    """Havuz bağlantısı; close() bağlantıyı havuza geri verir ve bekleyen bir isteği uyandırır"""
+    def __init__(self, conn, slots):
+        self._conn = conn
+        self._slots = slots
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def close(self):
+        if self._slots is None:
+            return
+        slots, self._slots = self._slots, None
+        try:
+            self._conn.close()
+        finally:
+            slots.release()
+
+def acquire_db_connection():
+    """Havuzdan bağlantı al; havuz doluysa DB_POOL_TIMEOUT süresince bağlantı geri verilmesini bekle"""
+    started = time.monotonic()
+    slots = db_pool_slots()
+    waited_for_pool = False
+    
+    if not slots.acquire(blocking=False):
+        waited_for_pool = True
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            with DB_POOL_STATS_LOCK:
+                DB_POOL_STATS["timeouts"] += 1
+            logger.error(f"Veritabanı havuzunda {DB_POOL_TIMEOUT:.1f} saniye içinde boş bağlantı bulunamadı")
+            raise PoolError("Failed getting connection; pool exhausted")
+    
+    try:
+        conn = DB_POOL.get_connection()
+    except Exception:
+        slots.release()
+        raise
+    
+    if METRICS is not None:
+        METRICS.db_pool_wait.observe(time.monotonic() - started)
+    
+    with DB_POOL_STATS_LOCK:
+        DB_POOL_STATS["checkouts"] += 1
+        if waited_for_pool:
+            waited = time.monotonic() - started
+            DB_POOL_STATS["waits"] += 1
+            DB_POOL_STATS["total_wait"] += waited
+            DB_POOL_STATS["max_wait"] = max(DB_POOL_STATS["max_wait"], waited)
+    return PoolConnection(conn, slots)
+
+def db_pool_stats():
+    """Havuz boyutu, bağlantı bekleme süreleri ve zaman aşımları"""
+    with DB_POOL_STATS_LOCK:
+        waits = DB_POOL_STATS["waits"]
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "checkouts": DB_POOL_STATS["checkouts"],
+            "waits": waits,
+            "timeouts": DB_POOL_STATS["timeouts"],
+            "avg_wait_ms": round(DB_POOL_STATS["total_wait"] / waits * 1000, 2) if waits else 0.0,
+            "max_wait_ms": round(DB_POOL_STATS["max_wait"] * 1000, 2)
+        }
+
+class RequestConnection:
+    """
+    Bir istek boyunca paylaşılan havuz bağlantısı.
+    
+    Yardımcı fonksiyonların close() çağrısı bağlantıyı havuza döndürmez, commit() ise
+    istek sonuna ertelenir; bağlantı istek bitiminde tek seferde commit edilip bırakılır.
+    Tahmin öncesinde release_request_connection ile erkenden bırakılabilir.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self.pending = False
+    
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+    
+    def commit(self):
+        self.pending = True
+    
+    def commit_now(self):
+        """Ertelemeden commit et (satır kilidini hemen bırakması gereken yazmalar için)"""
+        self._conn.commit()
+        self.pending = False
+    
+    def rollback(self):
+        self._conn.rollback()
+        self.pending = False
+    
+    def close(self):
+        pass
+    
+    def release(self):
+        """Commit edilmemiş yazmaları geri al ve bağlantıyı havuza döndür"""
+        try:
+            if self.pending:
+                self._conn.rollback()
+        finally:
+            self._conn.close()
+
+def get_db_connection():
+    """İstek içindeyse isteğe ait paylaşılan bağlantıyı, değilse havuzdan yeni bir bağlantı döndür"""
+    if not has_request_context():
+        return acquire_db_connection()
+    
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = g.db_conn = RequestConnection(acquire_db_connection())
+    return conn
+
+@app.after_request
+def commit_db_session(response):
+    """İstek boyunca ertelenen yazmaları tek seferde commit et"""
+    conn = g.get('db_conn')
+    if conn is not None and conn.pending:
+        started = time.perf_counter()
+        try:
+            conn.commit_now()
+            observe_stage("db_commit", started)
+        except Exception as e:
+            logger.error(f"İstek sonunda veritabanı işlemi commit edilirken hata: {e}")
+            conn.rollback()
+            response = jsonify({"error": "İşlem sırasında bir hata oluştu"})
+            response.status_code = 500
+    return response
+
+def release_request_connection():
+    """
+    Ertelenen yazmaları commit edip isteğin bağlantısını havuza geri ver.
+    
+    Tahminden önce çağrılır; böylece bağlantı ve satır kilitleri çıkarım boyunca tutulmaz.
+    Sonraki veritabanı işlemleri için get_db_connection havuzdan yeni bir bağlantı alır.
+    """
+    conn = g.pop('db_conn', None)
+    if conn is None:
+        return
+    
+    try:
+        if conn.pending:
+            started = time.perf_counter()
+            conn.commit_now()
+            observe_stage("db_commit", started)
+    except Exception as e:
+        logger.error(f"Tahmin öncesinde veritabanı işlemi commit edilirken hata: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.release()
+
+@app.teardown_request
+def release_db_session(exc):
+    """İsteğin bağlantısını havuza geri ver"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+# Kullanım özet tabloları ve zaman dilimi sütun tipleri
+USAGE_ROLLUP_TABLES = (("usage_rollup_hourly", "DATETIME"), ("usage_rollup_daily", "DATE"))
+USAGE_ROLLUP_BACKFILL_LOCK = "temizdil_usage_rollup_backfill"
+
+def ensure_index(cursor, table, index_name, columns):
+    """İndeks yoksa oluştur (MySQL CREATE INDEX IF NOT EXISTS desteklemez)"""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index_name)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+        logger.info(f"İndeks oluşturuldu: {table}.{index_name} ({columns})")
+
+def ensure_column(cursor, table, column, definition):
+    """Önceki şemayla oluşturulmuş tabloya eksik sütunu ekle"""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"Sütun eklendi: {table}.{column}")
+
+def backfill_usage_rollups(conn, cursor):
+    """
+    Özet tablolarını mevcut api_usage_logs kayıtlarından doldur (saatlik özet son 31 gün ile sınırlı).
+    
+    Aynı anda başlayan süreçlerden yalnızca biri doldursun diye GET_LOCK altında çalışır ve
+    tablonun boş olduğu kilit alındıktan sonra yeniden kontrol edilir. Arada canlı yazıcıların
+    eklediği satırlar çakışmaz; loglardan hesaplanan toplamlarla değiştirilir.
+    """
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (USAGE_ROLLUP_BACKFILL_LOCK, 60))
+    if cursor.fetchone()[0] != 1:
+        logger.warning("Özet tabloları doldurma kilidi alınamadı, doldurma atlandı")
+        return
+    
+    try:
+        # Kilit beklenirken başka bir sürecin yaptığı doldurmayı görmek için yeni işlem başlat
+        conn.commit()
+        cursor.execute("SELECT 1 FROM usage_rollup_daily LIMIT 1")
+        if cursor.fetchone() is not None:
+            return
+        
+        buckets = {
+            "usage_rollup_hourly": ("DATE_FORMAT(created_at, '%Y-%m-%d %H:00:00')", "WHERE created_at >= DATE_SUB(NOW(), INTERVAL 31 DAY)"),
+            "usage_rollup_daily": ("DATE(created_at)", "")
+        }
+        scopes = (
+            ("'all'", "''", ""),
+            ("'key'", "CAST(api_key_id AS CHAR)", "api_key_id IS NOT NULL"),
+            ("'ip'", "COALESCE(request_ip, '')", "")
+        )
+        
+        for table, (bucket_expr, where) in buckets.items():
+            selects = []
+            for scope, scope_id, condition in scopes:
+                scope_where = where
+                if condition:
+                    scope_where = f"{where} AND {condition}" if where else f"WHERE {condition}"
+                selects.append(
+                    f"SELECT {bucket_expr} AS bucket_start, {scope} AS scope, {scope_id} AS scope_id, COUNT(*) AS request_count, "
+                    f"COALESCE(SUM(is_successful), 0) AS success_count, COALESCE(SUM(tokens_used), 0) AS tokens_used "
+                    f"FROM api_usage_logs {scope_where} GROUP BY {bucket_expr}, {scope_id}"
+                )
+            cursor.execute(
+                f"INSERT INTO {table} (bucket_start, scope, scope_id, request_count, success_count, tokens_used) "
+                f"SELECT * FROM ({' UNION ALL '.join(selects)}) AS backfill "
+                "ON DUPLICATE KEY UPDATE request_count = VALUES(request_count), "
+                "success_count = VALUES(success_count), tokens_used = VALUES(tokens_used)"
+            )
+            if cursor.rowcount:
+                logger.info(f"{table} mevcut loglardan dolduruldu: {cursor.rowcount} satır")
+        conn.commit()
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (USAGE_ROLLUP_BACKFILL_LOCK,))
+        cursor.fetchone()
+
+def merge_usage_rollups(target, source):
+    """Özet sayaçlarını ({tablo: {(dilim, kapsam, kimlik): [istek, başarılı, token]}}) hedefe ekle"""
+    for table, counts in source.items():
+        table_counts = target.setdefault(table, {})
+        for key, values in counts.items():
+            current = table_counts.setdefault(key, [0, 0, 0])
+            for i, value in enumerate(values):
+                current[i] += value
+
+def upsert_usage_rollups(cursor, rollups):
+    """Toplanmış özet sayaçlarını saatlik/günlük tablolara ekle"""
+    # Satırlar sıralı güncellenir ki eşzamanlı yazıcılar kilitlenmeye girmesin
+    for table, counts in rollups.items():
+        if not counts:
+            continue
+        cursor.executemany(
+            f"INSERT INTO {table} (bucket_start, scope, scope_id, request_count, success_count, tokens_used) VALUES (%s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE request_count = request_count + VALUES(request_count), "
+            "success_count = success_count + VALUES(success_count), tokens_used = tokens_used + VALUES(tokens_used)",
+            [key + tuple(values) for key, values in sorted(counts.items())]
+        )
+
+def insert_usage_logs(cursor, rows, deferred_rollups=None):
+    """Log satırlarını ekle ve saatlik/günlük özet tablolarını aynı işlem içinde artır
+    
+    rows: (api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message, created_at)
+    deferred_rollups: verilirse genel ('all') kapsamın sayaçları yazılmaz, bu sözlükte biriktirilir
+    """
+    if not rows:
+        return
+    
+    cursor.executemany(
+        "INSERT INTO api_usage_logs (api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        rows
+    )
+    
+    rollups = {table: {} for table, _ in USAGE_ROLLUP_TABLES}
+    overall = {table: {} for table, _ in USAGE_ROLLUP_TABLES}
+    for api_key_id, request_ip, _, _, tokens_used, is_successful, _, created_at in rows:
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        scopes = [("all", ""), ("ip", request_ip or "")]
+        if api_key_id is not None:
+            scopes.append(("key", str(api_key_id)))
+        
+        for table, bucket in (("usage_rollup_hourly", hour), ("usage_rollup_daily", hour.date())):
+            for scope, scope_id in scopes:
+                target = overall if scope == "all" and deferred_rollups is not None else rollups
+                counts = target[table].setdefault((bucket, scope, scope_id), [0, 0, 0])
+                counts[0] += 1
+                counts[1] += 1 if is_successful else 0
+                counts[2] += tokens_used or 0
+    
+    upsert_usage_rollups(cursor, rollups)
+    if deferred_rollups is not None:
+        merge_usage_rollups(deferred_rollups, overall)
+
 def create_schema():
     """Gerekli tabloları oluştur"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -160,6 +947,7 @@ def create_schema():
             unlimited_ips TEXT,
             monthly_token_limit INT DEFAULT 1000,
             tokens_used INT DEFAULT 0,
+            leased_tokens INT DEFAULT 0,
             auto_reset BOOLEAN DEFAULT TRUE,
             last_reset_date DATETIME,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -174,6 +962,7 @@ def create_schema():
             ip_address VARCHAR(45) NOT NULL UNIQUE,
             monthly_token_limit INT DEFAULT 10000,
             tokens_used INT DEFAULT 0,
+            leased_tokens INT DEFAULT 0,
             request_count INT DEFAULT 0,
             last_request_time TIMESTAMP,
             last_reset_date DATETIME,
@@ -198,6 +987,71 @@ def create_schema():
         )
         """)
         
+        # API anahtarı önbelleklerinin süreçler ve düğümler arası geçersiz kılma olayları
+        # (api_key_id ve api_key boşsa tüm önbellek temizlenir)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS api_key_invalidations (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            api_key_id INT,
+            api_key VARCHAR(64),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_created_at (created_at)
+        )
+        """)
+        
+        # Zamanlanmış işlerin düğümler arası kilit satırları
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_locks (
+            name VARCHAR(64) PRIMARY KEY,
+            owner VARCHAR(128) NOT NULL DEFAULT '',
+            locked_until DATETIME(6) NOT NULL
+        )
+        """)
+        
+        # Kota kiralamasında düğümlerin henüz harcamadığı tokenler
+        ensure_column(cursor, "api_keys", "leased_tokens", "INT DEFAULT 0")
+        ensure_column(cursor, "ip_rate_limits", "leased_tokens", "INT DEFAULT 0")
+        
+        # Toplu kota sıfırlamasında dönemi dolan satırları bulmak için indeksler
+        ensure_index(cursor, "api_keys", "idx_api_keys_last_reset_date", "last_reset_date")
+        ensure_index(cursor, "ip_rate_limits", "idx_ip_rate_limits_last_reset_date", "last_reset_date")
+        
+        # Admin listelerinde sıralanabilen sütunlar için indeksler
+        ensure_index(cursor, "api_keys", "idx_api_keys_created_at", "created_at")
+        ensure_index(cursor, "api_keys", "idx_api_keys_tokens_used", "tokens_used")
+        ensure_index(cursor, "ip_rate_limits", "idx_ip_rate_limits_request_count", "request_count")
+        ensure_index(cursor, "ip_rate_limits", "idx_ip_rate_limits_tokens_used", "tokens_used")
+        
+        # Bellek içi IP sınırlayıcısının açılışta son penceredeki sayaçları yüklemesi için
+        ensure_index(cursor, "ip_rate_limits", "idx_ip_rate_limits_last_request_time", "last_request_time")
+        
+        # Kullanım logları üzerindeki zaman aralıklı sorgular için indeksler
+        ensure_index(cursor, "api_usage_logs", "idx_usage_logs_created_at", "created_at")
+        ensure_index(cursor, "api_usage_logs", "idx_usage_logs_key_created", "api_key_id, created_at")
+        ensure_index(cursor, "api_usage_logs", "idx_usage_logs_ip_created", "request_ip, created_at")
+        
+        # Saatlik ve günlük kullanım özet tabloları (scope: all, key, ip)
+        for table, bucket_type in USAGE_ROLLUP_TABLES:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket_start {bucket_type} NOT NULL,
+                scope VARCHAR(8) NOT NULL,
+                scope_id VARCHAR(45) NOT NULL DEFAULT '',
+                request_count INT NOT NULL DEFAULT 0,
+                success_count INT NOT NULL DEFAULT 0,
+                tokens_used BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket_start, scope, scope_id),
+                INDEX idx_scope_bucket (scope, bucket_start)
+            )
+            """)
+        
+        conn.commit()
+        
+        # Özet tabloları yeni oluşturulduysa mevcut loglardan bir kez doldur
+        cursor.execute("SELECT 1 FROM usage_rollup_daily LIMIT 1")
+        if cursor.fetchone() is None:
+            backfill_usage_rollups(conn, cursor)
+        
         conn.commit()
         logger.info("Veritabanı şeması kontrol edildi/oluşturuldu")
     except Exception as e:
@@ -208,9 +1062,743 @@ def create_schema():
         cursor.close()
         conn.close()
 
+class UsageWriter:
+    """
+    Kullanım sayaçlarını ve istek loglarını bellekte biriktirip toplu yazan write-behind tamponu.
+    
+    İstekler yalnızca tampona ekleme yapar. Arka plandaki iş parçacığı her flush_interval_ms'de
+    ya da max_events olay biriktiğinde tek bir işlemde çok satırlı log INSERT'i ve anahtar/IP
+    başına toplanmış UPDATE'leri çalıştırır. Çökmede kaybolabilecek kayıtlar bu iki sınırla,
+    veritabanına yazılamadığı sürece biriken loglar ise max_pending ile sınırlıdır.
+    
+    Tüm süreçlerin yazdığı genel ('all') özet satırları sıcak olduğundan bu satırların
+    sayaçları bellekte toplanır ve en fazla OVERALL_ROLLUP_INTERVAL saniyede bir yazılır.
+    """
+    LOG_INSERT_CHUNK = 1000
+    OVERALL_ROLLUP_INTERVAL = 5.0
+    
+    def __init__(self, flush_interval_ms=250, max_events=500, max_pending=50000):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._logs = []
+        self._key_tokens = {}
+        self._ip_tokens = {}
+        self._ip_requests = {}
+        self._events = 0
+        # Genel özet sayaçlarına yalnızca _flush_lock tutulurken erişilir
+        self._overall_rollups = {}
+        self._overall_written = None
+        self._stats = {"flushes": 0, "failed_flushes": 0, "written_logs": 0, "dropped_logs": 0, "last_flush_ms": 0.0}
+    
+    def start(self):
+        """Tamponu boşaltan iş parçacığını başlat"""
+        self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Kullanım yazıcısı başlatıldı (aralık={self.flush_interval * 1000:.0f} ms, olay sınırı={self.max_events})")
+        return self
+    
+    def stop(self):
+        """İş parçacığını durdur ve kalan kayıtları yaz (kapanışta çağrılır)"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+    
+    def _added(self, count=1):
+        """Olay sayacını artır; sınır aşıldıysa boşaltıcıyı uyandır (kilit tutulurken çağrılır)"""
+        self._events += count
+        if self._events >= self.max_events:
+            self._wakeup.set()
+    
+    def _trim_logs(self):
+        overflow = len(self._logs) - self.max_pending
+        if overflow > 0:
+            del self._logs[:overflow]
+            self._stats["dropped_logs"] += overflow
+            logger.warning(f"Kullanım log tamponu dolu, en eski {overflow} kayıt atıldı")
+    
+    def add_log(self, api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message=None):
+        with self._lock:
+            self._logs.append((api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message, datetime.now()))
+            self._trim_logs()
+            self._added()
+    
+    def add_key_tokens(self, api_key_id, tokens_used):
+        with self._lock:
+            self._key_tokens[api_key_id] = self._key_tokens.get(api_key_id, 0) + tokens_used
+            self._added()
+    
+    def add_ip_tokens(self, ip_id, tokens_used):
+        with self._lock:
+            self._ip_tokens[ip_id] = self._ip_tokens.get(ip_id, 0) + tokens_used
+            self._added()
+    
+    def add_ip_request(self, ip_id):
+        with self._lock:
+            count, _ = self._ip_requests.get(ip_id, (0, None))
+            self._ip_requests[ip_id] = (count + 1, datetime.now())
+            self._added()
+    
+    def _restore(self, logs, key_tokens, ip_tokens, ip_requests):
+        """Yazılamayan kayıtları sonraki deneme için tampona geri koy"""
+        with self._lock:
+            self._logs = logs + self._logs
+            self._trim_logs()
+            for key_id, tokens in key_tokens.items():
+                self._key_tokens[key_id] = self._key_tokens.get(key_id, 0) + tokens
+            for ip_id, tokens in ip_tokens.items():
+                self._ip_tokens[ip_id] = self._ip_tokens.get(ip_id, 0) + tokens
+            for ip_id, (count, last_request_time) in ip_requests.items():
+                if ip_id in self._ip_requests:
+                    newer_count, newer_time = self._ip_requests[ip_id]
+                    self._ip_requests[ip_id] = (count + newer_count, newer_time)
+                else:
+                    self._ip_requests[ip_id] = (count, last_request_time)
+    
+    def flush(self):
+        """Tampondaki kayıtları tek bir işlemde veritabanına yaz"""
+        with self._flush_lock:
+            with self._lock:
+                logs, key_tokens, ip_tokens, ip_requests = self._logs, self._key_tokens, self._ip_tokens, self._ip_requests
+                self._logs, self._key_tokens, self._ip_tokens, self._ip_requests = [], {}, {}, {}
+                self._events = 0
+            
+            started = time.monotonic()
+            write_overall = (self._stopping or self._overall_written is None
+                             or started - self._overall_written >= self.OVERALL_ROLLUP_INTERVAL)
+            if not (logs or key_tokens or ip_tokens or ip_requests) and not (write_overall and self._overall_rollups):
+                return
+            
+            conn = None
+            cursor = None
+            overall = {}
+            try:
+                conn = acquire_db_connection()
+                cursor = conn.cursor()
+                
+                for i in range(0, len(logs), self.LOG_INSERT_CHUNK):
+                    insert_usage_logs(cursor, logs[i:i + self.LOG_INSERT_CHUNK], overall)
+                if write_overall:
+                    merge_usage_rollups(overall, self._overall_rollups)
+                    upsert_usage_rollups(cursor, overall)
+                if key_tokens:
+                    cursor.executemany(
+                        "UPDATE api_keys SET tokens_used = GREATEST(tokens_used + %s, 0) WHERE id = %s",
+                        [(tokens, key_id) for key_id, tokens in key_tokens.items()]
+                    )
+                if ip_tokens:
+                    cursor.executemany(
+                        "UPDATE ip_rate_limits SET tokens_used = GREATEST(tokens_used + %s, 0) WHERE id = %s",
+                        [(tokens, ip_id) for ip_id, tokens in ip_tokens.items()]
+                    )
+                if ip_requests:
+                    cursor.executemany(
+                        "UPDATE ip_rate_limits SET request_count = request_count + %s, last_request_time = %s WHERE id = %s",
+                        [(count, last_request_time, ip_id) for ip_id, (count, last_request_time) in ip_requests.items()]
+                    )
+                conn.commit()
+                
+                if write_overall:
+                    self._overall_rollups = {}
+                    self._overall_written = started
+                else:
+                    merge_usage_rollups(self._overall_rollups, overall)
+                
+                with self._lock:
+                    self._stats["flushes"] += 1
+                    self._stats["written_logs"] += len(logs)
+                    self._stats["last_flush_ms"] = round((time.monotonic() - started) * 1000, 2)
+                logger.debug(f"Kullanım kayıtları yazıldı: {len(logs)} log, {len(key_tokens)} anahtar, {len(ip_tokens) + len(ip_requests)} IP güncellemesi")
+            except Exception as e:
+                logger.error(f"Kullanım kayıtları toplu yazılırken hata: {e}")
+                if conn is not None:
+                    conn.rollback()
+                self._restore(logs, key_tokens, ip_tokens, ip_requests)
+                with self._lock:
+                    self._stats["failed_flushes"] += 1
+            finally:
+                if cursor is not None:
+                    cursor.close()
+                if conn is not None:
+                    conn.close()
+    
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "pending_logs": len(self._logs),
+                "pending_counters": len(self._key_tokens) + len(self._ip_tokens) + len(self._ip_requests)
+            }
+
+class UsageArchiveWriter:
+    """Arşivlenen log satırlarını parça parça sıkıştırılmış JSONL ya da Parquet dosyasına yaz"""
+    
+    def __init__(self, path, columns, archive_format="jsonl"):
+        self.path = path
+        self.columns = columns
+        self.archive_format = archive_format
+        # Dosya tamamlanana kadar .part uzantısıyla yazılır, yarım arşivler tamamlanmış sanılmasın
+        self._tmp_path = path + ".part"
+        self.rows = 0
+        
+        if archive_format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                logger.error("pyarrow yüklü değil, pip install pyarrow ile kurabilirsiniz.")
+                raise
+            self._pa = pa
+            self._schema = pa.schema([
+                ("id", pa.int64()), ("api_key_id", pa.int64()), ("request_ip", pa.string()),
+                ("endpoint", pa.string()), ("text_length", pa.int64()), ("tokens_used", pa.int64()),
+                ("is_successful", pa.bool_()), ("error_message", pa.string()), ("created_at", pa.timestamp("us"))
+            ])
+            self._file = pq.ParquetWriter(self._tmp_path, self._schema, compression="zstd")
+        else:
+            self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+    
+    def write(self, rows):
+        """Bir parçayı yaz; her parça ayrı bir Parquet satır grubu olur"""
+        if self.archive_format == "parquet":
+            columns = list(zip(*rows))
+            arrays = {name: list(values) for name, values in zip(self.columns, columns)}
+            arrays["is_successful"] = [None if value is None else bool(value) for value in arrays["is_successful"]]
+            self._file.write_table(self._pa.Table.from_pydict(arrays, schema=self._schema))
+        else:
+            for row in rows:
+                record = dict(zip(self.columns, row))
+                record["is_successful"] = None if record["is_successful"] is None else bool(record["is_successful"])
+                if record["created_at"] is not None:
+                    record["created_at"] = record["created_at"].isoformat()
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.rows += len(rows)
+    
+    def close(self):
+        """Dosyayı kapat, diske yazıldığından emin ol ve kalıcı adına taşı"""
+        self._file.close()
+        with open(self._tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+
+class UsageRetentionJob:
+    """
+    api_usage_logs için saklama, sıkıştırma ve arşivleme işi.
+    
+    retention_days günden eski ham log satırları birincil anahtar sırasıyla batch_size'lık
+    parçalar halinde okunup arşiv dosyasına yazılır; bellek kullanımı parça boyutuyla sınırlıdır.
+    Dosya kapatılıp diske yazıldıktan sonra aynı satırlar küçük DELETE işlemleriyle silinir,
+    tablo uzun süre kilitlenmez. Satırların toplamları usage_rollup_* tablolarında zaten
+    bulunduğundan özetler silmeden etkilenmez; saatlik özetler ise HOURLY_ROLLUP_RETENTION_DAYS
+    günden sonra yalnızca günlük özetlerde tutulur. Birden fazla süreç ya da düğüm aynı anda
+    çalışmasın diye MySQL GET_LOCK kullanılır.
+    """
+    LOCK_NAME = "temizdil_usage_retention"
+    HOURLY_ROLLUP_RETENTION_DAYS = 35
+    COLUMNS = ("id", "api_key_id", "request_ip", "endpoint", "text_length", "tokens_used", "is_successful", "error_message", "created_at")
+    
+    def __init__(self, retention_days=90, archive_dir="./archive", archive_format="jsonl",
+                 batch_size=1000, batch_pause_ms=50, interval_hours=24):
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause_ms / 1000.0
+        self.interval = interval_hours * 3600
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._stats = {"runs": 0, "skipped_runs": 0, "failed_runs": 0, "archived_rows": 0, "deleted_rows": 0,
+                       "pruned_hourly_rollups": 0, "last_run_at": None, "last_run_seconds": 0.0, "last_archive": None}
+        
+        if archive_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logger.error("pyarrow yüklü değil, pip install pyarrow ile kurabilirsiniz.")
+                raise
+    
+    def start(self):
+        """İşi interval_hours aralıklarla çalıştıran iş parçacığını başlat"""
+        self._thread = threading.Thread(target=self._run, name="usage-retention", daemon=True)
+        self._thread.start()
+        logger.info(f"Log saklama işi başlatıldı (saklama={self.retention_days} gün, aralık={self.interval / 3600:g} saat)")
+        return self
+    
+    def stop(self):
+        """Çalışan parçayı bitirip iş parçacığını durdur"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+    
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Log saklama işi çalışırken hata: {e}")
+            self._wakeup.wait(self.interval)
+    
+    def run_once(self):
+        """Eski logları arşivle ve sil; başka bir süreç çalışıyorsa hiçbir şey yapmadan dön"""
+        started = time.monotonic()
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                logger.info("Log saklama işi başka bir süreçte çalışıyor, atlandı")
+                with self._lock:
+                    self._stats["skipped_runs"] += 1
+                return 0
+            
+            try:
+                archive_path, last_id = self._archive(conn, cursor, cutoff)
+                deleted = self._delete_archived(conn, cursor, cutoff, last_id) if last_id is not None else 0
+                pruned = self._prune_hourly_rollups(conn, cursor)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+            
+            with self._lock:
+                self._stats["runs"] += 1
+                self._stats["deleted_rows"] += deleted
+                self._stats["pruned_hourly_rollups"] += pruned
+                self._stats["last_run_at"] = datetime.now().isoformat(timespec="seconds")
+                self._stats["last_run_seconds"] = round(time.monotonic() - started, 2)
+                if archive_path is not None:
+                    self._stats["last_archive"] = archive_path
+            logger.info(f"Log saklama işi tamamlandı: {deleted} log arşivlendi ve silindi, {pruned} saatlik özet satırı temizlendi")
+            return deleted
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self._stats["failed_runs"] += 1
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _archive(self, conn, cursor, cutoff):
+        """Kesim tarihinden eski satırları id sırasıyla parça parça arşiv dosyasına yaz"""
+        # Kesim anından sonraki ilk satırın id'si; tarama yeni satırlara kadar uzamasın
+        cursor.execute("SELECT id FROM api_usage_logs WHERE created_at >= %s ORDER BY created_at LIMIT 1", (cutoff,))
+        row = cursor.fetchone()
+        upper_id = row[0] if row else None
+        
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM api_usage_logs WHERE id > %s AND created_at < %s"
+        if upper_id is not None:
+            query += " AND id < %s"
+        query += " ORDER BY id LIMIT %s"
+        
+        writer = None
+        last_id = None
+        try:
+            while not self._stopping:
+                params = [last_id or 0, cutoff] + ([upper_id] if upper_id is not None else []) + [self.batch_size]
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                conn.commit()
+                if not rows:
+                    break
+                
+                if writer is None:
+                    os.makedirs(self.archive_dir, exist_ok=True)
+                    extension = "parquet" if self.archive_format == "parquet" else "jsonl.gz"
+                    path = os.path.join(self.archive_dir, f"api_usage_logs_{datetime.now():%Y%m%dT%H%M%S}_{os.getpid()}.{extension}")
+                    writer = UsageArchiveWriter(path, self.COLUMNS, self.archive_format)
+                writer.write(rows)
+                last_id = rows[-1][0]
+                
+                with self._lock:
+                    self._stats["archived_rows"] += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+        finally:
+            if writer is not None:
+                writer.close()
+                logger.info(f"{writer.rows} log satırı arşivlendi: {writer.path}")
+        
+        return (writer.path if writer is not None else None), last_id
+    
+    def _delete_archived(self, conn, cursor, cutoff, last_id):
+        """Arşive yazılmış satırları kısa işlemlerle sil (yeni eklenen satırların id'si last_id'den büyüktür)"""
+        deleted = 0
+        while True:
+            cursor.execute(
+                "DELETE FROM api_usage_logs WHERE id <= %s AND created_at < %s ORDER BY id LIMIT %s",
+                (last_id, cutoff, self.batch_size)
+            )
+            count = cursor.rowcount
+            conn.commit()
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+            if self.batch_pause > 0:
+                time.sleep(self.batch_pause)
+    
+    def _prune_hourly_rollups(self, conn, cursor):
+        """Günlük özetlerde de bulunan eski saatlik özet satırlarını sil"""
+        hourly_cutoff = datetime.now() - timedelta(days=self.HOURLY_ROLLUP_RETENTION_DAYS)
+        pruned = 0
+        while True:
+            cursor.execute(
+                "DELETE FROM usage_rollup_hourly WHERE bucket_start < %s ORDER BY bucket_start LIMIT %s",
+                (hourly_cutoff, self.batch_size)
+            )
+            count = cursor.rowcount
+            conn.commit()
+            pruned += count
+            if count < self.batch_size:
+                return pruned
+            if self.batch_pause > 0:
+                time.sleep(self.batch_pause)
+    
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "retention_days": self.retention_days, "archive_format": self.archive_format}
+
+class QuotaResetJob:
+    """
+    Aylık kota sıfırlamasını istek yolundan alıp toplu yapan zamanlanmış iş.
+    
+    30 günlük dönemi dolmuş api_keys (auto_reset açık) ve ip_rate_limits satırları
+    batch_size'lık gruplar halinde sıfırlanır. Dönem koşulu UPDATE içinde yeniden kontrol
+    edildiği için iş idempotenttir. Birden fazla süreç ya da düğüm çalıştığında
+    scheduler_locks tablosundaki süreli kilit satırını yalnızca biri alır; sahibi çökerse
+    kilit lock_ttl_seconds sonunda kendiliğinden boşa çıkar.
+    """
+    LOCK_NAME = "quota_reset"
+    RESET_PERIOD_DAYS = 30
+    # Tablo başına sıfırlama zamanı gelmiş satırların koşulu (%s: dönem başlangıcı)
+    TARGETS = {
+        "api_keys": "auto_reset = TRUE AND (last_reset_date <= %s OR (last_reset_date IS NULL AND created_at <= %s))",
+        "ip_rate_limits": "last_reset_date <= %s"
+    }
+    
+    def __init__(self, interval_seconds=300, batch_size=1000, lock_ttl_seconds=300):
+        self.interval = interval_seconds
+        self.batch_size = batch_size
+        self.lock_ttl = lock_ttl_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._stats = {"runs": 0, "skipped_runs": 0, "failed_runs": 0, "reset_api_keys": 0, "reset_ips": 0,
+                       "last_run_at": None, "last_run_seconds": 0.0}
+    
+    def start(self):
+        """Sıfırlamayı interval_seconds aralıklarla çalıştıran iş parçacığını başlat"""
+        self._thread = threading.Thread(target=self._run, name="quota-reset", daemon=True)
+        self._thread.start()
+        logger.info(f"Kota sıfırlama işi başlatıldı (aralık={self.interval:g} sn, batch={self.batch_size})")
+        return self
+    
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+    
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Kota sıfırlama işi çalışırken hata: {e}")
+            self._wakeup.wait(self.interval)
+    
+    def _acquire_lock(self, conn, cursor):
+        """Kilit satırını al ya da süresini uzat; başka bir sahipte ve süresi dolmamışsa False"""
+        # Yeni kilit satırı süresi geçmiş olarak eklenir ki aynı anda yapılan UPDATE onu alabilsin
+        cursor.execute(
+            "INSERT IGNORE INTO scheduler_locks (name, owner, locked_until) VALUES (%s, '', %s)",
+            (self.LOCK_NAME, datetime(1970, 1, 2))
+        )
+        cursor.execute(
+            "UPDATE scheduler_locks SET owner = %s, locked_until = DATE_ADD(NOW(6), INTERVAL %s SECOND) "
+            "WHERE name = %s AND (locked_until < NOW(6) OR owner = %s)",
+            (self.owner, self.lock_ttl, self.LOCK_NAME, self.owner)
+        )
+        acquired = cursor.rowcount == 1
+        conn.commit()
+        return acquired
+    
+    def _release_lock(self, conn, cursor):
+        cursor.execute(
+            "UPDATE scheduler_locks SET locked_until = NOW(6) WHERE name = %s AND owner = %s",
+            (self.LOCK_NAME, self.owner)
+        )
+        conn.commit()
+    
+    def run_once(self):
+        """Dönemi dolmuş tüm satırları sıfırla; kilit başka bir süreçteyse hiçbir şey yapmadan dön"""
+        started = time.monotonic()
+        now = datetime.now()
+        period_start = now - timedelta(days=self.RESET_PERIOD_DAYS)
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if not self._acquire_lock(conn, cursor):
+                with self._lock:
+                    self._stats["skipped_runs"] += 1
+                return 0
+            
+            try:
+                reset_keys = self._reset_table(conn, cursor, "api_keys", now, period_start)
+                reset_ips = self._reset_table(conn, cursor, "ip_rate_limits", now, period_start)
+            finally:
+                self._release_lock(conn, cursor)
+            
+            with self._lock:
+                self._stats["runs"] += 1
+                self._stats["reset_api_keys"] += reset_keys
+                self._stats["reset_ips"] += reset_ips
+                self._stats["last_run_at"] = now.isoformat(timespec="seconds")
+                self._stats["last_run_seconds"] = round(time.monotonic() - started, 2)
+            if reset_keys or reset_ips:
+                logger.info(f"30 günlük dönemi dolan kotalar sıfırlandı: {reset_keys} API anahtarı, {reset_ips} IP")
+            return reset_keys + reset_ips
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self._stats["failed_runs"] += 1
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _reset_table(self, conn, cursor, table, now, period_start):
+        """Tablodaki dönemi dolmuş satırları id sırasıyla küçük işlemler halinde sıfırla"""
+        condition = self.TARGETS[table]
+        params = [period_start] * condition.count("%s")
+        reset = 0
+        
+        while not self._stopping:
+            cursor.execute(f"SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT %s", params + [self.batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"UPDATE {table} SET tokens_used = 0, leased_tokens = 0, last_reset_date = %s WHERE id IN ({placeholders}) AND {condition}",
+                [now] + ids + params
+            )
+            reset += cursor.rowcount
+            
+            # Diğer süreçlerin önbellekleri de sıfırlanan anahtarları bıraksın
+            if table == "api_keys":
+                publish_api_key_invalidations(cursor, [(key_id, None) for key_id in ids])
+            conn.commit()
+            
+            if table == "api_keys" and API_KEY_CACHE is not None:
+                for key_id in ids:
+                    API_KEY_CACHE.invalidate(key_id=key_id)
+            
+            # Uzun süren çalışmada kilidin süresini uzat; kaybedildiyse dur
+            if len(ids) < self.batch_size or not self._acquire_lock(conn, cursor):
+                break
+        return reset
+    
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+class ApiKeyCache:
+    """
+    API anahtarı kayıtlarının süreç içi önbelleği.
+    
+    Kayıtlar kısa bir süre (TTL) tutulur. Veritabanında bulunmayan anahtarlar da aynı süreyle
+    tutulur; böylece geçersiz anahtarla gelen istekler her seferinde veritabanına gitmez.
+    Admin işlemleri kaydı yerelde hemen geçersiz kılar ve api_key_invalidations tablosuna bir
+    olay yazar; her süreç bu tabloyu sync_interval aralıklarla okuyup ilgili kayıtları bırakır.
+    Böylece diğer işçilerde ve düğümlerde eski kayıt en fazla sync_interval kadar (tablo
+    okunamazsa en fazla TTL kadar) kullanılır.
+    """
+    def __init__(self, ttl_seconds=10, max_entries=10000, sync_interval=1.0, event_retention_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self.event_retention_seconds = event_retention_seconds
+        self._entries = OrderedDict()
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._last_event_id = None
+        self._last_prune = 0.0
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "remote_invalidations": 0, "sync_errors": 0}
+    
+    def start(self):
+        """Olay başlangıç noktasını al ve geçersiz kılma olaylarını izleyen iş parçacığını başlat"""
+        self.sync()
+        self._thread = threading.Thread(target=self._run, name="api-key-cache-sync", daemon=True)
+        self._thread.start()
+        logger.info(f"API anahtarı önbelleği başlatıldı (TTL={self.ttl_seconds} sn, senkronizasyon={self.sync_interval} sn)")
+        return self
+    
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+    
+    def _remove(self, api_key):
+        record, _ = self._entries.pop(api_key)
+        if record is not None and self._ids.get(record['id']) == api_key:
+            del self._ids[record['id']]
+    
+    def get(self, api_key):
+        """(önbellekte_mi, kayıt) döndürür; kayıt None ise anahtar veritabanında yoktur"""
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(api_key)
+                self._stats["misses"] += 1
+                return False, None
+            
+            self._entries.move_to_end(api_key)
+            self._stats["hits"] += 1
+            record = entry[0]
+            return True, dict(record) if record is not None else None
+    
+    def set(self, api_key, record):
+        """Veritabanından okunan kaydı (ya da bulunamadığını) önbelleğe al"""
+        with self._lock:
+            if api_key in self._entries:
+                self._remove(api_key)
+            self._entries[api_key] = (dict(record) if record is not None else None, time.monotonic() + self.ttl_seconds)
+            if record is not None:
+                self._ids[record['id']] = api_key
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def add_tokens(self, key_id, tokens_used):
+        """Önbellekteki token kullanımını veritabanındaki artışla birlikte güncelle"""
+        with self._lock:
+            api_key = self._ids.get(key_id)
+            if api_key is not None:
+                self._entries[api_key][0]['tokens_used'] += tokens_used
+    
+    def invalidate(self, api_key=None, key_id=None):
+        """Anahtar değeri ya da kimliğiyle verilen kaydı önbellekten çıkar"""
+        with self._lock:
+            if api_key is None and key_id is not None:
+                api_key = self._ids.get(key_id)
+            if api_key is not None and api_key in self._entries:
+                self._remove(api_key)
+                self._stats["invalidations"] += 1
+    
+    def clear(self):
+        """Tüm kayıtları bırak"""
+        with self._lock:
+            self._entries.clear()
+            self._ids.clear()
+            self._stats["invalidations"] += 1
+    
+    def sync(self):
+        """Diğer süreçlerin yazdığı geçersiz kılma olaylarını uygula, eski olayları ara ara sil"""
+        conn = None
+        cursor = None
+        try:
+            conn = acquire_db_connection()
+            cursor = conn.cursor()
+            
+            # İlk okumada yalnızca başlangıç noktası alınır; önbellek o anda boştur
+            if self._last_event_id is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM api_key_invalidations")
+                self._last_event_id = cursor.fetchone()[0]
+                conn.commit()
+                return
+            
+            while True:
+                cursor.execute(
+                    "SELECT id, api_key_id, api_key FROM api_key_invalidations WHERE id > %s ORDER BY id LIMIT 1000",
+                    (self._last_event_id,)
+                )
+                events = cursor.fetchall()
+                for event_id, key_id, api_key in events:
+                    if key_id is None and api_key is None:
+                        self.clear()
+                    else:
+                        self.invalidate(api_key=api_key, key_id=key_id)
+                    self._last_event_id = event_id
+                with self._lock:
+                    self._stats["remote_invalidations"] += len(events)
+                if len(events) < 1000:
+                    break
+            
+            now = time.monotonic()
+            if now - self._last_prune >= self.event_retention_seconds / 4:
+                cursor.execute(
+                    "DELETE FROM api_key_invalidations WHERE created_at < %s",
+                    (datetime.now() - timedelta(seconds=self.event_retention_seconds),)
+                )
+                self._last_prune = now
+            conn.commit()
+        except Exception as e:
+            logger.error(f"API anahtarı önbelleği senkronize edilirken hata: {e}")
+            with self._lock:
+                self._stats["sync_errors"] += 1
+            if conn is not None:
+                conn.rollback()
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+    
+    def _run(self):
+        while not self._stopping.wait(self.sync_interval):
+            self.sync()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+def publish_api_key_invalidations(cursor, events):
+    """
+    (api_key_id, api_key) olaylarını diğer süreçlerin önbellekleri için yaz.
+    
+    Olaylar çağıranın işlemiyle birlikte commit edilir; (None, None) tüm önbellekleri temizler.
+    """
+    cursor.executemany("INSERT INTO api_key_invalidations (api_key_id, api_key) VALUES (%s, %s)", events)
+
 def get_api_key_info(api_key):
-    """API key bilgilerini veritabanından al"""
-    conn = DB_POOL.get_connection()
+    """API key bilgilerini önbellekten ya da veritabanından al"""
+    if API_KEY_CACHE is not None:
+        cached, key_info = API_KEY_CACHE.get(api_key)
+        if cached:
+            return key_info
+    
+    started = time.perf_counter()
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -221,25 +1809,15 @@ def get_api_key_info(api_key):
         )
         key_info = cursor.fetchone()
         
-        # Key varsa ve otomatik sıfırlama aktifse, son sıfırlama tarihinden 30 gün geçmiş mi kontrol et
-        if key_info and key_info.get('auto_reset', True):
-            current_datetime = datetime.now()
-            
-            # Son sıfırlama tarihi yoksa, oluşturulma tarihini kullan
-            reference_datetime = key_info['last_reset_date']
-            if reference_datetime is None and key_info['created_at']:
-                reference_datetime = key_info['created_at']
-            
-            # 30 gün geçmişse tokenleri sıfırla
-            if reference_datetime and (current_datetime - reference_datetime).days >= 30:
-                cursor.execute(
-                    "UPDATE api_keys SET tokens_used = 0, last_reset_date = %s WHERE id = %s",
-                    (current_datetime, key_info['id'])
-                )
-                conn.commit()
-                key_info['tokens_used'] = 0
-                key_info['last_reset_date'] = current_datetime
-                logger.info(f"API key {key_info['id']} için tokenler 30 günlük periyod sonunda sıfırlandı. Sıfırlama zamanı: {current_datetime}")
+        # İzin listesi her istekte değil, kayıt okunduğunda bir kez derlenir
+        if key_info:
+            key_info['ip_allowlist'] = IpAllowlist(key_info['unlimited_ips'])
+            if key_info['ip_allowlist'].invalid_entries:
+                logger.warning(f"API key {key_info['id']} için geçersiz unlimited_ips girdileri yok sayıldı: {key_info['ip_allowlist'].invalid_entries}")
+        
+        # 30 günlük kota sıfırlaması burada değil, QuotaResetJob ile toplu yapılır
+        if API_KEY_CACHE is not None:
+            API_KEY_CACHE.set(api_key, key_info)
         
         return key_info
     except Exception as e:
@@ -248,15 +1826,24 @@ def get_api_key_info(api_key):
     finally:
         cursor.close()
         conn.close()
+        observe_stage("db_lookup", started)
 
 def update_token_usage(api_key_id, tokens_used):
     """Kullanılan token sayısını güncelle"""
-    conn = DB_POOL.get_connection()
+    if API_KEY_CACHE is not None:
+        API_KEY_CACHE.add_tokens(api_key_id, tokens_used)
+    
+    # Write-behind açıksa artış tampona eklenir ve arka planda toplu yazılır
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.add_key_tokens(api_key_id, tokens_used)
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute(
-            "UPDATE api_keys SET tokens_used = tokens_used + %s WHERE id = %s",
+            "UPDATE api_keys SET tokens_used = GREATEST(tokens_used + %s, 0) WHERE id = %s",
             (tokens_used, api_key_id)
         )
         conn.commit()
@@ -270,14 +1857,15 @@ def update_token_usage(api_key_id, tokens_used):
 
 def log_api_usage(api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message=None):
     """API kullanımını logla"""
-    conn = DB_POOL.get_connection()
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.add_log(api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message)
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute(
-            "INSERT INTO api_usage_logs (api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            (api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message)
-        )
+        insert_usage_logs(cursor, [(api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message, datetime.now())])
         conn.commit()
     except Exception as e:
         logger.error(f"API kullanımı loglanırken hata: {e}")
@@ -290,32 +1878,89 @@ def calculate_tokens(text):
     """Metin için gereken token sayısını hesapla (her 4 karakter için 1 token)"""
     return math.ceil(len(text) / 4)
 
+class IpAllowlist:
+    """
+    unlimited_ips değerinden bir kez derlenen IP izin listesi.
+    
+    Tek IP'ler ve CIDR blokları IPv4 ve IPv6 için ayrı ayrı tamsayı aralıklarına çevrilir,
+    sıralanır ve çakışan/bitişik aralıklar birleştirilir. Böylece bir IP'nin listede olup
+    olmadığı bisect ile O(log n) sürede bulunur. Derlenmiş liste anahtar kaydıyla birlikte
+    önbellekte tutulur; geçersiz girdiler invalid_entries'te toplanır ve aramada yok sayılır.
+    """
+    def __init__(self, unlimited_ips):
+        self.entries = []
+        self.invalid_entries = []
+        ranges = {4: [], 6: []}
+        
+        for entry in (unlimited_ips or "").split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                self.invalid_entries.append(entry)
+                continue
+            self.entries.append(str(network) if '/' in entry else str(network.network_address))
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        
+        self._starts = {}
+        self._ends = {}
+        for version, intervals in ranges.items():
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+    
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+    
+    def normalized(self):
+        """Geçerli girdileri veritabanına yazılacak biçimde birleştir"""
+        return ", ".join(self.entries) if self.entries else None
+    
+    def contains(self, client_ip):
+        """IP adresi listedeki bir aralığa düşüyor mu"""
+        if not len(self):
+            return False
+        try:
+            address = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return False
+        
+        value = int(address)
+        starts = self._starts[address.version]
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= self._ends[address.version][index]
+
 def is_ip_allowed(client_ip, unlimited_ips):
     """IP adresinin sınırsız listesinde olup olmadığını kontrol et"""
-    if not unlimited_ips:
-        return False
-    
-    ip_list = [ip.strip() for ip in unlimited_ips.split(',')]
+    if isinstance(unlimited_ips, IpAllowlist):
+        return unlimited_ips.contains(client_ip)
+    return IpAllowlist(unlimited_ips).contains(client_ip)
+
+def parse_unlimited_ips(value):
+    """Admin isteğindeki unlimited_ips değerini doğrula; (normalleştirilmiş değer, hata mesajı) döndürür"""
+    if value is None:
+        return None, None
+    if isinstance(value, list):
+        value = ",".join(str(item) for item in value)
+    if not isinstance(value, str):
+        return None, "unlimited_ips virgülle ayrılmış bir metin ya da liste olmalıdır."
     
-    try:
-        client_ip_obj = ipaddress.ip_address(client_ip)
-        
-        for ip_range in ip_list:
-            if '/' in ip_range:  # CIDR notasyonu
-                if client_ip_obj in ipaddress.ip_network(ip_range, strict=False):
-                    return True
-            else:  # Tek IP
-                if client_ip_obj == ipaddress.ip_address(ip_range):
-                    return True
-        
-        return False
-    except ValueError:
-        logger.error(f"Geçersiz IP adresi formatı: {client_ip} veya {unlimited_ips}")
-        return False
+    allowlist = IpAllowlist(value)
+    if allowlist.invalid_entries:
+        return None, f"Geçersiz IP adresi veya CIDR bloğu: {', '.join(allowlist.invalid_entries)}"
+    return allowlist.normalized(), None
 
 def get_or_create_ip_info(ip_address):
     """IP adresi için kullanım bilgilerini al veya oluştur"""
-    conn = DB_POOL.get_connection()
+    started = time.perf_counter()
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -337,7 +1982,11 @@ def get_or_create_ip_info(ip_address):
                 """,
                 (ip_address, 10000, 0, 0, current_datetime)
             )
-            conn.commit()
+            # Yeni satırın kilidi istek sonuna kadar tutulmasın diye hemen commit edilir
+            if isinstance(conn, RequestConnection):
+                conn.commit_now()
+            else:
+                conn.commit()
             
             cursor.execute(
                 "SELECT * FROM ip_rate_limits WHERE ip_address = %s",
@@ -345,22 +1994,7 @@ def get_or_create_ip_info(ip_address):
             )
             ip_info = cursor.fetchone()
         
-        # Son sıfırlama tarihinden 30 gün geçmiş mi kontrol et
-        if ip_info and ip_info['last_reset_date'] is not None:
-            current_datetime = datetime.now()
-            reference_datetime = ip_info['last_reset_date']
-            
-            # 30 gün geçmişse tokenleri sıfırla
-            if (current_datetime - reference_datetime).days >= 30:
-                cursor.execute(
-                    "UPDATE ip_rate_limits SET tokens_used = 0, last_reset_date = %s WHERE id = %s",
-                    (current_datetime, ip_info['id'])
-                )
-                conn.commit()
-                ip_info['tokens_used'] = 0
-                ip_info['last_reset_date'] = current_datetime
-                logger.info(f"IP {ip_address} için tokenler 30 günlük periyod sonunda sıfırlandı. Sıfırlama zamanı: {current_datetime}")
-        
+        # 30 günlük kota sıfırlaması burada değil, QuotaResetJob ile toplu yapılır
         return ip_info
     except Exception as e:
         logger.error(f"IP bilgisi alınırken hata: {e}")
@@ -369,15 +2003,20 @@ def get_or_create_ip_info(ip_address):
     finally:
         cursor.close()
         conn.close()
+        observe_stage("db_lookup", started)
 
 def update_ip_token_usage(ip_id, tokens_used):
     """IP için kullanılan token sayısını güncelle"""
-    conn = DB_POOL.get_connection()
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.add_ip_tokens(ip_id, tokens_used)
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute(
-            "UPDATE ip_rate_limits SET tokens_used = tokens_used + %s WHERE id = %s",
+            "UPDATE ip_rate_limits SET tokens_used = GREATEST(tokens_used + %s, 0) WHERE id = %s",
             (tokens_used, ip_id)
         )
         conn.commit()
@@ -391,7 +2030,15 @@ def update_ip_token_usage(ip_id, tokens_used):
 
 def update_ip_request_count(ip_id):
     """IP için istek sayısını güncelle ve son istek zamanını kaydet"""
-    conn = DB_POOL.get_connection()
+    # Bellekteki sınırlayıcı istekleri kendisi sayar ve tabloya periyodik olarak yazar
+    if IP_RATE_LIMITER is not None:
+        return
+    
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.add_ip_request(ip_id)
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -410,7 +2057,7 @@ def update_ip_request_count(ip_id):
 
 def reset_ip_request_count(ip_id):
     """IP için istek sayısını sıfırla (15 dakikalık periyod geçtikten sonra)"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -427,6 +2074,173 @@ def reset_ip_request_count(ip_id):
         cursor.close()
         conn.close()
 
+class SlidingWindowRateLimiter:
+    """
+    İstemci IP'si başına kayan pencereli istek sınırlayıcısı (süreç içi).
+    
+    Her IP için penceredeki istek zamanları (en fazla limit kadar) bellekte tutulur; sınırı
+    aşan istekler veritabanına gidilmeden reddedilir ve kontrol ile sayım tek kilit altında
+    yapıldığı için eşzamanlı istekler sınırı aşamaz. İzlenen IP sayısı max_tracked ile
+    sınırlıdır, en uzun süredir istek yapmayan IP'ler bırakılır. Yeni istekler admin
+    görünümleri için sync_interval aralıklarla ip_rate_limits tablosuna artış olarak yazılır;
+    açılışta son penceredeki sayaçlar tablodan yüklenir, böylece yeniden başlatma pencereyi
+    sıfırlamaz. Pencere süreçler arasında paylaşılmadığından yalnızca tek süreçli kurulumlar
+    içindir (pre-fork modunda veritabanı tabanlı kontrol kullanılır).
+    """
+    def __init__(self, limit=15, window_seconds=900, max_tracked=100000, sync_interval=10):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_tracked = max_tracked
+        self.sync_interval = sync_interval
+        self._hits = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {"allowed": 0, "rejected": 0, "evicted": 0, "loaded": 0}
+    
+    def start(self):
+        """Son penceredeki sayaçları yükle ve veritabanı senkronizasyon iş parçacığını başlat"""
+        self.load()
+        self._thread = threading.Thread(target=self._run, name="ip-rate-limiter-sync", daemon=True)
+        self._thread.start()
+        logger.info(f"IP hız sınırlayıcı başlatıldı ({self.window_seconds} saniyede {self.limit} istek, senkronizasyon={self.sync_interval} sn)")
+        return self
+    
+    def stop(self):
+        """Senkronizasyonu durdur ve son sayaçları yaz"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.sync()
+    
+    def _prune(self, hits, now):
+        while hits and hits[0] <= now - self.window_seconds:
+            hits.popleft()
+    
+    def load(self):
+        """ip_rate_limits tablosundan pencere içindeki sayaçları yükle (istekler son istek zamanına sayılır)"""
+        conn = None
+        cursor = None
+        try:
+            conn = acquire_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT ip_address, request_count, last_request_time FROM ip_rate_limits "
+                "WHERE last_request_time > %s AND request_count > 0 ORDER BY last_request_time DESC LIMIT %s",
+                (datetime.fromtimestamp(time.time() - self.window_seconds), self.max_tracked)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+        except Exception as e:
+            logger.error(f"IP istek sayaçları yüklenirken hata: {e}")
+            return
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+        
+        # En eski IP'ler LRU sırasının başına gelsin diye ters sırada eklenir
+        with self._lock:
+            for ip_address, request_count, last_request_time in reversed(rows):
+                if ip_address not in self._hits:
+                    self._hits[ip_address] = deque([last_request_time.timestamp()] * min(request_count, self.limit))
+            self._stats["loaded"] += len(rows)
+    
+    def acquire(self, ip_address, consume=True):
+        """İstek sınır içindeyse True döndürür; consume ise isteği pencereye sayar"""
+        now = time.time()
+        with self._lock:
+            hits = self._hits.get(ip_address)
+            if hits is not None:
+                self._prune(hits, now)
+                if len(hits) >= self.limit:
+                    self._stats["rejected"] += 1
+                    return False
+            
+            if not consume:
+                return True
+            
+            if hits is None:
+                hits = self._hits[ip_address] = deque()
+                while len(self._hits) > self.max_tracked:
+                    self._hits.popitem(last=False)
+                    self._stats["evicted"] += 1
+            
+            hits.append(now)
+            self._hits.move_to_end(ip_address)
+            count, _ = self._pending.get(ip_address, (0, None))
+            self._pending[ip_address] = (count + 1, now)
+            self._stats["allowed"] += 1
+            return True
+    
+    def reset(self, ip_address):
+        """IP'nin penceresini temizle (admin sıfırlaması)"""
+        with self._lock:
+            self._hits.pop(ip_address, None)
+            self._pending.pop(ip_address, None)
+    
+    def sync(self):
+        """Son senkronizasyondan beri gelen istekleri ip_rate_limits tablosuna ekle, boşta kalan IP'leri bırak"""
+        now = time.time()
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            
+            # LRU başındaki, penceresinde istek kalmamış IP'ler artık izlenmez
+            while self._hits:
+                ip_address, hits = next(iter(self._hits.items()))
+                if hits and hits[-1] > now - self.window_seconds:
+                    break
+                self._hits.popitem(last=False)
+        
+        if not pending:
+            return
+        
+        # Tablodaki son istek pencereden eskiyse sayaç yeni isteklerle yeniden başlar; artış olarak
+        # yazıldığından başka süreçlerin (veritabanı kipindeki düğümlerin) sayımları ezilmez
+        window_start = datetime.fromtimestamp(now - self.window_seconds)
+        rows = []
+        for ip_address, (count, last_hit) in pending.items():
+            last_request_time = datetime.fromtimestamp(last_hit)
+            rows.append((window_start, count, count, last_request_time, last_request_time, ip_address))
+        
+        conn = None
+        cursor = None
+        try:
+            conn = acquire_db_connection()
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE ip_rate_limits SET "
+                "request_count = CASE WHEN last_request_time IS NULL OR last_request_time <= %s THEN %s ELSE request_count + %s END, "
+                "last_request_time = GREATEST(COALESCE(last_request_time, %s), %s) "
+                "WHERE ip_address = %s",
+                rows
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"IP istek sayaçları senkronize edilirken hata: {e}")
+            if conn is not None:
+                conn.rollback()
+            with self._lock:
+                for ip_address, (count, last_hit) in pending.items():
+                    newer_count, newer_hit = self._pending.get(ip_address, (0, last_hit))
+                    self._pending[ip_address] = (count + newer_count, max(last_hit, newer_hit))
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+    
+    def _run(self):
+        while not self._stopping.wait(self.sync_interval):
+            self.sync()
+    
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "tracked_ips": len(self._hits), "limit": self.limit, "window_seconds": self.window_seconds}
+
 def can_ip_make_request(ip_info):
     """IP adresinin 15 dakikada 15 istekten fazla yapmadığını kontrol et"""
     if not ip_info or not ip_info['last_request_time']:
@@ -446,14 +2260,15 @@ def can_ip_make_request(ip_info):
 
 def log_ip_request(ip_address, endpoint, text_length, tokens_used, is_successful, error_message=None):
     """API key olmadan yapılan kullanımı logla"""
-    conn = DB_POOL.get_connection()
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.add_log(None, ip_address, endpoint, text_length, tokens_used, is_successful, error_message)
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute(
-            "INSERT INTO api_usage_logs (api_key_id, request_ip, endpoint, text_length, tokens_used, is_successful, error_message) VALUES (NULL, %s, %s, %s, %s, %s, %s)",
-            (ip_address, endpoint, text_length, tokens_used, is_successful, error_message)
-        )
+        insert_usage_logs(cursor, [(None, ip_address, endpoint, text_length, tokens_used, is_successful, error_message, datetime.now())])
         conn.commit()
     except Exception as e:
         logger.error(f"IP kullanımı loglanırken hata: {e}")
@@ -462,6 +2277,306 @@ def log_ip_request(ip_address, endpoint, text_length, tokens_used, is_successful
         cursor.close()
         conn.close()
 
+class QuotaLeaseManager:
+    """
+    API anahtarı ve IP kotalarından düğüm başına kiralanan token dilimleri.
+    
+    Düğüm, kalan aylık kotanın fraction kadarını (en az isteğin ihtiyacı kadar) tek bir
+    işlemde veritabanında kullanılmış olarak işaretler ve bu dilimi bellekte harcar. Dilim
+    low_watermark oranının altına düştüğünde arka planda yenilenir; kullanılmayan kısım
+    kapanışta, kota dönemi sıfırlanmadıysa veritabanına iade edilir. Böylece sıcak
+    api_keys/ip_rate_limits satırlarına istek başına değil, dilim başına yazılır.
+    
+    Kiralanıp henüz harcanmamış tokenler satırın leased_tokens sütununda tutulur; dilimden
+    harcananlar bu sütundan her yenilemede ve iadede düşülür. Veritabanı G/Ç'si sırasında
+    dilimin kilidi tutulmaz, aynı dilimin yenilemeleri grant_lock ile sıraya girer.
+    """
+    TABLES = {"key": "api_keys", "ip": "ip_rate_limits"}
+    
+    def __init__(self, fraction=0.05, low_watermark=0.2):
+        self.fraction = fraction
+        self.low_watermark = low_watermark
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._renewals = queue.Queue()
+        self._thread = None
+        self._stats = {"grants": 0, "granted_tokens": 0, "spent_tokens": 0, "denied": 0, "returned_tokens": 0,
+                       "failed_renewals": 0}
+    
+    def start(self):
+        """Arka plan yenileme iş parçacığını başlat"""
+        self._thread = threading.Thread(target=self._run, name="quota-lease-renewal", daemon=True)
+        self._thread.start()
+        logger.info(f"Kota kiralama açık (dilim=%{self.fraction * 100:g}, yenileme eşiği=%{self.low_watermark * 100:g})")
+        return self
+    
+    def _lease(self, scope, row_id):
+        with self._lock:
+            lease = self._leases.get((scope, row_id))
+            if lease is None:
+                lease = self._leases[(scope, row_id)] = {
+                    "remaining": 0, "granted": 0, "unreported": 0, "period": None, "renewing": False,
+                    "lock": threading.Lock(), "grant_lock": threading.Lock()
+                }
+            return lease
+    
+    def _grant(self, scope, row_id, minimum, spent):
+        """
+        Kalan kotadan en az minimum token içeren bir dilim ayır ve dilimden harcanan spent
+        tokeni leased_tokens'tan düş; (miktar, dönem) döndürür, kota yetmezse miktar 0.
+        """
+        table = self.TABLES[scope]
+        conn = acquire_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        try:
+            cursor.execute(
+                f"SELECT tokens_used, monthly_token_limit, last_reset_date FROM {table} WHERE id = %s FOR UPDATE",
+                (row_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                conn.rollback()
+                return 0, None
+            
+            available = row['monthly_token_limit'] - row['tokens_used']
+            amount = min(available, max(minimum, math.ceil(available * self.fraction)))
+            if amount <= 0 or amount < minimum:
+                amount = 0
+            
+            if amount or spent:
+                cursor.execute(
+                    f"UPDATE {table} SET tokens_used = tokens_used + %s, leased_tokens = GREATEST(leased_tokens + %s - %s, 0) WHERE id = %s",
+                    (amount, amount, spent, row_id)
+                )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Kota dilimi alınırken hata: {e}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        
+        if amount:
+            with self._lock:
+                self._stats["grants"] += 1
+                self._stats["granted_tokens"] += amount
+        return amount, row['last_reset_date']
+    
+    def _add_grant(self, lease, amount, period):
+        """Yeni dilimi ekle; dönem değiştiyse önceki dönemden kalan dilim geçersizdir (kilit tutulurken)"""
+        if period != lease["period"]:
+            lease["remaining"] = 0
+            lease["unreported"] = 0
+        lease["remaining"] += amount
+        lease["granted"] = amount
+        lease["period"] = period
+    
+    def _renew(self, scope, row_id, lease, minimum):
+        """Dilimi veritabanından yenile; G/Ç sırasında lease kilidi tutulmaz (grant_lock tutulurken çağrılır)"""
+        with lease["lock"]:
+            spent = lease["unreported"]
+        
+        amount, period = self._grant(scope, row_id, minimum, spent)
+        
+        with lease["lock"]:
+            lease["unreported"] -= spent
+            if amount:
+                self._add_grant(lease, amount, period)
+    
+    def _take(self, lease, tokens):
+        """Tokenleri dilimden harca; (harcandı, yenilenmeli) döndürür (lease kilidi tutulurken)"""
+        if lease["remaining"] < tokens:
+            return False, False
+        lease["remaining"] -= tokens
+        lease["unreported"] += tokens
+        renew = lease["remaining"] < lease["granted"] * self.low_watermark and not lease["renewing"]
+        if renew:
+            lease["renewing"] = True
+        return True, renew
+    
+    def spend(self, scope, row_id, tokens, period):
+        """Tokenleri yerel dilimden harca, yetmezse dilimi hemen yenile; kota yetmiyorsa False"""
+        lease = self._lease(scope, row_id)
+        
+        with lease["lock"]:
+            # Kota dönemi bu dilim alındıktan sonra sıfırlandıysa eski dilim kullanılmaz
+            if period is not None and lease["period"] is not None and period > lease["period"]:
+                lease["remaining"] = 0
+                lease["unreported"] = 0
+            spent, renew = self._take(lease, tokens)
+        
+        if not spent:
+            with lease["grant_lock"]:
+                # Sırada beklerken başka bir istek dilimi yenilemiş olabilir
+                with lease["lock"]:
+                    spent, renew = self._take(lease, tokens)
+                    deficit = tokens - lease["remaining"]
+                if not spent:
+                    self._renew(scope, row_id, lease, deficit)
+                    with lease["lock"]:
+                        spent, renew = self._take(lease, tokens)
+            
+            if not spent:
+                with self._lock:
+                    self._stats["denied"] += 1
+                return False
+        
+        with self._lock:
+            self._stats["spent_tokens"] += tokens
+        if renew:
+            self._renewals.put((scope, row_id))
+        return True
+    
+    def refund(self, scope, row_id, tokens):
+        """Başarısız isteğin tokenlerini yerel dilime geri koy"""
+        lease = self._lease(scope, row_id)
+        with lease["lock"]:
+            lease["remaining"] += tokens
+            lease["unreported"] -= tokens
+        with self._lock:
+            self._stats["spent_tokens"] -= tokens
+    
+    def _return(self, scope, row_id, lease):
+        """Dilimde kalan tokenleri, dönem değişmediyse veritabanına iade et (grant_lock tutulurken)"""
+        with lease["lock"]:
+            remaining, spent, period = lease["remaining"], lease["unreported"], lease["period"]
+            lease["remaining"] = 0
+            lease["unreported"] = 0
+        if remaining <= 0 and spent == 0:
+            return
+        
+        table = self.TABLES[scope]
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                f"UPDATE {table} SET tokens_used = GREATEST(tokens_used - %s, 0), leased_tokens = GREATEST(leased_tokens - %s, 0) "
+                f"WHERE id = %s AND last_reset_date <=> %s",
+                (max(remaining, 0), max(remaining, 0) + spent, row_id, period)
+            )
+            conn.commit()
+            with self._lock:
+                self._stats["returned_tokens"] += max(remaining, 0)
+        except Exception as e:
+            logger.error(f"Kota dilimi iade edilirken hata: {e}")
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def release(self, scope, row_id):
+        """Dilimi iade edip bırak (örn. anahtar limiti değiştiğinde)"""
+        with self._lock:
+            lease = self._leases.pop((scope, row_id), None)
+        if lease is not None:
+            with lease["grant_lock"]:
+                self._return(scope, row_id, lease)
+    
+    def discard(self, scope, row_id):
+        """Dilimi iade etmeden bırak (örn. anahtar silindiğinde)"""
+        with self._lock:
+            self._leases.pop((scope, row_id), None)
+    
+    def release_all(self):
+        """Kapanışta tüm dilimlerin kullanılmayan kısmını iade et"""
+        with self._lock:
+            leases = list(self._leases.items())
+            self._leases.clear()
+        for (scope, row_id), lease in leases:
+            with lease["grant_lock"]:
+                self._return(scope, row_id, lease)
+    
+    def _run(self):
+        while True:
+            scope, row_id = self._renewals.get()
+            lease = self._lease(scope, row_id)
+            try:
+                with lease["grant_lock"]:
+                    with lease["lock"]:
+                        low = lease["remaining"] < lease["granted"] * self.low_watermark
+                    if low:
+                        self._renew(scope, row_id, lease, 1)
+            except Exception as e:
+                logger.error(f"Kota dilimi arka planda yenilenirken hata: {e}")
+                with self._lock:
+                    self._stats["failed_renewals"] += 1
+            finally:
+                with lease["lock"]:
+                    lease["renewing"] = False
+    
+    def outstanding(self):
+        """Bu süreçte kiralanıp henüz harcanmamış token toplamı"""
+        with self._lock:
+            leases = list(self._leases.values())
+        return sum(max(lease["remaining"], 0) for lease in leases)
+    
+    def stats(self):
+        outstanding = self.outstanding()
+        with self._lock:
+            return {**self._stats, "active_leases": len(self._leases), "outstanding_tokens": outstanding,
+                    "fraction": self.fraction}
+
+def reserve_tokens(tokens_needed):
+    """
+    İstek için gereken tokenleri tahminden önce tek bir koşullu UPDATE ile ayır.
+    
+    Limit yetmiyorsa satır güncellenmez ve False döner; kontrol ile artış aynı sorguda
+    yapıldığından eşzamanlı istekler limiti aşamaz. Tahmin başarısız olursa ayrılan
+    tokenler refund_tokens ile iade edilir.
+    """
+    # Değişmeyen satır etkilenen satır sayılmadığından sıfır tokenlik istek doğrudan kabul edilir
+    if tokens_needed <= 0:
+        return True
+    
+    # Kota kiralama açıksa tokenler düğümün yerel diliminden harcanır
+    if QUOTA_LEASES is not None:
+        scope, row_id = ("key", g.api_key_id) if g.using_api_key else ("ip", g.ip_id)
+        return QUOTA_LEASES.spend(scope, row_id, tokens_needed, g.last_reset_date)
+    
+    table, row_id = ("api_keys", g.api_key_id) if g.using_api_key else ("ip_rate_limits", g.ip_id)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(
+            f"UPDATE {table} SET tokens_used = tokens_used + %s WHERE id = %s AND tokens_used + %s <= monthly_token_limit",
+            (tokens_needed, row_id, tokens_needed)
+        )
+        # Ayırma istek sonunu beklemeden commit edilir; aksi halde satır kilidi tahmin
+        # boyunca tutulur ve aynı anahtarın istekleri sıraya girer
+        conn.commit_now()
+        reserved = cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Token ayrılırken hata: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    
+    # Önbellekteki kaydı ayrılan miktarla güncelle; ayrılamadıysa güncel değeri yeniden okut
+    if g.using_api_key and API_KEY_CACHE is not None:
+        if reserved:
+            API_KEY_CACHE.add_tokens(g.api_key_id, tokens_needed)
+        else:
+            API_KEY_CACHE.invalidate(key_id=g.api_key_id)
+    
+    return reserved
+
+def refund_tokens(tokens_reserved):
+    """Tahmin başarısız olduğunda ayrılan tokenleri iade et"""
+    if QUOTA_LEASES is not None:
+        scope, row_id = ("key", g.api_key_id) if g.using_api_key else ("ip", g.ip_id)
+        QUOTA_LEASES.refund(scope, row_id, tokens_reserved)
+    elif g.using_api_key:
+        update_token_usage(g.api_key_id, -tokens_reserved)
+    else:
+        update_ip_token_usage(g.ip_id, -tokens_reserved)
+
 # Admin işlemleri için decorator
 def admin_required(f):
     @functools.wraps(f)
@@ -488,10 +2603,104 @@ def admin_required(f):
             
     return decorated_function
 
+# Admin listeleri için sayfa boyutları
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+
+def encode_page_cursor(sort, order, value, row_id):
+    """Son satırın sıralama değeri ve id'sinden sonraki sayfa imlecini oluştur"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, order, value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_page_cursor(token, sort, order, parse_value):
+    """Sayfa imlecini çöz; bozuk ya da başka bir sıralamaya ait imleçte ValueError fırlat"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor_sort, cursor_order, value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Geçersiz sayfa imleci.")
+    
+    if cursor_sort != sort or cursor_order != order:
+        raise ValueError("Sayfa imleci farklı bir sıralamaya ait, listeyi baştan yükleyin.")
+    try:
+        return parse_value(value), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Geçersiz sayfa imleci.")
+
+def int_query_arg(name):
+    """Sorgu parametresini tamsayı olarak oku (verilmemişse None)"""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} bir tamsayı olmalıdır.")
+
+def escape_like(text):
+    """LIKE kalıbı için özel karakterleri kaçır"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fetch_keyset_page(cursor, table, sort_columns, default_sort, conditions, params):
+    """
+    Admin listesini imleçli (keyset) sayfalama ile getir.
+    
+    Satırlar (sıralama sütunu, id) çiftine göre sıralanır ve sonraki sayfa son satırın bu
+    değerlerinden devam eder; OFFSET kullanılmadığından her sayfa indeks üzerinde yalnızca
+    limit kadar satır okur. sort_columns, izin verilen sütunları imleçteki değeri çözen
+    fonksiyonlarla eşler. (satırlar, sonraki imleç) döndürür; son sayfada imleç None olur.
+    """
+    sort = request.args.get("sort", default_sort)
+    if sort not in sort_columns:
+        raise ValueError(f"Geçersiz sıralama sütunu. Kullanılabilir: {', '.join(sort_columns)}")
+    order = request.args.get("order", "desc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order yalnızca asc ya da desc olabilir.")
+    limit = int_query_arg("limit") or ADMIN_PAGE_SIZE
+    limit = max(1, min(limit, ADMIN_MAX_PAGE_SIZE))
+    
+    conditions = list(conditions)
+    params = list(params)
+    comparator = "<" if order == "desc" else ">"
+    token = request.args.get("cursor")
+    if token:
+        value, row_id = decode_page_cursor(token, sort, order, sort_columns[sort])
+        if sort == "id":
+            conditions.append(f"id {comparator} %s")
+            params.append(row_id)
+        else:
+            conditions.append(f"({sort} {comparator} %s OR ({sort} = %s AND id {comparator} %s))")
+            params.extend([value, value, row_id])
+    
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = order.upper()
+    cursor.execute(
+        f"SELECT * FROM {table}{where} ORDER BY {sort} {direction}, id {direction} LIMIT %s",
+        params + [limit + 1]
+    )
+    rows = cursor.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_page_cursor(sort, order, rows[-1][sort], rows[-1]["id"])
+    return rows, next_cursor
+
 # Güncellenen API yetkilendirme decoratoru
+def rate_limit_exceeded():
+    """IP hız sınırı aşıldığında döndürülen yanıt"""
+    return jsonify({
+        "error": "Hız sınırına ulaşıldı",
+        "message": "15 dakika içinde en fazla 15 istek yapabilirsiniz"
+    }), 429
+
 def require_api_key(f):
     @functools.wraps(f)
     def decorated(*args, **kwargs):
+        started = time.perf_counter()
+        
         # Admin kontrolü - admin istekleri tüm sınırlamalardan muaf
         admin_password = os.getenv("ADMIN_PASSWORD")
         provided_password = request.headers.get('Admin-Password')
@@ -502,6 +2711,7 @@ def require_api_key(f):
             g.is_unlimited = True
             g.using_api_key = False
             g.admin_request = True
+            observe_stage("auth", started)
             return f(*args, **kwargs)
         
         # Standart API key veya IP bazlı yetkilendirme
@@ -518,96 +2728,753 @@ def require_api_key(f):
                 return jsonify({"error": "Geçersiz API anahtarı"}), 401
             
             # Sınırsız API key veya izin verilen IP adres kontrolü
-            is_unlimited = key_info['is_unlimited'] or is_ip_allowed(client_ip, key_info['unlimited_ips'])
+            is_unlimited = key_info['is_unlimited'] or key_info['ip_allowlist'].contains(client_ip)
             
             # Kullanım bilgilerini g nesnesine kaydet
             g.api_key_id = key_info['id']
             g.is_unlimited = is_unlimited
-            g.tokens_used = key_info['tokens_used']
+            # Düğümlerin kiralayıp henüz harcamadığı tokenler kullanılmış sayılmaz
+            g.tokens_used = key_info['tokens_used'] - key_info['leased_tokens']
             g.monthly_token_limit = key_info['monthly_token_limit']
+            g.last_reset_date = key_info['last_reset_date']
             g.using_api_key = True
             g.admin_request = False
         
-        # API key yoksa IP bazlı sınırlamaları kontrol et
-        else:
-            ip_info = get_or_create_ip_info(client_ip)
+        # API key yoksa IP bazlı sınırlamaları kontrol et
+        else:
+            # Bellekteki sınırlayıcı, sınırı aşan istekleri veritabanına gitmeden reddeder
+            # (yalnızca tahmin istekleri sayılır)
+            if IP_RATE_LIMITER is not None:
+                if not IP_RATE_LIMITER.acquire(client_ip, consume=request.endpoint in ('predict', 'batch_predict')):
+                    return rate_limit_exceeded()
+            
+            ip_info = get_or_create_ip_info(client_ip)
+            
+            if not ip_info:
+                return jsonify({"error": "IP adresi bilgisi alınamadı"}), 500
+            
+            # IP adresinin istek sınırını kontrol et
+            if IP_RATE_LIMITER is None and not can_ip_make_request(ip_info):
+                return rate_limit_exceeded()
+            
+            # Kullanım bilgilerini g nesnesine kaydet
+            g.ip_id = ip_info['id']
+            g.is_unlimited = False
+            g.tokens_used = ip_info['tokens_used'] - ip_info['leased_tokens']
+            g.monthly_token_limit = ip_info['monthly_token_limit']
+            g.last_reset_date = ip_info['last_reset_date']
+            g.using_api_key = False
+            g.client_ip = client_ip
+            g.admin_request = False
+        
+        observe_stage("auth", started)
+        return f(*args, **kwargs)
+    return decorated
+
+# Tahmin fonksiyonları
+def predictions_from_outputs(outputs):
+    """Model çıktılarını metin başına tahmin sözlüklerine dönüştürür (tüm batch için tek seferde)"""
+    # Hiyerarşik tahminler
+    offensive_preds = torch.argmax(outputs['offensive_logits'], dim=1).tolist()
+    targeted_preds = torch.argmax(outputs['targeted_logits'], dim=1).tolist()
+    target_type_preds = torch.argmax(outputs['target_type_logits'], dim=1).tolist()
+    difficulty_preds = torch.argmax(outputs['difficulty_logits'], dim=1).tolist()
+    
+    # Çoklu etiket tahminleri
+    multi_label_probs = torch.sigmoid(outputs['multi_label_logits'])
+    multi_label_preds = (multi_label_probs > 0.5).int().tolist()
+    multi_label_probs = multi_label_probs.tolist()
+    
+    predictions = [
+        {
+            'offensive_pred': offensive_preds[i],
+            'targeted_pred': targeted_preds[i],
+            'target_type_pred': target_type_preds[i],
+            'multi_label_probs': multi_label_probs[i],
+            'multi_label_preds': multi_label_preds[i],
+            'difficulty_pred': difficulty_preds[i]
+        }
+        for i in range(len(offensive_preds))
+    ]
+    
+    # Erken çıkış açıksa her örneğin çıktığı katmanı ekle; erken çıkan örneklerde
+    # yalnızca saldırganlık kararı eğitilmiş bir başlıktan geldiği için diğer alanlar boş bırakılır
+    if 'exit_layer' in outputs:
+        for prediction, exit_layer, early_exit in zip(predictions, outputs['exit_layer'].tolist(), outputs['early_exit'].tolist()):
+            prediction['exit_layer'] = exit_layer
+            if early_exit:
+                prediction.update({
+                    'targeted_pred': None,
+                    'target_type_pred': None,
+                    'multi_label_probs': None,
+                    'multi_label_preds': None,
+                    'difficulty_pred': None
+                })
+    
+    return predictions
+
+def pad_encodings(encodings, indices, pad_token_id):
+    """Seçilen örnekleri yalnızca kendi içlerindeki en uzun diziye göre dolgular"""
+    max_length = max(len(encodings['input_ids'][i]) for i in indices)
+    input_ids = torch.full((len(indices), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(indices), max_length), dtype=torch.long)
+    token_type_ids = torch.zeros((len(indices), max_length), dtype=torch.long)
+    
+    for row, i in enumerate(indices):
+        length = len(encodings['input_ids'][i])
+        input_ids[row, :length] = torch.tensor(encodings['input_ids'][i], dtype=torch.long)
+        attention_mask[row, :length] = 1
+        if 'token_type_ids' in encodings:
+            token_type_ids[row, :length] = torch.tensor(encodings['token_type_ids'][i], dtype=torch.long)
+    
+    return {
+        'input_ids': input_ids,
+        'attention_mask': attention_mask,
+        'token_type_ids': token_type_ids
+    }
+
+def predict_offensive_content_batch(model, tokenizer, texts, chunk_size=None):
+    """
+    Birden fazla metni toplu olarak tahmin eder.
+    
+    Tüm liste tek bir tokenizer çağrısıyla işlenir, örnekler token uzunluğuna göre
+    sıralanır ve sabit boyutlu parçalar halinde (her parça kendi içinde dolgulanarak)
+    modelden geçirilir. Sonuçlar orijinal sıraya geri dizilir.
+    """
+    if not texts:
+        return []
+    
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    
+    # Tüm metinleri dolgusuz olarak tek seferde tokenize et
+    started = time.perf_counter()
+    encodings = tokenizer(texts, truncation=True, max_length=128)
+    observe_stage("tokenize", started)
+    if METRICS is not None:
+        METRICS.batch_size.observe(len(texts))
+    
+    # Dolguyu azaltmak için token uzunluğuna göre sırala
+    order = sorted(range(len(texts)), key=lambda i: len(encodings['input_ids'][i]))
+    
+    started = time.perf_counter()
+    model.eval()
+    chunk_outputs = []
+    with torch.no_grad():
+        for start in range(0, len(order), chunk_size):
+            inputs = pad_encodings(encodings, order[start:start + chunk_size], tokenizer.pad_token_id)
+            chunk_outputs.append(model(**inputs))
+    
+    # Parça çıktılarını birleştir ve orijinal sıraya geri diz
+    inverse = torch.empty(len(order), dtype=torch.long)
+    inverse[torch.tensor(order, dtype=torch.long)] = torch.arange(len(order))
+    outputs = {
+        key: torch.cat([chunk[key] for chunk in chunk_outputs], dim=0)[inverse]
+        for key in chunk_outputs[0]
+    }
+    
+    # Tahminler CPU'ya çekilirken model çalışması da tamamlanmış olur; süre buna göre ölçülür
+    predictions = predictions_from_outputs(outputs)
+    observe_stage("forward", started)
+    return predictions
+
+def predict_offensive_content(model, tokenizer, text):
+    """Metinin saldırgan içeriğini tahmin eder"""
+    return predict_offensive_content_batch(model, tokenizer, [text])[0]
+
+class MicroBatchScheduler:
+    """
+    Eşzamanlı gelen tekil tahmin isteklerini tek bir ileri geçişte toplayan zamanlayıcı.
+    
+    İstekler bir kuyruğa alınır; toplayıcı iş parçacığı ilk isteği aldıktan sonra
+    en fazla max_wait_ms kadar bekleyerek max_batch_size'a kadar istek toplar ve batch'i
+    çalıştırıcı iş parçacıklarına devreder; her çağıran kendi sonucunu alır. Aynı anda en
+    fazla max_in_flight batch çalışır; hepsi meşgulken gelen istekler kuyrukta birikip
+    bir sonraki batch'e katılır.
+    
+    Kuyrukta en fazla max_queue_size istek bekleyebilir; kuyruk doluysa ya da istek
+    queue_timeout_ms içinde bir batch'e alınamazsa InferenceOverloadedError fırlatılır ve
+    istek iptal edilir. Böylece yoğunlukta /predict istekleri de yürütücüdeki gibi hızla 503
+    alır. retry_after, Retry-After için bekleme tahmini döndüren fonksiyondur.
+    """
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, max_in_flight=1,
+                 max_queue_size=0, queue_timeout_ms=None, retry_after=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout_ms / 1000.0 if queue_timeout_ms is not None else None
+        self.retry_after = retry_after or (lambda: 1)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._batches = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "batched_requests": 0, "rejected_full": 0, "rejected_timeout": 0}
+    
+    def start(self):
+        """Toplayıcı ve çalıştırıcı iş parçacıklarını başlat"""
+        self._threads.append(threading.Thread(target=self._run, name="micro-batch-scheduler", daemon=True))
+        for i in range(self.max_in_flight):
+            self._threads.append(threading.Thread(target=self._run_batches, name=f"micro-batch-runner-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Mikro-batch zamanlayıcı başlatıldı (max_batch_size={self.max_batch_size}, "
+                    f"max_wait_ms={self.max_wait * 1000:.1f}, eşzamanlı batch={self.max_in_flight})")
+        return self
+    
+    def submit(self, text):
+        """Metni kuyruğa ekle ve tahmin sonucunu bekle"""
+        future = Future()
+        try:
+            self._queue.put_nowait((text, future))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected_full"] += 1
+            raise InferenceOverloadedError("Mikro-batch kuyruğu dolu", self.retry_after())
+        
+        # Süresinde bir batch'e alınmayan istek iptal edilir; toplayıcı onu kuyruktan alınca atlar
+        try:
+            result = future.result(timeout=self.queue_timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                with self._lock:
+                    self._stats["rejected_timeout"] += 1
+                raise InferenceOverloadedError("Mikro-batch süresinde başlatılamadı", self.retry_after())
+            result = future.result()
+        
+        # Batch'in aşama süreleri her isteğin Server-Timing başlığına eklenir
+        prediction, timings = result
+        merge_stage_timings(timings)
+        return prediction
+    
+    def _collect_batch(self):
+        """İlk istekten sonra süre ya da boyut sınırına kadar istek topla; iptal edilenler atlanır"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+    
+    def _run(self):
+        # Boş çalıştırıcı yoksa toplama başlamaz; istekler kuyrukta bekleyip daha büyük batch oluşturur
+        while True:
+            self._slots.acquire()
+            batch = self._collect_batch()
+            if batch:
+                self._batches.put(batch)
+            else:
+                self._slots.release()
+    
+    def _run_batches(self):
+        while True:
+            batch = self._batches.get()
+            try:
+                self._run_batch(batch)
+            finally:
+                self._slots.release()
+    
+    def _run_batch(self, batch):
+        texts = [text for text, _ in batch]
+        timings = {}
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["batched_requests"] += len(batch)
+        
+        try:
+            predictions = call_with_stage_timings(timings, self.predict_fn, texts)
+        except Exception as e:
+            logger.error(f"Mikro-batch tahmini sırasında hata: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, future), prediction in zip(batch, predictions):
+            future.set_result((prediction, timings))
+    
+    def stats(self):
+        """Kuyruk derinliği, ortalama batch boyutu ve ret sayaçları"""
+        with self._lock:
+            batches = self._stats["batches"]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                **self._stats,
+                "avg_batch_size": round(self._stats["batched_requests"] / batches, 2) if batches else 0.0
+            }
+
+class InferenceOverloadedError(Exception):
+    """Çıkarım yürütücüsü isteği kabul edemediğinde ya da süresinde başlatamadığında fırlatılır"""
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class InferenceExecutor:
+    """
+    Model çağrılarını sınırlı bir kuyruk ve sabit sayıda iş parçacığıyla çalıştıran yürütücü.
+    
+    Kuyruk doluysa istek hemen reddedilir; kuyruğa alınan istek queue_timeout_ms içinde
+    başlatılamazsa iptal edilir. Her iki durumda da InferenceOverloadedError fırlatılır,
+    böylece yoğunlukta istekler waitress iş parçacıklarında birikmek yerine hızla 503 alır.
+    """
+    def __init__(self, max_concurrency=2, max_queue_size=32, queue_timeout_ms=1000):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._service_time = None
+        self._stats = {"submitted": 0, "started": 0, "completed": 0, "failed": 0,
+                       "rejected_full": 0, "rejected_timeout": 0, "total_wait": 0.0, "max_wait": 0.0}
+    
+    def start(self):
+        """Çıkarım iş parçacıklarını başlat"""
+        for i in range(self.max_concurrency):
+            thread = threading.Thread(target=self._run, name=f"inference-executor-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Çıkarım yürütücüsü başlatıldı (eşzamanlılık={self.max_concurrency}, kuyruk={self.max_queue_size}, "
+                    f"bekleme sınırı={self.queue_timeout * 1000:.0f} ms)")
+        return self
+    
+    def retry_after(self):
+        """Bekleyen işlerin bitmesi için tahmini süre (saniye, en az 1)"""
+        service_time = self._service_time or 0.0
+        pending = self._queue.qsize() + self._active
+        return max(1, math.ceil(pending * service_time / self.max_concurrency))
+    
+    def run(self, fn, *args):
+        """fn(*args) çağrısını yürütücüde çalıştır ve sonucunu döndür"""
+        future = Future()
+        started = threading.Event()
+        
+        try:
+            self._queue.put_nowait((fn, args, future, started, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected_full"] += 1
+            raise InferenceOverloadedError("Çıkarım kuyruğu dolu", self.retry_after())
+        
+        with self._lock:
+            self._stats["submitted"] += 1
+        
+        # Süresinde başlamayan iş iptal edilir; iş parçacığı onu kuyruktan alınca atlar
+        if not started.wait(self.queue_timeout) and future.cancel():
+            with self._lock:
+                self._stats["rejected_timeout"] += 1
+            raise InferenceOverloadedError("Çıkarım süresinde başlatılamadı", self.retry_after())
+        
+        return future.result()
+    
+    def _run(self):
+        while True:
+            fn, args, future, started, enqueued_at = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            started.set()
+            
+            begin = time.monotonic()
+            wait = begin - enqueued_at
+            with self._lock:
+                self._active += 1
+                self._stats["started"] += 1
+                self._stats["total_wait"] += wait
+                self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+            
+            failed = False
+            try:
+                result = fn(*args)
+            except Exception as e:
+                failed = True
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            
+            elapsed = time.monotonic() - begin
+            with self._lock:
+                self._active -= 1
+                self._stats["failed" if failed else "completed"] += 1
+                # Retry-After tahmini için üstel hareketli ortalama
+                self._service_time = elapsed if self._service_time is None else 0.9 * self._service_time + 0.1 * elapsed
+    
+    def stats(self):
+        """Kuyruk derinliği, bekleme süreleri ve ret sayaçları"""
+        with self._lock:
+            started = self._stats["started"]
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue_size": self.max_queue_size,
+                "queue_timeout_ms": round(self.queue_timeout * 1000),
+                "queue_depth": self._queue.qsize(),
+                "active": self._active,
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "rejected_full": self._stats["rejected_full"],
+                "rejected_timeout": self._stats["rejected_timeout"],
+                "avg_wait_ms": round(self._stats["total_wait"] / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._stats["max_wait"] * 1000, 2),
+                "avg_service_ms": round(self._service_time * 1000, 2) if self._service_time is not None else 0.0
+            }
+
+def run_inference(fn, *args):
+    """Model çağrısını (varsa) çıkarım yürütücüsü üzerinden çalıştır"""
+    # Profillenen istekte çağrı istek iş parçacığında kalır
+    if INFERENCE_EXECUTOR is None or is_profiling():
+        return fn(*args)
+    
+    timings = getattr(STAGE_TIMINGS, "current", None)
+    if timings is None:
+        return INFERENCE_EXECUTOR.run(fn, *args)
+    return INFERENCE_EXECUTOR.run(call_with_stage_timings, timings, fn, *args)
+
+class PredictionCache:
+    """
+    Normalize edilmiş metin ve model sürümüyle anahtarlanan tahmin önbelleği.
+    
+    Bellek katmanı LRU sırasıyla tutulur; kayıt sayısı, yaşam süresi (TTL) ve
+    yaklaşık bellek kullanımıyla sınırlandırılır. disk_path verilirse aynı makinedeki
+    tüm sunucu süreçlerinin paylaştığı bir SQLite katmanı da kullanılır. Disk katmanı
+    her süreçte belirli sayıda yazmada bir budanır: süresi dolan kayıtlar silinir, ardından
+    max_disk_entries üzerindeki en eski kayıtlar atılır (sınır süreç sayısı x budama aralığı
+    kadar aşılabilir).
+    """
+    def __init__(self, max_entries=10000, ttl_seconds=3600, max_memory_mb=64, disk_path=None,
+                 max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self.prune_interval = max(1, min(1000, max_disk_entries // 10))
+        self.model_version = None
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_writes = 0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "disk_evictions": 0}
+        
+        if self.disk_path:
+            # Tablo geçici bir bağlantıyla oluşturulur; açık bağlantı fork ile işçi süreçlere taşınmasın
+            conn = sqlite3.connect(self.disk_path, timeout=1.0)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS predictions (
+                        cache_key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_expires_at ON predictions (expires_at)")
+                conn.commit()
+            finally:
+                conn.close()
+    
+    @staticmethod
+    def normalize(text):
+        """Unicode biçimini ve boşlukları normalize et (tokenizer için anlamı değiştirmez)"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+    
+    def make_key(self, text):
+        """Model sürümü ve normalize edilmiş metinden önbellek anahtarı üret"""
+        normalized = self.normalize(text)
+        return hashlib.sha256(f"{self.model_version}\0{normalized}".encode("utf-8")).hexdigest()
+    
+    def set_model_version(self, version):
+        """Model sürümü değiştiğinde eski kayıtları geçersiz kıl"""
+        with self._lock:
+            if version != self.model_version:
+                self._entries.clear()
+                self._memory_bytes = 0
+            self.model_version = version
+    
+    def _disk(self):
+        """İş parçacığına özel SQLite bağlantısı"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._memory_bytes -= size
+    
+    def _store(self, key, value, expires_at):
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + len(value)
+        self._entries[key] = (expires_at, size, value)
+        self._memory_bytes += size
+        
+        # Kayıt sayısı veya bellek sınırı aşılırsa en eski kullanılanları çıkar
+        while self._entries and (len(self._entries) > self.max_entries or self._memory_bytes > self.max_memory_bytes):
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+    
+    def _prune_disk(self, conn):
+        """Süresi dolan kayıtları ve kayıt sınırını aşan en eski kayıtları diskten sil"""
+        conn.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),))
+        
+        # TTL sabit olduğundan expires_at sırası yazılma sırasıyla aynıdır
+        excess = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM predictions WHERE cache_key IN "
+                "(SELECT cache_key FROM predictions ORDER BY expires_at LIMIT ?)",
+                (excess,)
+            )
+            with self._lock:
+                self._stats["disk_evictions"] += excess
+    
+    def get(self, text):
+        """Metin için önbellekteki tahmini döndür, yoksa None"""
+        key = self.make_key(text)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return json.loads(entry[2])
+                self._remove(key)
+                self._stats["expired"] += 1
+        
+        if self.disk_path:
+            try:
+                row = self._disk().execute(
+                    "SELECT value, expires_at FROM predictions WHERE cache_key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Tahmin önbelleği diskten okunamadı: {e}")
+                row = None
             
-            if not ip_info:
-                return jsonify({"error": "IP adresi bilgisi alınamadı"}), 500
+            if row and row[1] > now:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self._stats["disk_hits"] += 1
+                return json.loads(row[0])
+        
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+    
+    def set(self, text, prediction):
+        """Tahmini önbelleğe (ve varsa disk katmanına) yaz"""
+        key = self.make_key(text)
+        value = json.dumps(prediction)
+        expires_at = time.time() + self.ttl_seconds
+        
+        with self._lock:
+            self._store(key, value, expires_at)
+        
+        if self.disk_path:
+            try:
+                conn = self._disk()
+                conn.execute(
+                    "INSERT OR REPLACE INTO predictions (cache_key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                
+                # Disk katmanını ara ara buda
+                with self._lock:
+                    self._disk_writes += 1
+                    prune = self._disk_writes % self.prune_interval == 0
+                if prune:
+                    self._prune_disk(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Tahmin önbelleği diske yazılamadı: {e}")
+    
+    def stats(self):
+        """Önbellek sayaçlarını döndür"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["model_version"] = self.model_version
+        return stats
+
+class FastTierClassifier:
+    """
+    Kaskadın ilk aşaması: TF-IDF karakter n-gram + doğrusal model (train.py --fast_model).
+    
+    Saldırganlık güveni eşiğin üzerindeki metinler için BERT ile aynı biçimde bir
+    tahmin sözlüğü üretir; emin olmadığı metinler için None döndürür.
+    """
+    def __init__(self, path, confidence_threshold=None):
+        import joblib
+        
+        bundle = joblib.load(path)
+        self.pipeline = bundle['pipeline']
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else bundle['confidence_threshold']
+        self._lock = threading.Lock()
+        self._stats = {"fast": 0, "escalated": 0}
+        logger.info(f"Hızlı model yüklendi: {path} (güven eşiği={self.confidence_threshold:.4f}, "
+                    f"eğitimde kapsam={bundle.get('coverage', 0) * 100:.1f}%, uyum={bundle.get('agreement')})")
+    
+    def predict(self, texts):
+        """Her metin için hızlı tahmin ya da (emin değilse) None döndür"""
+        probs = self.pipeline.predict_proba(texts)
+        results = []
+        
+        for row in probs.tolist():
+            non_prob = row[0]
+            if max(non_prob, 1 - non_prob) < self.confidence_threshold:
+                results.append(None)
+                continue
             
-            # IP adresinin istek sınırını kontrol et
-            if not can_ip_make_request(ip_info):
-                return jsonify({
-                    "error": "Hız sınırına ulaşıldı",
-                    "message": "15 dakika içinde en fazla 15 istek yapabilirsiniz"
-                }), 429
+            # Hedef etiketlerinden (grp, ind, oth) hiyerarşik tahminleri türet
+            label_probs = row[:len(LABELS)]
+            label_preds = [1 if prob > 0.5 else 0 for prob in label_probs]
+            targets = label_preds[2:5]
+            target_type_pred = 3 if sum(targets) > 1 else (targets.index(1) if sum(targets) == 1 else 0)
             
-            # Kullanım bilgilerini g nesnesine kaydet
-            g.ip_id = ip_info['id']
-            g.is_unlimited = False
-            g.tokens_used = ip_info['tokens_used']
-            g.monthly_token_limit = ip_info['monthly_token_limit']
-            g.using_api_key = False
-            g.client_ip = client_ip
-            g.admin_request = False
+            results.append({
+                'offensive_pred': 1 if non_prob < 0.5 else 0,
+                'targeted_pred': 1 if sum(targets) > 0 else 0,
+                'target_type_pred': target_type_pred,
+                'multi_label_probs': label_probs,
+                'multi_label_preds': label_preds,
+                'difficulty_pred': 1 if row[len(LABELS)] > 0.5 else 0,
+                'tier': 'fast'
+            })
         
-        return f(*args, **kwargs)
-    return decorated
+        fast_count = sum(result is not None for result in results)
+        with self._lock:
+            self._stats["fast"] += fast_count
+            self._stats["escalated"] += len(results) - fast_count
+        return results
+    
+    def stats(self):
+        """Kaskad sayaçlarını döndür"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["fast"] + stats["escalated"]
+        stats["fast_rate"] = stats["fast"] / total if total else 0.0
+        stats["confidence_threshold"] = self.confidence_threshold
+        return stats
 
-# Tahmin fonksiyonları
-def predict_offensive_content(model, tokenizer, text):
-    """Metinin saldırgan içeriğini tahmin eder"""
-    # Metni tokenize et
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=128)
+def mark_full_tier(predictions):
+    """Kaskad açıkken BERT'ten gelen tahminleri işaretle (önbellekteki kayıt değiştirilmez)"""
+    return dict(predictions, tier='full') if FAST_TIER is not None else predictions
+
+def run_prediction(text):
+    """Tekil metni hızlı katman, önbellek ya da (varsa) mikro-batch zamanlayıcı üzerinden tahmin eder"""
+    if FAST_TIER is not None:
+        fast_prediction = FAST_TIER.predict([text])[0]
+        if fast_prediction is not None:
+            return fast_prediction
     
-    # Tahmin yap
-    model.eval()
-    with torch.no_grad():
-        outputs = model(**inputs)
+    if PREDICTION_CACHE is not None:
+        cached = PREDICTION_CACHE.get(text)
+        if cached is not None:
+            return mark_full_tier(cached)
     
-    # Hiyerarşik tahminler
-    offensive_pred = torch.argmax(outputs['offensive_logits'], dim=1).item()
-    targeted_pred = torch.argmax(outputs['targeted_logits'], dim=1).item()
-    target_type_pred = torch.argmax(outputs['target_type_logits'], dim=1).item()
+    if SCHEDULER is not None and not is_profiling():
+        predictions = SCHEDULER.submit(text)
+    else:
+        predictions = run_inference(predict_offensive_content, MODEL, TOKENIZER, text)
     
-    # Çoklu etiket tahminleri
-    multi_label_probs = torch.sigmoid(outputs['multi_label_logits']).squeeze().tolist()
-    multi_label_preds = [1 if prob > 0.5 else 0 for prob in multi_label_probs]
-    difficulty_pred = torch.argmax(outputs['difficulty_logits'], dim=1).item()
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.set(text, predictions)
+    return mark_full_tier(predictions)
+
+def run_full_batch_prediction(texts):
+    """Metin listesini BERT ile tahmin eder; önbellekte olanlar ve tekrar eden metinler modele gönderilmez"""
+    if PREDICTION_CACHE is None:
+        return run_inference(predict_offensive_content_batch, MODEL, TOKENIZER, texts)
     
-    return {
-        'offensive_pred': offensive_pred,
-        'targeted_pred': targeted_pred,
-        'target_type_pred': target_type_pred,
-        'multi_label_probs': multi_label_probs,
-        'multi_label_preds': multi_label_preds,
-        'difficulty_pred': difficulty_pred
-    }
+    predictions = [PREDICTION_CACHE.get(text) for text in texts]
+    
+    # Önbellekte olmayan metinleri normalize edilmiş hallerine göre tekilleştir
+    pending = OrderedDict()
+    for i, prediction in enumerate(predictions):
+        if prediction is None:
+            pending.setdefault(PredictionCache.normalize(texts[i]), []).append(i)
+    
+    if pending:
+        unique_texts = [texts[indices[0]] for indices in pending.values()]
+        computed = run_inference(predict_offensive_content_batch, MODEL, TOKENIZER, unique_texts)
+        for text, indices, prediction in zip(unique_texts, pending.values(), computed):
+            PREDICTION_CACHE.set(text, prediction)
+            for i in indices:
+                predictions[i] = prediction
+    
+    return predictions
+
+def run_batch_prediction(texts):
+    """Metin listesini tahmin eder; kaskad açıksa yalnızca hızlı katmanın emin olmadığı metinler BERT'e gider"""
+    if FAST_TIER is None or not texts:
+        return run_full_batch_prediction(texts)
+    
+    predictions = FAST_TIER.predict(texts)
+    escalated = [i for i, prediction in enumerate(predictions) if prediction is None]
+    
+    if escalated:
+        full_predictions = run_full_batch_prediction([texts[i] for i in escalated])
+        for i, prediction in zip(escalated, full_predictions):
+            predictions[i] = mark_full_tier(prediction)
+    
+    return predictions
 
 def interpret_predictions(predictions, labels):
     """Tahminleri okunabilir biçimde yorumlar"""
     # Saldırgan içerik var mı?
     is_offensive = predictions['offensive_pred'] == 1
     
-    # Etiketler
-    predicted_labels = [labels[i] for i in range(len(labels)) if predictions['multi_label_preds'][i] == 1]
-    
     # Hedef tipleri
     target_types = ["grup", "birey", "diğer", "çoklu hedef"]
     
-    # Sonuçları oluştur
-    results = {
-        "is_offensive": bool(is_offensive),
-        "predicted_labels": predicted_labels,
-        "label_probabilities": {labels[i]: float(predictions['multi_label_probs'][i]) for i in range(len(labels))},
-        "is_difficult": bool(predictions['difficulty_pred'] == 1)
-    }
+    # Erken çıkan tahminlerde yalnızca saldırganlık kararı vardır; diğer alanlar boş döner
+    if predictions['multi_label_preds'] is None:
+        results = {
+            "is_offensive": bool(is_offensive),
+            "predicted_labels": [],
+            "label_probabilities": {},
+            "is_difficult": None
+        }
+    else:
+        # Sonuçları oluştur
+        results = {
+            "is_offensive": bool(is_offensive),
+            "predicted_labels": [labels[i] for i in range(len(labels)) if predictions['multi_label_preds'][i] == 1],
+            "label_probabilities": {labels[i]: float(predictions['multi_label_probs'][i]) for i in range(len(labels))},
+            "is_difficult": bool(predictions['difficulty_pred'] == 1)
+        }
     
     if is_offensive:
         results["is_targeted"] = bool(predictions['targeted_pred'] == 1)
         if predictions['targeted_pred'] == 1:
             results["target_type"] = target_types[predictions['target_type_pred']]
     
+    # Erken çıkış açıksa tahminin hangi katmanda verildiği
+    if 'exit_layer' in predictions:
+        results["exit_layer"] = predictions['exit_layer']
+    
+    # Kaskad açıksa tahmini veren katman (fast: hızlı model, full: BERT)
+    if 'tier' in predictions:
+        results["tier"] = predictions['tier']
+    
     return results
 
 # API Endpoints
@@ -616,6 +3483,16 @@ def health_check():
     """Servisin çalışıp çalışmadığını kontrol etmek için basit bir endpoint"""
     return jsonify({"status": "healthy"})
 
+@app.route('/metrics', methods=['GET'])
+@admin_required
+def metrics():
+    """Prometheus text formatında servis metrikleri (pre-fork modunda tüm işçilerin toplamı)"""
+    if METRICS is None:
+        return jsonify({"error": "Metrikler kapalı"}), 503
+    
+    body, content_type = METRICS.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/predict', methods=['POST'])
 @require_api_key
 def predict():
@@ -634,11 +3511,17 @@ def predict():
     
     endpoint = '/predict'
     
-    # Admin isteği veya sınırsız değilse token kontrolü yap
+    # Admin isteği veya sınırsız değilse tokenleri tahminden önce ayır
+    tokens_reserved = 0
     if not g.is_unlimited:
-        tokens_remaining = g.monthly_token_limit - g.tokens_used
+        started = time.perf_counter()
+        try:
+            reserved = reserve_tokens(tokens_needed)
+        except Exception:
+            return jsonify({"error": "İşlem sırasında bir hata oluştu"}), 500
         
-        if tokens_needed > tokens_remaining:
+        if not reserved:
+            tokens_remaining = max(g.monthly_token_limit - g.tokens_used, 0)
             if g.using_api_key:
                 log_api_usage(g.api_key_id, client_ip, endpoint, len(text), 0, False, 
                              f"Yetersiz token: {tokens_needed} gerekli, {tokens_remaining} kaldı")
@@ -651,33 +3534,35 @@ def predict():
                 "tokens_needed": tokens_needed,
                 "tokens_remaining": tokens_remaining
             }), 403
+        observe_stage("quota_reserve", started)
+        tokens_reserved = tokens_needed
     
     try:
         # IP bazlı istek limiti için sayacı güncelle (Admin değilse ve API key kullanmıyorsa)
         if not g.using_api_key and not getattr(g, 'admin_request', False):
             update_ip_request_count(g.ip_id)
     
+        # Bağlantı çıkarım boyunca tutulmaz; loglar için yeniden alınır
+        release_request_connection()
+        
         # Metni tahmin et
-        predictions = predict_offensive_content(MODEL, TOKENIZER, text)
+        predictions = run_prediction(text)
+        started = time.perf_counter()
         results = interpret_predictions(predictions, LABELS)
         
         # Sonuçlara metni ekle
         results["text"] = text
-            
-        # Kullanımı güncelle (Admin değilse ve sınırsız değilse)
-        if not g.is_unlimited and not getattr(g, 'admin_request', False):
-            if g.using_api_key:
-                update_token_usage(g.api_key_id, tokens_needed)
-            else:
-                update_ip_token_usage(g.ip_id, tokens_needed)
+        observe_stage("postprocess", started)
         
         # Kullanımı logla (Admin isteklerini de loglama amacıyla kaydedelim)
+        started = time.perf_counter()
         if getattr(g, 'admin_request', False):
             log_ip_request(client_ip, f"{endpoint} (admin)", len(text), 0, True)
         elif g.using_api_key:
             log_api_usage(g.api_key_id, client_ip, endpoint, len(text), tokens_needed, True)
         else:
             log_ip_request(client_ip, endpoint, len(text), tokens_needed, True)
+        observe_stage("accounting", started)
         
         # Kullanım bilgilerini ekle
         results["usage_info"] = {
@@ -692,8 +3577,25 @@ def predict():
     
         return jsonify(results)
     
+    except InferenceOverloadedError as e:
+        logger.warning(f"Tahmin reddedildi: {str(e)}")
+        if tokens_reserved:
+            refund_tokens(tokens_reserved)
+        if getattr(g, 'admin_request', False):
+            log_ip_request(client_ip, f"{endpoint} (admin)", len(text), 0, False, str(e))
+        elif g.using_api_key:
+            log_api_usage(g.api_key_id, client_ip, endpoint, len(text), 0, False, str(e))
+        else:
+            log_ip_request(client_ip, endpoint, len(text), 0, False, str(e))
+        
+        response = jsonify({"error": "Sunucu şu anda yoğun, lütfen daha sonra tekrar deneyin", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    
     except Exception as e:
         logger.error(f"Tahmin sırasında hata: {str(e)}")
+        if tokens_reserved:
+            refund_tokens(tokens_reserved)
         if getattr(g, 'admin_request', False):
             log_ip_request(client_ip, f"{endpoint} (admin)", len(text), 0, False, str(e))
         elif g.using_api_key:
@@ -724,11 +3626,17 @@ def batch_predict():
     total_length = sum(len(text) for text in texts)
     total_tokens_needed = sum(calculate_tokens(text) for text in texts)
     
-    # Admin isteği veya sınırsız değilse token kontrolü yap
+    # Admin isteği veya sınırsız değilse tokenleri tahminden önce ayır
+    tokens_reserved = 0
     if not g.is_unlimited:
-        tokens_remaining = g.monthly_token_limit - g.tokens_used
+        started = time.perf_counter()
+        try:
+            reserved = reserve_tokens(total_tokens_needed)
+        except Exception:
+            return jsonify({"error": "İşlem sırasında bir hata oluştu"}), 500
         
-        if total_tokens_needed > tokens_remaining:
+        if not reserved:
+            tokens_remaining = max(g.monthly_token_limit - g.tokens_used, 0)
             if g.using_api_key:
                 log_api_usage(g.api_key_id, client_ip, endpoint, total_length, 0, False, 
                              f"Yetersiz token: {total_tokens_needed} gerekli, {tokens_remaining} kaldı")
@@ -741,34 +3649,36 @@ def batch_predict():
                 "tokens_needed": total_tokens_needed,
                 "tokens_remaining": tokens_remaining
             }), 403
+        observe_stage("quota_reserve", started)
+        tokens_reserved = total_tokens_needed
     
     try:
         # IP bazlı istek limiti için sayacı güncelle (Admin değilse ve API key kullanmıyorsa)
         if not g.using_api_key and not getattr(g, 'admin_request', False):
             update_ip_request_count(g.ip_id)
     
-        # Her metin için tahmin yap
+        # Bağlantı çıkarım boyunca tutulmaz; loglar için yeniden alınır
+        release_request_connection()
+        
+        # Tüm metinleri uzunluğa göre sıralanmış parçalar halinde tahmin et
+        batch_predictions = run_batch_prediction(texts)
+        started = time.perf_counter()
         all_results = []
-        for text in texts:
-            predictions = predict_offensive_content(MODEL, TOKENIZER, text)
+        for text, predictions in zip(texts, batch_predictions):
             results = interpret_predictions(predictions, LABELS)
             results["text"] = text
             all_results.append(results)
-    
-        # Kullanımı güncelle (Admin değilse ve sınırsız değilse)
-        if not g.is_unlimited and not getattr(g, 'admin_request', False):
-            if g.using_api_key:
-                update_token_usage(g.api_key_id, total_tokens_needed)
-            else:
-                update_ip_token_usage(g.ip_id, total_tokens_needed)
+        observe_stage("postprocess", started)
         
         # Kullanımı logla (Admin isteklerini de loglama amacıyla kaydedelim)
+        started = time.perf_counter()
         if getattr(g, 'admin_request', False):
             log_ip_request(client_ip, f"{endpoint} (admin)", total_length, 0, True)
         elif g.using_api_key:
             log_api_usage(g.api_key_id, client_ip, endpoint, total_length, total_tokens_needed, True)
         else:
             log_ip_request(client_ip, endpoint, total_length, total_tokens_needed, True)
+        observe_stage("accounting", started)
         
         # Yanıtı hazırla
         response = {
@@ -786,8 +3696,25 @@ def batch_predict():
         
         return jsonify(response)
     
+    except InferenceOverloadedError as e:
+        logger.warning(f"Toplu tahmin reddedildi: {str(e)}")
+        if tokens_reserved:
+            refund_tokens(tokens_reserved)
+        if getattr(g, 'admin_request', False):
+            log_ip_request(client_ip, f"{endpoint} (admin)", total_length, 0, False, str(e))
+        elif g.using_api_key:
+            log_api_usage(g.api_key_id, client_ip, endpoint, total_length, 0, False, str(e))
+        else:
+            log_ip_request(client_ip, endpoint, total_length, 0, False, str(e))
+        
+        response = jsonify({"error": "Sunucu şu anda yoğun, lütfen daha sonra tekrar deneyin", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    
     except Exception as e:
         logger.error(f"Toplu tahmin sırasında hata: {str(e)}")
+        if tokens_reserved:
+            refund_tokens(tokens_reserved)
         if getattr(g, 'admin_request', False):
             log_ip_request(client_ip, f"{endpoint} (admin)", total_length, 0, False, str(e))
         elif g.using_api_key:
@@ -860,14 +3787,42 @@ def admin_logout():
 @app.route('/admin/keys')
 @admin_required
 def list_api_keys():
-    """API anahtarlarını listele"""
-    conn = DB_POOL.get_connection()
+    """
+    API anahtarlarını sayfa sayfa listele.
+    
+    Sorgu parametreleri: sort (created_at, tokens_used, id), order (asc, desc), limit,
+    cursor (önceki yanıttaki next_cursor), q (açıklama içinde arama ya da anahtar öneki),
+    min_tokens_used ve is_unlimited (0/1).
+    """
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
-        cursor.execute("SELECT * FROM api_keys ORDER BY created_at DESC")
-        api_keys = cursor.fetchall()
-        return jsonify({"api_keys": api_keys})
+        conditions, params = [], []
+        
+        search = request.args.get("q", "").strip()
+        if search:
+            conditions.append("(description LIKE %s OR api_key LIKE %s)")
+            params.extend([f"%{escape_like(search)}%", f"{escape_like(search)}%"])
+        
+        min_tokens_used = int_query_arg("min_tokens_used")
+        if min_tokens_used is not None:
+            conditions.append("tokens_used >= %s")
+            params.append(min_tokens_used)
+        
+        is_unlimited = request.args.get("is_unlimited")
+        if is_unlimited in ("0", "1"):
+            conditions.append("is_unlimited = %s")
+            params.append(is_unlimited == "1")
+        
+        api_keys, next_cursor = fetch_keyset_page(
+            cursor, "api_keys",
+            {"created_at": datetime.fromisoformat, "tokens_used": int, "id": int},
+            "created_at", conditions, params
+        )
+        return jsonify({"api_keys": api_keys, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"API anahtarları listelenirken hata: {e}")
         return jsonify({"error": "API anahtarları alınırken bir hata oluştu."}), 500
@@ -879,7 +3834,7 @@ def list_api_keys():
 @admin_required
 def get_api_key(key_id):
     """Belirli bir ID'ye sahip API anahtarı bilgilerini getir"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -901,16 +3856,25 @@ def get_api_key(key_id):
 @admin_required
 def delete_api_key(key_id):
     """API anahtarını sil"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute("DELETE FROM api_keys WHERE id = %s", (key_id,))
-        conn.commit()
+        deleted = cursor.rowcount
+        if deleted == 0:
+            return jsonify({"error": "API anahtarı bulunamadı."}), 404
         
-        if cursor.rowcount > 0:
-            return jsonify({"message": "API anahtarı başarıyla silindi."})
-        return jsonify({"error": "API anahtarı bulunamadı."}), 404
+        publish_api_key_invalidations(cursor, [(key_id, None)])
+        # Yerel önbellek commit'ten önce temizlenirse eşzamanlı bir istek eski satırı yeniden önbelleğe alabilir
+        conn.commit_now()
+        
+        if API_KEY_CACHE is not None:
+            API_KEY_CACHE.invalidate(key_id=key_id)
+        if QUOTA_LEASES is not None:
+            QUOTA_LEASES.discard("key", key_id)
+        
+        return jsonify({"message": "API anahtarı başarıyla silindi."})
     except Exception as e:
         logger.error(f"API anahtarı silinirken hata: {e}")
         conn.rollback()
@@ -930,19 +3894,29 @@ def create_api_key():
     is_unlimited = data.get('is_unlimited', False)
     auto_reset = data.get('auto_reset', True)
     
+    # Sınırsız IP listesi kaydedilirken doğrulanır, hatalı girdiler isteklerde değil burada bildirilir
+    unlimited_ips, error = parse_unlimited_ips(data.get('unlimited_ips'))
+    if error:
+        return jsonify({"error": error}), 400
+    
     # Yeni API anahtarı oluştur (32 karakterlik)
     api_key = hashlib.sha256(os.urandom(32)).hexdigest()[:32]
     current_datetime = datetime.now()
     
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute(
-            "INSERT INTO api_keys (api_key, description, monthly_token_limit, is_unlimited, auto_reset, tokens_used, last_reset_date) VALUES (%s, %s, %s, %s, %s, 0, %s)",
-            (api_key, description, monthly_token_limit, is_unlimited, auto_reset, current_datetime)
+            "INSERT INTO api_keys (api_key, description, monthly_token_limit, is_unlimited, unlimited_ips, auto_reset, tokens_used, last_reset_date) VALUES (%s, %s, %s, %s, %s, %s, 0, %s)",
+            (api_key, description, monthly_token_limit, is_unlimited, unlimited_ips, auto_reset, current_datetime)
         )
-        conn.commit()
+        publish_api_key_invalidations(cursor, [(None, api_key)])
+        conn.commit_now()
+        
+        # Aynı anahtar için önbellekte tutulan "bulunamadı" kaydını temizle
+        if API_KEY_CACHE is not None:
+            API_KEY_CACHE.invalidate(api_key=api_key)
         
         return jsonify({"message": "API anahtarı başarıyla oluşturuldu.", "api_key": api_key})
     except Exception as e:
@@ -956,14 +3930,41 @@ def create_api_key():
 @app.route('/admin/list_ip_usage')
 @admin_required
 def list_ip_usage():
-    """IP kullanım bilgilerini listele"""
-    conn = DB_POOL.get_connection()
+    """
+    IP kullanım bilgilerini sayfa sayfa listele.
+    
+    Sorgu parametreleri: sort (request_count, tokens_used, ip_address, id), order (asc, desc),
+    limit, cursor (önceki yanıttaki next_cursor), ip_prefix, min_requests ve min_tokens_used.
+    """
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
-        cursor.execute("SELECT * FROM ip_rate_limits ORDER BY request_count DESC")
-        ip_usage = cursor.fetchall()
-        return jsonify({"ip_usage": ip_usage})
+        conditions, params = [], []
+        
+        ip_prefix = request.args.get("ip_prefix", "").strip()
+        if ip_prefix:
+            conditions.append("ip_address LIKE %s")
+            params.append(f"{escape_like(ip_prefix)}%")
+        
+        min_requests = int_query_arg("min_requests")
+        if min_requests is not None:
+            conditions.append("request_count >= %s")
+            params.append(min_requests)
+        
+        min_tokens_used = int_query_arg("min_tokens_used")
+        if min_tokens_used is not None:
+            conditions.append("tokens_used >= %s")
+            params.append(min_tokens_used)
+        
+        ip_usage, next_cursor = fetch_keyset_page(
+            cursor, "ip_rate_limits",
+            {"request_count": int, "tokens_used": int, "ip_address": str, "id": int},
+            "request_count", conditions, params
+        )
+        return jsonify({"ip_usage": ip_usage, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"IP kullanım bilgileri listelenirken hata: {e}")
         return jsonify({"error": "IP kullanım bilgileri alınırken bir hata oluştu."}), 500
@@ -982,7 +3983,11 @@ def update_api_key(key_id):
     auto_reset = data.get('auto_reset')
     monthly_token_limit = data.get('monthly_token_limit')
     
-    conn = DB_POOL.get_connection()
+    unlimited_ips, error = parse_unlimited_ips(data.get('unlimited_ips'))
+    if error:
+        return jsonify({"error": error}), 400
+    
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -1016,6 +4021,11 @@ def update_api_key(key_id):
             update_fields.append("monthly_token_limit = %s")
             update_values.append(monthly_token_limit)
         
+        # Boş liste gönderildiyse sınırsız IP listesi temizlenir
+        if 'unlimited_ips' in data:
+            update_fields.append("unlimited_ips = %s")
+            update_values.append(unlimited_ips)
+        
         # Güncellenecek alan yoksa hata döndür
         if not update_fields:
             return jsonify({"error": "Güncellenecek alan belirtilmedi."}), 400
@@ -1026,7 +4036,15 @@ def update_api_key(key_id):
         
         logger.info(f"Güncelleme SQL: {sql}, değerler: {update_values}")
         cursor.execute(sql, update_values)
-        conn.commit()
+        publish_api_key_invalidations(cursor, [(key_id, key_exists['api_key'])])
+        # Önbellek ve dilim, güncelleme commit edildikten sonra bırakılır
+        conn.commit_now()
+        
+        if API_KEY_CACHE is not None:
+            API_KEY_CACHE.invalidate(api_key=key_exists['api_key'])
+        # Yeni limitle yeniden kiralanması için yerel dilimi iade et
+        if QUOTA_LEASES is not None:
+            QUOTA_LEASES.release("key", key_id)
         
         # API anahtarı zaten var olduğu kontrol edildi, bu nedenle rowcount kontrolü yapmadan başarılı yanıt dönüyoruz
         return jsonify({"message": "API anahtarı başarıyla güncellendi."})
@@ -1042,16 +4060,19 @@ def update_api_key(key_id):
 @admin_required
 def reset_ip_limits(ip_address):
     """IP adresinin limitlerini sıfırla"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
     current_datetime = datetime.now()
     
     try:
         cursor.execute(
-            "UPDATE ip_rate_limits SET tokens_used = 0, request_count = 0, last_reset_date = %s WHERE ip_address = %s",
+            "UPDATE ip_rate_limits SET tokens_used = 0, leased_tokens = 0, request_count = 0, last_reset_date = %s WHERE ip_address = %s",
             (current_datetime, ip_address)
         )
-        conn.commit()
+        conn.commit_now()
+        
+        if IP_RATE_LIMITER is not None:
+            IP_RATE_LIMITER.reset(ip_address)
         
         if cursor.rowcount > 0:
             return jsonify({"message": f"{ip_address} için kullanım limitleri başarıyla sıfırlandı."})
@@ -1064,11 +4085,30 @@ def reset_ip_limits(ip_address):
         cursor.close()
         conn.close()
 
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+@admin_required
+def request_profiler():
+    """Profilleyici durumunu döndür ya da sonraki N tahmin isteği için profillemeyi aç"""
+    if REQUEST_PROFILER is None:
+        return jsonify({"error": "Profilleyici kapalı"}), 503
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            REQUEST_PROFILER.arm(data.get('requests', 0), data.get('mode', 'cprofile'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except OSError as e:
+            logger.error(f"Profil klasörü oluşturulurken hata: {e}")
+            return jsonify({"error": "Profil klasörü oluşturulamadı."}), 500
+    
+    return jsonify(REQUEST_PROFILER.stats())
+
 @app.route('/admin/usage_summary')
 @admin_required
 def usage_summary():
     """API kullanım özetini al"""
-    conn = DB_POOL.get_connection()
+    conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -1092,37 +4132,81 @@ def usage_summary():
         result = cursor.fetchone()
         summary["total_ips"] = result["count"] if result else 0
         
+        # Sayımlar log tablosu yerine saatlik/günlük özet tablolarından okunur
+        now = datetime.now()
+        month_start = now - timedelta(days=30)
+        
         # Bugünkü istek sayısı
-        cursor.execute("SELECT COUNT(*) as count FROM api_usage_logs WHERE DATE(created_at) = CURDATE()")
+        cursor.execute(
+            "SELECT request_count FROM usage_rollup_daily WHERE bucket_start = %s AND scope = 'all' AND scope_id = ''",
+            (now.date(),)
+        )
         result = cursor.fetchone()
-        summary["today_requests"] = result["count"] if result else 0
+        summary["today_requests"] = result["request_count"] if result else 0
         
         # Son 30 gündeki istek sayısı
-        cursor.execute("SELECT COUNT(*) as count FROM api_usage_logs WHERE created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)")
+        cursor.execute(
+            "SELECT CAST(COALESCE(SUM(request_count), 0) AS UNSIGNED) as count FROM usage_rollup_hourly WHERE scope = 'all' AND bucket_start >= %s",
+            (month_start.replace(minute=0, second=0, microsecond=0),)
+        )
         result = cursor.fetchone()
         summary["monthly_requests"] = result["count"] if result else 0
         
-        # En çok kullanılan API anahtarları (top 5)
+        # En çok kullanılan API anahtarları (son 30 gün, top 5; tüm zamanlar değil, günlük özetlerin toplamı)
         cursor.execute("""
-            SELECT api_key_id, COUNT(*) as usage_count 
-            FROM api_usage_logs 
-            WHERE api_key_id IS NOT NULL
-            GROUP BY api_key_id 
+            SELECT CAST(scope_id AS UNSIGNED) as api_key_id, CAST(SUM(request_count) AS UNSIGNED) as usage_count 
+            FROM usage_rollup_daily 
+            WHERE scope = 'key' AND bucket_start >= %s
+            GROUP BY scope_id 
             ORDER BY usage_count DESC 
             LIMIT 5
-        """)
+        """, (month_start.date(),))
         summary["top_api_keys"] = cursor.fetchall()
         
-        # En çok istek yapan IP'ler (top 5)
+        # En çok istek yapan IP'ler (son 30 gün, top 5)
         cursor.execute("""
-            SELECT request_ip, COUNT(*) as usage_count 
-            FROM api_usage_logs 
-            GROUP BY request_ip 
+            SELECT scope_id as request_ip, CAST(SUM(request_count) AS UNSIGNED) as usage_count 
+            FROM usage_rollup_daily 
+            WHERE scope = 'ip' AND bucket_start >= %s
+            GROUP BY scope_id 
             ORDER BY usage_count DESC 
             LIMIT 5
-        """)
+        """, (month_start.date(),))
         summary["top_ips"] = cursor.fetchall()
         
+        # Tahmin önbelleği istatistikleri
+        summary["prediction_cache"] = PREDICTION_CACHE.stats() if PREDICTION_CACHE is not None else None
+        
+        # Kaskad istatistikleri
+        summary["cascade"] = FAST_TIER.stats() if FAST_TIER is not None else None
+        
+        # Veritabanı havuzu bekleme istatistikleri
+        summary["db_pool"] = db_pool_stats()
+        
+        # Kota kiralama istatistikleri
+        summary["quota_leases"] = QUOTA_LEASES.stats() if QUOTA_LEASES is not None else None
+        
+        # Bellek içi IP hız sınırlayıcı istatistikleri
+        summary["ip_rate_limiter"] = IP_RATE_LIMITER.stats() if IP_RATE_LIMITER is not None else None
+        
+        # Toplu kota sıfırlama işi istatistikleri
+        summary["quota_reset"] = QUOTA_RESET.stats() if QUOTA_RESET is not None else None
+        
+        # Log saklama işi istatistikleri
+        summary["usage_retention"] = USAGE_RETENTION.stats() if USAGE_RETENTION is not None else None
+        
+        # Write-behind kullanım yazıcısı istatistikleri
+        summary["usage_writer"] = USAGE_WRITER.stats() if USAGE_WRITER is not None else None
+        
+        # API anahtarı önbelleği istatistikleri
+        summary["api_key_cache"] = API_KEY_CACHE.stats() if API_KEY_CACHE is not None else None
+        
+        # Çıkarım yürütücüsü kuyruk ve ret istatistikleri
+        summary["inference_executor"] = INFERENCE_EXECUTOR.stats() if INFERENCE_EXECUTOR is not None else None
+        
+        # Mikro-batch zamanlayıcı istatistikleri
+        summary["micro_batch"] = SCHEDULER.stats() if SCHEDULER is not None else None
+        
         return jsonify(summary)
     except Exception as e:
         logger.error(f"Kullanım özeti alınırken hata: {e}")
@@ -1131,37 +4215,165 @@ def usage_summary():
         cursor.close()
         conn.close()
 
-def load_model(model_path):
+# INT8 modelin fp32 modelle uyumunu ölçmek için varsayılan örnek metinler
+QUANTIZATION_SAMPLE_TEXTS = [
+    "Bugün hava çok güzel, parkta yürüyüş yaptık.",
+    "Toplantı yarın saat üçte başlayacak.",
+    "Bu filmi herkese tavsiye ederim, harika bir yapım.",
+    "Sen tam bir aptalsın, hiçbir şeyden anlamıyorsun.",
+    "Bu takımın taraftarları da oyuncuları gibi beceriksiz.",
+    "Hakem maçı resmen katletti, rezalet!",
+    "Kargom hâlâ gelmedi, müşteri hizmetleri cevap vermiyor.",
+    "Yeni çıkan telefonun kamerası gerçekten çok iyi.",
+    "Senin gibilerle aynı ortamda bulunmak istemiyorum.",
+    "Kahrolsun bu düzen, hepsi yalancı!",
+    "Annemin yaptığı yemeklerin tadı hiçbir yerde yok.",
+    "Bu ne biçim yorum, cahil cahil konuşma."
+]
+
+def compute_model_version(model_state_path):
+    """Ağırlık dosyasının yolu, boyutu ve değişiklik zamanından kısa bir sürüm kimliği üret"""
+    state_stat = os.stat(model_state_path)
+    return hashlib.sha256(
+        f"{os.path.abspath(model_state_path)}:{state_stat.st_size}:{state_stat.st_mtime_ns}".encode("utf-8")
+    ).hexdigest()[:16]
+
+def load_fp32_model(model_path, tokenizer, device=None):
+    """fp32 HierarchicalOffensiveClassifier modelini ağırlıklarıyla birlikte yükle"""
+    # Özel model sınıfı örneğini oluştur - vocab_size parametresini geç
+    model = HierarchicalOffensiveClassifier(model_path, num_labels=len(LABELS), vocab_size=len(tokenizer))
+    logger.info(f"Model sınıfı başlatıldı")
+    
+    # Modelin durumunu yükle
+    model_state_path = f"{model_path}/pytorch_model.bin"
+    logger.info(f"Model durumu yükleniyor: {model_state_path}")
+    
+    # Modelin kelime dağarcığı boyutunu kontrol et
+    if hasattr(model.bert.embeddings.word_embeddings, 'weight'):
+        vocab_size_model = model.bert.embeddings.word_embeddings.weight.size(0)
+        logger.info(f"Model kelime dağarcığı boyutu: {vocab_size_model}")
+    
+    # GPU'da eğitilmiş modeli CPU'da çalıştırmak için map_location parametresi eklendi
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.load_state_dict(torch.load(model_state_path, map_location=device), strict=False)
+    model.to(device)
+    
+    logger.info(f"Model durumu yüklendi")
+    
+    # Modeli değerlendirme moduna geçir
+    model.eval()
+    return model
+
+def quantize_model(model):
+    """Encoder'daki ve sınıflandırma başlıklarındaki tüm nn.Linear katmanlarını dinamik INT8'e çevir"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def measure_agreement(reference_model, candidate_model, tokenizer, texts):
+    """İki modelin aynı metinlerdeki tahminlerinin ne oranda örtüştüğünü ölç"""
+    reference = predict_offensive_content_batch(reference_model, tokenizer, texts)
+    candidate = predict_offensive_content_batch(candidate_model, tokenizer, texts)
+    keys = ['offensive_pred', 'targeted_pred', 'target_type_pred', 'multi_label_preds', 'difficulty_pred']
+    
+    offensive_matches = sum(r['offensive_pred'] == c['offensive_pred'] for r, c in zip(reference, candidate))
+    full_matches = sum(all(r[key] == c[key] for key in keys) for r, c in zip(reference, candidate))
+    
+    return {
+        "samples": len(texts),
+        "offensive_agreement": offensive_matches / len(texts),
+        "full_agreement": full_matches / len(texts)
+    }
+
+def load_quantized_model(model_path, tokenizer, source_version, quantized_path=None, sample_texts=None):
+    """
+    Dinamik INT8 modeli yükle.
+    
+    quantized_path mevcutsa ve aynı fp32 ağırlıklarından üretilmişse doğrudan yüklenir;
+    aksi halde fp32 model dönüştürülür, örnek metinlerde uyum oranı ölçülür ve
+    (yol verildiyse) sonraki açılışlar için kaydedilir.
+    """
+    if quantized_path and os.path.exists(quantized_path):
+        # Kendi ürettiğimiz dosya; paketlenmiş INT8 parametreleri için weights_only kapalı
+        artifact = torch.load(quantized_path, map_location="cpu", weights_only=False)
+        
+        if artifact.get('source_version') == source_version:
+            model = HierarchicalOffensiveClassifier(None, num_labels=len(LABELS), config=BertConfig.from_dict(artifact['bert_config']))
+            model = quantize_model(model)
+            model.load_state_dict(artifact['state_dict'])
+            model.eval()
+            
+            agreement = artifact['agreement']
+            logger.info(f"INT8 model '{quantized_path}' dosyasından yüklendi. fp32 ile uyum oranı: "
+                        f"saldırganlık={agreement['offensive_agreement']:.3f}, tüm başlıklar={agreement['full_agreement']:.3f} "
+                        f"({agreement['samples']} örnek)")
+            return model
+        
+        logger.warning(f"'{quantized_path}' farklı bir model sürümünden üretilmiş, INT8 dönüşümü yeniden yapılacak")
+    
+    # Dinamik INT8 çekirdekleri yalnızca CPU'da çalışır
+    fp32_model = load_fp32_model(model_path, tokenizer, device=torch.device("cpu"))
+    model = quantize_model(fp32_model)
+    model.eval()
+    
+    agreement = measure_agreement(fp32_model, model, tokenizer, sample_texts or QUANTIZATION_SAMPLE_TEXTS)
+    logger.info(f"INT8 dönüşümü tamamlandı. fp32 ile uyum oranı: saldırganlık={agreement['offensive_agreement']:.3f}, "
+                f"tüm başlıklar={agreement['full_agreement']:.3f} ({agreement['samples']} örnek)")
+    
+    if quantized_path:
+        torch.save({
+            'state_dict': model.state_dict(),
+            'bert_config': fp32_model.bert.config.to_dict(),
+            'source_version': source_version,
+            'agreement': agreement
+        }, quantized_path)
+        logger.info(f"INT8 model kaydedildi: {quantized_path}")
+    
+    return model
+
+def load_model(model_path, quantize=None, quantized_path=None, sample_texts=None, backend="torch", onnx_path=None,
+               early_exit_threshold=None):
     """Modeli ve tokenizer'ı yükle"""
-    global MODEL, TOKENIZER
+    global MODEL, TOKENIZER, MODEL_VERSION
     
     try:
         # Tokenizer'ı yükle
         TOKENIZER = AutoTokenizer.from_pretrained(model_path)
         logger.info(f"Tokenizer yüklendi. Kelime dağarcığı boyutu: {len(TOKENIZER)}")
         
-        # Özel model sınıfı örneğini oluştur - vocab_size parametresini geç
-        MODEL = HierarchicalOffensiveClassifier(model_path, num_labels=len(LABELS), vocab_size=len(TOKENIZER))
-        logger.info(f"Model sınıfı başlatıldı")
-        
-        # Modelin durumunu yükle
-        model_state_path = f"{model_path}/pytorch_model.bin"
-        logger.info(f"Model durumu yükleniyor: {model_state_path}")
+        if backend == "onnxruntime":
+            onnx_path = onnx_path or f"{model_path}/model.onnx"
+            if quantize and quantize != "none":
+                logger.warning("Niceleme yalnızca torch arka ucunda desteklenir, ONNX modeli olduğu gibi kullanılacak")
+            if early_exit_threshold is not None:
+                logger.warning("Erken çıkış yalnızca torch arka ucunda desteklenir, ONNX modeli tüm katmanları çalıştıracak")
+            MODEL = OnnxRuntimeModel(onnx_path)
+            MODEL_VERSION = f"{compute_model_version(onnx_path)}-onnx"
+            
+            if PREDICTION_CACHE is not None:
+                PREDICTION_CACHE.set_model_version(MODEL_VERSION)
+            
+            logger.info(f"Tokenizer '{model_path}', ONNX modeli '{onnx_path}' konumundan başarıyla yüklendi")
+            return
         
-        # Modelin kelime dağarcığı boyutunu kontrol et
-        if hasattr(MODEL.bert.embeddings.word_embeddings, 'weight'):
-            vocab_size_model = MODEL.bert.embeddings.word_embeddings.weight.size(0)
-            logger.info(f"Model kelime dağarcığı boyutu: {vocab_size_model}")
+        # Model sürümünü ağırlık dosyasından türet; yeniden yüklemede önbellek geçersiz olur
+        MODEL_VERSION = compute_model_version(f"{model_path}/pytorch_model.bin")
         
-        # GPU'da eğitilmiş modeli CPU'da çalıştırmak için map_location parametresi eklendi
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        MODEL.load_state_dict(torch.load(model_state_path, map_location=device), strict=False)
-        MODEL.to(device)
+        if quantize == "int8":
+            MODEL = load_quantized_model(model_path, TOKENIZER, MODEL_VERSION, quantized_path, sample_texts)
+            MODEL_VERSION = f"{MODEL_VERSION}-int8"
+        else:
+            MODEL = load_fp32_model(model_path, TOKENIZER)
         
-        logger.info(f"Model durumu yüklendi")
+        # Erken çıkışı yalnızca çıkış sınıflandırıcıları eğitilmiş modellerde aç
+        if early_exit_threshold is not None:
+            if len(MODEL.exit_classifiers) > 0:
+                MODEL.early_exit_threshold = early_exit_threshold
+                MODEL_VERSION = f"{MODEL_VERSION}-exit{early_exit_threshold}"
+                logger.info(f"Erken çıkış açık: katmanlar={sorted(int(layer) for layer in MODEL.exit_classifiers)}, eşik={early_exit_threshold}")
+            else:
+                logger.warning("Modelde erken çıkış sınıflandırıcısı yok (train.py --early_exit_layers), erken çıkış kapalı")
         
-        # Modeli değerlendirme moduna geçir
-        MODEL.eval()
+        if PREDICTION_CACHE is not None:
+            PREDICTION_CACHE.set_model_version(MODEL_VERSION)
         
         logger.info(f"Model ve tokenizer '{model_path}' konumundan başarıyla yüklendi")
     except Exception as e:
@@ -1214,38 +4426,440 @@ def get_client_ip():
     # Hiçbir header bulunamazsa varsayılan olarak remote_addr'i döndür
     return request.remote_addr
 
-if __name__ == "__main__":
-    # Argüman ayrıştırıcı
+def validate_service_args(args):
+    """Argümanların birbirleriyle ve değer aralıklarıyla uyumunu kontrol et; hata mesajı ya da None döndür"""
+    # Erken çıkan örnekler "saldırgan değil" kabul edildiğinden eşik 0.5'in üzerinde olmalı
+    if args.early_exit_threshold is not None and not 0.5 < args.early_exit_threshold <= 1:
+        return "--early_exit_threshold 0.5 ile 1 arasında olmalı"
+    return None
+
+def configure_service(args, model_loader=None):
+    """
+    Argümanlara göre süreç içi servis bileşenlerini kur ve modeli yükle.
+    
+    Komut satırı girişi ve bench/load_test.py aynı kurulumu kullanır; metrikler, veritabanı
+    havuzu ve sunucu çağıranda kalır. model_loader(args, sample_texts) verilirse model
+    load_model yerine onunla yüklenir (ör. eğitilmiş ağırlık olmadan yük testi).
+    """
+    global SERVER_TIMING, REQUEST_PROFILER, API_KEY_CACHE, PREDICTION_CACHE, BATCH_CHUNK_SIZE, FAST_TIER
+    
+    # Server-Timing başlığı ve admin tarafından açılabilen istek profilleyicisi
+    SERVER_TIMING = not args.disable_server_timing
+    REQUEST_PROFILER = RequestProfiler(args.profile_dir)
+    
+    # API anahtarı kayıtlarını her istekte veritabanından okumamak için önbellek
+    if args.api_key_cache_ttl > 0:
+        API_KEY_CACHE = ApiKeyCache(ttl_seconds=args.api_key_cache_ttl, sync_interval=args.api_key_cache_sync_seconds)
+    
+    # Tahmin önbelleğini oluştur (model sürümü yüklemede atanır)
+    if args.cache_size > 0:
+        PREDICTION_CACHE = PredictionCache(
+            max_entries=args.cache_size,
+            ttl_seconds=args.cache_ttl,
+            max_memory_mb=args.cache_memory_mb,
+            disk_path=args.cache_db,
+            max_disk_entries=args.cache_db_max_entries
+        )
+    
+    # INT8 uyum kontrolü için örnek metinler
+    sample_texts = None
+    if args.quantize_sample_file:
+        with open(args.quantize_sample_file, 'r', encoding='utf-8') as f:
+            sample_texts = [line.strip() for line in f if line.strip()]
+    
+    # Modeli yükle
+    model_load_started = time.perf_counter()
+    if model_loader is not None:
+        model_loader(args, sample_texts)
+    else:
+        load_model(args.model_path, quantize=args.quantize, quantized_path=args.quantized_path, sample_texts=sample_texts,
+                   backend=args.backend, onnx_path=args.onnx_path, early_exit_threshold=args.early_exit_threshold)
+    if METRICS is not None:
+        METRICS.model_load_seconds.set(time.perf_counter() - model_load_started)
+    
+    # Model yolunu app.config'e ekle
+    app.config['MODEL_PATH'] = args.model_path
+    BATCH_CHUNK_SIZE = args.batch_chunk_size
+    
+    # Kaskad için hızlı birinci aşama modeli yükle
+    if args.cascade:
+        FAST_TIER = FastTierClassifier(args.fast_model_path, confidence_threshold=args.cascade_threshold)
+
+def start_worker_services(args):
+    """Süreç başına çalışan arka plan iş parçacıklarını başlat (pre-fork modunda her işçide fork sonrasında)"""
+    global SCHEDULER, INFERENCE_EXECUTOR, USAGE_WRITER, IP_RATE_LIMITER, QUOTA_LEASES, USAGE_RETENTION, QUOTA_RESET
+    
+    # Diğer süreçlerin anahtar geçersiz kılma olaylarını izle
+    if API_KEY_CACHE is not None:
+        API_KEY_CACHE.start()
+    
+    # Kotanın bir dilimini düğümde kiralayıp yerelde harca
+    if args.quota_lease_fraction > 0:
+        QUOTA_LEASES = QuotaLeaseManager(
+            fraction=args.quota_lease_fraction,
+            low_watermark=args.quota_lease_low_watermark
+        ).start()
+    
+    # Anonim IP istek sınırı için bellek içi kayan pencere sınırlayıcı
+    if args.ip_rate_limiter == "memory":
+        IP_RATE_LIMITER = SlidingWindowRateLimiter(
+            max_tracked=args.ip_rate_max_tracked,
+            sync_interval=args.ip_rate_sync_seconds
+        ).start()
+    
+    # Kullanım sayaçları ve loglar için write-behind yazıcıyı başlat
+    if args.usage_flush_ms > 0:
+        USAGE_WRITER = UsageWriter(
+            flush_interval_ms=args.usage_flush_ms,
+            max_events=args.usage_flush_events,
+            max_pending=args.usage_max_pending
+        ).start()
+    
+    # 30 günlük kota dönemlerini toplu sıfırlayan iş (aynı anda tek süreç çalışır)
+    if args.quota_reset_interval > 0:
+        QUOTA_RESET = QuotaResetJob(
+            interval_seconds=args.quota_reset_interval,
+            batch_size=args.quota_reset_batch_size
+        ).start()
+    
+    # Eski kullanım loglarını arşivleyip silen iş (aynı anda tek süreç çalışır)
+    if args.retention_interval_hours > 0:
+        USAGE_RETENTION = create_retention_job(args).start()
+    
+    # Model çağrıları için sınırlı kuyruklu çıkarım yürütücüsünü başlat
+    if args.inference_concurrency > 0:
+        INFERENCE_EXECUTOR = InferenceExecutor(
+            max_concurrency=args.inference_concurrency,
+            max_queue_size=args.inference_queue_size,
+            queue_timeout_ms=args.inference_queue_timeout_ms
+        ).start()
+    
+    # Eşzamanlı tekil istekler için mikro-batch zamanlayıcıyı başlat
+    if args.max_batch_size > 1:
+        SCHEDULER = MicroBatchScheduler(
+            lambda texts: run_inference(predict_offensive_content_batch, MODEL, TOKENIZER, texts),
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            # Yürütücü açıksa batch'ler onun eşzamanlılığı kadar paralel çalışabilir
+            max_in_flight=max(1, args.inference_concurrency),
+            # Yürütücüye en fazla max_in_flight iş ulaştığından kuyruk ve bekleme sınırı burada da uygulanır
+            max_queue_size=args.inference_queue_size * args.max_batch_size if INFERENCE_EXECUTOR is not None else 0,
+            queue_timeout_ms=args.inference_queue_timeout_ms if INFERENCE_EXECUTOR is not None else None,
+            retry_after=INFERENCE_EXECUTOR.retry_after if INFERENCE_EXECUTOR is not None else None
+        ).start()
+
+def create_retention_job(args):
+    """Komut satırı argümanlarından log saklama işini oluştur"""
+    return UsageRetentionJob(
+        retention_days=args.retention_days,
+        archive_dir=args.archive_dir,
+        archive_format=args.archive_format,
+        batch_size=args.retention_batch_size,
+        batch_pause_ms=args.retention_batch_pause_ms,
+        interval_hours=args.retention_interval_hours
+    )
+
+def stop_worker_services():
+    """Kapanışta kullanılmayan kota dilimlerini iade et, tamponlanmış kayıtları ve IP sayaçlarını yaz"""
+    if USAGE_RETENTION is not None:
+        USAGE_RETENTION.stop()
+    if API_KEY_CACHE is not None:
+        API_KEY_CACHE.stop()
+    if QUOTA_RESET is not None:
+        QUOTA_RESET.stop()
+    if QUOTA_LEASES is not None:
+        QUOTA_LEASES.release_all()
+    if IP_RATE_LIMITER is not None:
+        IP_RATE_LIMITER.stop()
+    if USAGE_WRITER is not None:
+        USAGE_WRITER.stop()
+        logger.info("Bekleyen kullanım kayıtları yazıldı")
+
+def create_listen_socket(host, port, backlog=1024):
+    """İşçi süreçlerin ortak kullanacağı dinleme soketini oluştur"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def run_worker(slot, sock, args):
+    """Fork edilmiş işçi süreçte bağlantıları kur ve ortak soket üzerinden waitress çalıştır"""
+    global MODEL
+    from waitress import serve
+    
+    # Ctrl+C ebeveyn tarafından yönetilir; SIGTERM waitress döngüsünü düzgünce kapatır
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    torch.set_num_threads(args.threads_per_worker)
+    
+    # ONNX Runtime iş parçacığı havuzu fork sonrasında kullanılamaz, oturum işçide yeniden kurulur
+    if isinstance(MODEL, OnnxRuntimeModel):
+        MODEL = OnnxRuntimeModel(MODEL.onnx_path, num_threads=args.threads_per_worker)
+    
+    # Ağ bağlantıları ve iş parçacıkları fork ile aktarılmaz, her işçi kendininkini oluşturur
+    init_db_pool(create_tables=False)
+    start_worker_services(args)
+    
+    logger.info(f"İşçi {slot} başlatıldı (pid={os.getpid()}, torch iş parçacığı={args.threads_per_worker})")
+    try:
+        serve(app, sockets=[sock], threads=args.threads, trusted_proxy='*')
+    finally:
+        stop_worker_services()
+
+def serve_prefork(args):
+    """
+    Pre-fork çok süreçli sunum.
+    
+    Model ebeveyn süreçte bir kez yüklenir ve işçilere fork ile aktarılır; ağırlıklara
+    yazılmadığı için bellek sayfaları kopyala-yaz ile işçiler arasında paylaşılır. Her işçi
+    kendi torch iş parçacığı bütçesiyle aynı dinleme soketinden bağlantı kabul eder.
+    Beklenmedik şekilde sonlanan işçiler yeniden başlatılır.
+    """
+    import waitress  # noqa: F401 - yoksa işçiler sürekli çöküp yeniden başlatılmasın
+    
+    sock = create_listen_socket(args.host, args.port)
+    
+    # Yükleme sırasında oluşan nesneleri dondur; GC taraması paylaşılan sayfaları kopyalatmasın
+    gc.collect()
+    gc.freeze()
+    
+    workers = {}
+    stopping = False
+    
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                run_worker(slot, sock, args)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                logger.error(f"İşçi {slot} hata ile sonlandı", exc_info=True)
+                exit_code = 1
+            finally:
+                logging.shutdown()
+                os._exit(exit_code)
+        workers[pid] = (slot, time.monotonic())
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    for slot in range(args.workers):
+        spawn(slot)
+    logger.info(f"Uygulama {args.workers} işçi süreçle başlatıldı (port: {args.port}, işçi başına torch iş parçacığı: {args.threads_per_worker})")
+    
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot, started_at = workers.pop(pid, (None, None))
+        if METRICS is not None:
+            METRICS.mark_process_dead(pid)
+        if slot is None or stopping:
+            continue
+        
+        logger.warning(f"İşçi {slot} (pid={pid}) beklenmedik şekilde sonlandı (çıkış kodu: {os.waitstatus_to_exitcode(status)}), yeniden başlatılıyor")
+        # Açılışta sürekli çöken işçiler ebeveyni meşgul etmesin
+        if time.monotonic() - started_at < 5:
+            time.sleep(1)
+        spawn(slot)
+    
+    sock.close()
+    logger.info("Tüm işçiler durduruldu")
+
+def build_arg_parser():
+    """Sunucunun komut satırı argümanları (bench/load_test.py de aynı ayrıştırıcıyı kullanır)"""
     parser = argparse.ArgumentParser(description="Türkçe saldırgan içerik sınıflandırması API")
     parser.add_argument("--model_path", type=str, default="./offensive_model_hierarchical", 
                         help="Eğitilmiş model klasörü")
     parser.add_argument("--host", type=str, default="0.0.0.0", help="API host adresi")
     parser.add_argument("--port", type=int, default=5000, help="API port numarası")
     parser.add_argument("--watch", action="store_true", help="Dosya değişikliklerini izle ve otomatik yeniden başlat")
+    parser.add_argument("--max_batch_size", type=int, default=16,
+                        help="Eşzamanlı /predict isteklerinin toplanacağı en büyük batch boyutu (1: mikro-batch kapalı)")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0,
+                        help="Mikro-batch için ilk istekten sonra beklenecek en uzun süre (milisaniye)")
+    parser.add_argument("--batch_chunk_size", type=int, default=32,
+                        help="Toplu tahminde tek ileri geçişte işlenecek en fazla metin sayısı")
+    parser.add_argument("--cache_size", type=int, default=10000,
+                        help="Tahmin önbelleğindeki en fazla kayıt sayısı (0: önbellek kapalı)")
+    parser.add_argument("--cache_ttl", type=int, default=3600, help="Önbellek kayıtlarının yaşam süresi (saniye)")
+    parser.add_argument("--cache_memory_mb", type=float, default=64, help="Önbelleğin bellekte kullanabileceği en fazla alan (MB)")
+    parser.add_argument("--cache_db", type=str, default=None,
+                        help="Süreçler arasında paylaşılan SQLite önbellek dosyası (verilmezse yalnızca bellek kullanılır)")
+    parser.add_argument("--cache_db_max_entries", type=int, default=100000,
+                        help="SQLite önbellek dosyasında tutulacak en fazla kayıt sayısı")
+    parser.add_argument("--quantize", type=str, choices=["none", "int8"], default="none",
+                        help="CPU çıkarımı için dinamik niceleme (int8: encoder ve sınıflandırıcı Linear katmanları)")
+    parser.add_argument("--quantized_path", type=str, default=None,
+                        help="INT8 modelin kaydedileceği/yükleneceği dosya (açılışta dönüşümü tekrarlamamak için)")
+    parser.add_argument("--quantize_sample_file", type=str, default=None,
+                        help="INT8-fp32 uyum oranının ölçüleceği örnek metin dosyası (her satır bir örnek)")
+    parser.add_argument("--backend", type=str, choices=["torch", "onnxruntime"], default="torch",
+                        help="Çıkarım arka ucu (onnxruntime için önce export_onnx.py ile model dışa aktarılmalı)")
+    parser.add_argument("--onnx_path", type=str, default=None,
+                        help="ONNX model dosyası (varsayılan: <model_path>/model.onnx)")
+    parser.add_argument("--early_exit_threshold", type=float, default=None,
+                        help="Ara katmanın \"saldırgan değil\" güveni bu eşiği geçerse kalan katmanlar atlanır (örn. 0.95; verilmezse kapalı)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Hızlı modelin emin olduğu metinleri BERT'e göndermeden yanıtla (train.py --fast_model)")
+    parser.add_argument("--fast_model_path", type=str, default="./offensive_model_fast.joblib", help="Hızlı model dosyası")
+    parser.add_argument("--cascade_threshold", type=float, default=None,
+                        help="Hızlı model güven eşiği (verilmezse eğitimde hedef uyum oranına göre seçilen eşik)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Modeli paylaşan işçi süreç sayısı (1: tek süreç; yalnızca üretim modunda)")
+    parser.add_argument("--threads_per_worker", type=int, default=None,
+                        help="Her işçinin torch iş parçacığı sayısı (verilmezse pre-fork modunda çekirdek sayısı / işçi sayısı, tek süreçte torch varsayılanı)")
+    parser.add_argument("--threads", type=int, default=8, help="Her süreçteki waitress istek iş parçacığı sayısı")
+    parser.add_argument("--inference_concurrency", type=int, default=2,
+                        help="Aynı anda çalışabilecek model çağrısı sayısı (0: çıkarım yürütücüsü kapalı)")
+    parser.add_argument("--inference_queue_size", type=int, default=32,
+                        help="Başlamayı bekleyebilecek en fazla model çağrısı (dolunca istekler 503 alır)")
+    parser.add_argument("--inference_queue_timeout_ms", type=float, default=1000,
+                        help="Kuyruktaki çağrının başlaması için beklenecek en uzun süre (aşılırsa 503)")
+    parser.add_argument("--usage_flush_ms", type=float, default=250,
+                        help="Kullanım sayaçları ve logların toplu yazılma aralığı (milisaniye, 0: her istekte doğrudan yaz)")
+    parser.add_argument("--usage_flush_events", type=int, default=500,
+                        help="Bu kadar kullanım olayı biriktiğinde aralığı beklemeden yaz")
+    parser.add_argument("--usage_max_pending", type=int, default=50000,
+                        help="Veritabanına yazılamadığında bellekte tutulacak en fazla log kaydı")
+    parser.add_argument("--ip_rate_limiter", type=str, choices=["memory", "database"], default="memory",
+                        help="Anonim IP istek sınırının tutulduğu yer (memory: süreç içi kayan pencere, yalnızca tek süreç ve tek düğüm; "
+                             "database: ip_rate_limits tablosu)")
+    parser.add_argument("--ip_rate_max_tracked", type=int, default=100000,
+                        help="Bellek içi sınırlayıcının izleyeceği en fazla IP sayısı")
+    parser.add_argument("--ip_rate_sync_seconds", type=float, default=10,
+                        help="IP istek sayaçlarının ip_rate_limits tablosuna yazılma aralığı (saniye)")
+    parser.add_argument("--quota_lease_fraction", type=float, default=0,
+                        help="Düğümün kiralayacağı kalan kota oranı (örn. 0.05; 0: her istekte veritabanında ayır)")
+    parser.add_argument("--quota_lease_low_watermark", type=float, default=0.2,
+                        help="Dilimin bu oranının altına düşünce arka planda yenilenir")
+    parser.add_argument("--db_pool_size", type=int, default=10,
+                        help="Süreç başına MySQL bağlantı havuzu boyutu (en fazla 32)")
+    parser.add_argument("--db_pool_timeout_ms", type=float, default=2000,
+                        help="Havuz doluyken boş bağlantı için beklenecek en uzun süre (milisaniye)")
+    parser.add_argument("--api_key_cache_ttl", type=float, default=10,
+                        help="API anahtarı kayıtlarının süreç içinde önbellekte tutulma süresi (saniye, 0: kapalı)")
+    parser.add_argument("--api_key_cache_sync_seconds", type=float, default=1.0,
+                        help="Diğer süreçlerin yazdığı anahtar geçersiz kılma olaylarının okunma aralığı (saniye)")
+    parser.add_argument("--quota_reset_job", action="store_true",
+                        help="30 günlük dönemi dolan kotaları bir kez toplu sıfırla ve çık (cron için)")
+    parser.add_argument("--quota_reset_interval", type=float, default=300,
+                        help="Toplu kota sıfırlama işinin sunucu içinde çalışma aralığı (saniye, 0: kapalı)")
+    parser.add_argument("--quota_reset_batch_size", type=int, default=1000,
+                        help="Kota sıfırlamada tek işlemde güncellenecek en fazla satır")
+    parser.add_argument("--retention_job", action="store_true",
+                        help="Eski kullanım loglarını bir kez arşivleyip sil ve çık (cron için)")
+    parser.add_argument("--retention_days", type=int, default=90,
+                        help="api_usage_logs tablosunda ham olarak tutulacak gün sayısı")
+    parser.add_argument("--retention_interval_hours", type=float, default=0,
+                        help="Saklama işinin sunucu içinde çalışma aralığı (saat, 0: kapalı)")
+    parser.add_argument("--archive_dir", type=str, default="./archive",
+                        help="Silinen logların yazılacağı arşiv klasörü")
+    parser.add_argument("--archive_format", type=str, choices=["jsonl", "parquet"], default="jsonl",
+                        help="Arşiv dosya biçimi (jsonl: gzip ile sıkıştırılmış, parquet: pyarrow gerekir)")
+    parser.add_argument("--retention_batch_size", type=int, default=1000,
+                        help="Saklama işinin tek seferde okuyup sileceği satır sayısı")
+    parser.add_argument("--retention_batch_pause_ms", type=float, default=50,
+                        help="Silme parçaları arasında beklenecek süre (milisaniye)")
+    parser.add_argument("--disable_metrics", action="store_true",
+                        help="Prometheus metriklerini ve /metrics endpoint'ini kapat")
+    parser.add_argument("--metrics_dir", type=str, default=None,
+                        help="Pre-fork modunda işçi metriklerinin toplandığı klasör (verilmezse geçici klasör)")
+    parser.add_argument("--disable_server_timing", action="store_true",
+                        help="Tahmin yanıtlarına Server-Timing başlığı ekleme")
+    parser.add_argument("--profile_dir", type=str, default="./profiles",
+                        help="/admin/profiler ile açılan profillerin yazılacağı klasör")
+    return parser
+
+if __name__ == "__main__":
+    # Argüman ayrıştırıcı
+    parser = build_arg_parser()
     args = parser.parse_args()
     
+    error = validate_service_args(args)
+    if error:
+        parser.error(error)
+    
+    # Çalışma modunu al
+    env = os.getenv('FLASK_ENV', 'production')
+    prefork = args.workers > 1 and env != 'development'
+    
+    # Bellek içi pencere işçiler arasında paylaşılmaz; her IP işçi sayısı kadar kat istek yapabilirdi
+    if prefork and args.ip_rate_limiter == "memory":
+        logger.warning("Bellek içi IP sınırlayıcı işçiler arasında paylaşılmadığından pre-fork modunda veritabanı tabanlı kontrol kullanılacak")
+        args.ip_rate_limiter = "database"
+    
+    # Pre-fork modunda ebeveyn model yüklenirken tek iş parçacığıyla çalışır;
+    # fork öncesinde OpenMP havuzu oluşursa işçilerde çıkarım kilitlenir.
+    # Tek süreçte iş parçacığı sayısı yalnızca açıkça verildiğinde değiştirilir
+    if prefork:
+        if args.threads_per_worker is None:
+            args.threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+        torch.set_num_threads(1)
+    elif args.threads_per_worker:
+        torch.set_num_threads(args.threads_per_worker)
+    
+    # Metrikler havuz ve model yüklenmeden önce açılır ki bu aşamalar da ölçülsün
+    if not args.disable_metrics and not (args.quota_reset_job or args.retention_job):
+        metrics_dir = (args.metrics_dir or tempfile.mkdtemp(prefix="temizdil-metrics-")) if prefork else None
+        try:
+            METRICS = ServiceMetrics(multiprocess_dir=metrics_dir)
+        except ImportError:
+            logger.warning("Metrikler kapalı: prometheus_client bulunamadı")
+    
     # Veritabanını başlat
+    DB_POOL_SIZE = args.db_pool_size
+    DB_POOL_TIMEOUT = args.db_pool_timeout_ms / 1000.0
     init_db_pool()
     
-    # Modeli yükle
-    load_model(args.model_path)
+    # Yalnızca zamanlanmış işler istendiyse model yüklenmeden çalıştırılıp çıkılır
+    if args.quota_reset_job or args.retention_job:
+        if args.quota_reset_job:
+            QuotaResetJob(batch_size=args.quota_reset_batch_size).run_once()
+        if args.retention_job:
+            create_retention_job(args).run_once()
+        close_db_pool()
+        sys.exit(0)
     
-    # Model yolunu app.config'e ekle
-    app.config['MODEL_PATH'] = args.model_path
-   
-    # Çalışma modunu al
-    env = os.getenv('FLASK_ENV', 'production')
+    # Önbellekler, profilleyici, model ve kaskad
+    configure_service(args)
+    
+    # Arka plan iş parçacıkları pre-fork modunda her işçide ayrıca başlatılır
+    if not prefork:
+        start_worker_services(args)
+        atexit.register(stop_worker_services)
     
     if env == 'development':
         # Geliştirme modu
         logger.info("Uygulama geliştirme modunda başlatılıyor...")
         app.run(host=args.host, port=args.port, debug=True)
+    elif prefork:
+        # Üretim modu - modeli paylaşan çoklu waitress işçi süreci
+        close_db_pool()
+        serve_prefork(args)
     else:
         # Üretim modu - waitress WSGI sunucusu kullanılıyor
         try:
             from waitress import serve
             logger.info(f"Uygulama üretim modunda waitress ile başlatılıyor (port: {args.port})...")
-            serve(app, host=args.host, port=args.port, threads=8, trusted_proxy='*')
+            # SIGTERM waitress döngüsünü düzgünce kapatsın; tampondaki kayıtlar atexit ile yazılır
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            serve(app, host=args.host, port=args.port, threads=args.threads, trusted_proxy='*')
         except ImportError:
             logger.warning("Waitress yüklü değil, pip install waitress ile kurabilirsiniz.")
             logger.warning("Şimdilik geliştirme sunucusu kullanılıyor, üretim ortamında kullanmayın!")
@@ -0,0 +1,224 @@
+import functools
+import queue
+import re
+import sqlite3
+from datetime import date, datetime
+
+from mysql.connector.errors import PoolError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    api_key VARCHAR(64) NOT NULL UNIQUE,
+    description VARCHAR(255),
+    is_unlimited BOOLEAN DEFAULT FALSE,
+    unlimited_ips TEXT,
+    monthly_token_limit INT DEFAULT 1000,
+    tokens_used INT DEFAULT 0,
+    leased_tokens INT DEFAULT 0,
+    auto_reset BOOLEAN DEFAULT TRUE,
+    last_reset_date DATETIME,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS ip_rate_limits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip_address VARCHAR(45) NOT NULL UNIQUE,
+    monthly_token_limit INT DEFAULT 10000,
+    tokens_used INT DEFAULT 0,
+    leased_tokens INT DEFAULT 0,
+    request_count INT DEFAULT 0,
+    last_request_time TIMESTAMP,
+    last_reset_date DATETIME,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS api_usage_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    api_key_id INT,
+    request_ip VARCHAR(45),
+    endpoint VARCHAR(255),
+    text_length INT,
+    tokens_used INT,
+    is_successful BOOLEAN,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_usage_logs_created_at ON api_usage_logs (created_at);
+CREATE TABLE IF NOT EXISTS api_key_invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    api_key_id INT,
+    api_key VARCHAR(64),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS scheduler_locks (
+    name VARCHAR(64) PRIMARY KEY,
+    owner VARCHAR(128) NOT NULL DEFAULT '',
+    locked_until DATETIME NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+    bucket_start DATETIME NOT NULL,
+    scope VARCHAR(8) NOT NULL,
+    scope_id VARCHAR(45) NOT NULL DEFAULT '',
+    request_count INT NOT NULL DEFAULT 0,
+    success_count INT NOT NULL DEFAULT 0,
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, scope, scope_id)
+);
+CREATE TABLE IF NOT EXISTS usage_rollup_daily (
+    bucket_start DATE NOT NULL,
+    scope VARCHAR(8) NOT NULL,
+    scope_id VARCHAR(45) NOT NULL DEFAULT '',
+    request_count INT NOT NULL DEFAULT 0,
+    success_count INT NOT NULL DEFAULT 0,
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, scope, scope_id)
+);
+"""
+
+# Sıra önemlidir: parametre yer tutucuları tarih biçimlerindeki % işaretlerinden önce çevrilir
+SQL_TRANSLATIONS = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bGREATEST\("), "MAX("),
+    (re.compile(r"\bNOW\(6\)"), "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"),
+    (re.compile(r"\bNOW\(\)"), "datetime('now', 'localtime')"),
+    (re.compile(r"\bDATE_ADD\((.+?), INTERVAL \? SECOND\)"), r"strftime('%Y-%m-%d %H:%M:%f', \1, '+' || ? || ' seconds')"),
+    (re.compile(r"\s+FOR UPDATE\b"), ""),
+    (re.compile(r"<=>"), "IS"),
+    (re.compile(r"\bINSERT IGNORE\b"), "INSERT OR IGNORE"),
+    (re.compile(r"\bON DUPLICATE KEY UPDATE\b"), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)"), r"excluded.\1"),
+    (re.compile(r"\bAS UNSIGNED\)"), "AS INTEGER)"),
+    (re.compile(r"\bAS CHAR\)"), "AS TEXT)")
+]
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+
+@functools.lru_cache(maxsize=512)
+def translate_sql(sql):
+    """MySQL sorgusunu SQLite sözdizimine çevir"""
+    for pattern, replacement in SQL_TRANSLATIONS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+class SqliteCursor:
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+    
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+    
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+    
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params or ()))
+    
+    def executemany(self, sql, rows):
+        self._cursor.executemany(translate_sql(sql), [tuple(row) for row in rows])
+    
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+    
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+    
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+    
+    def close(self):
+        self._cursor.close()
+
+class SqliteConnection:
+    """Havuzdan alınan bağlantı; close() bağlantıyı kapatmaz, havuza geri verir"""
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+    
+    def cursor(self, dictionary=False, **kwargs):
+        return SqliteCursor(self._raw.cursor(), dictionary)
+    
+    def commit(self):
+        self._raw.commit()
+    
+    def rollback(self):
+        self._raw.rollback()
+    
+    def close(self):
+        # mysql.connector havuzu gibi bitmemiş işlem geri alınarak iade edilir
+        if self._raw.in_transaction:
+            self._raw.rollback()
+        self._pool._release(self._raw)
+
+class SqlitePool:
+    """
+    Yük testlerinde MySQL havuzu yerine api_service.DB_POOL olarak kullanılan SQLite havuzu.
+    
+    Servisin kullandığı arayüzü (get_connection, cursor(dictionary=True), commit, rollback,
+    close) sunar; sorgulardaki MySQL sözdizimi translate_sql ile çevrilir. Boş bağlantı yoksa
+    mysql.connector gibi PoolError fırlatır. Veritabanı WAL kipinde bir dosyadır, okumalar
+    birbirini beklemez. SQLite yazmaları satır değil veritabanı düzeyinde sıraya koyduğundan
+    yazma yoğun senaryolarda sonuçlar MySQL'e göre kötümserdir. Zamanlanmış işlerin (saklama,
+    toplu kota sıfırlama, özet doldurma) MySQL'e özgü sorguları desteklenmez.
+    """
+    def __init__(self, path, pool_size=10, busy_timeout=30):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        
+        for _ in range(pool_size):
+            # Yazma işlemleri kilidi baştan alır; okuma-yazma yükseltmesinde kilitlenme olmaz
+            raw = sqlite3.connect(path, timeout=busy_timeout, isolation_level="IMMEDIATE",
+                                  detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute("PRAGMA synchronous=NORMAL")
+            raw.create_function("GET_LOCK", 2, lambda name, timeout: 1)
+            raw.create_function("RELEASE_LOCK", 1, lambda name: 1)
+            self._connections.append(raw)
+            self._idle.put(raw)
+    
+    def get_connection(self):
+        try:
+            raw = self._idle.get_nowait()
+        except queue.Empty:
+            raise PoolError("Failed getting connection; pool exhausted")
+        return SqliteConnection(self, raw)
+    
+    def _release(self, raw):
+        self._idle.put(raw)
+    
+    def close_all(self):
+        for raw in self._connections:
+            raw.close()
+        self._connections = []
+
+def create_schema(path):
+    """Servisin istek yolunda kullandığı tabloları oluştur (api_service.create_schema'nın SQLite karşılığı)"""
+    with sqlite3.connect(path) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+def seed_rows(path, api_keys, ip_addresses, monthly_token_limit):
+    """Yük testi anahtarlarını ve anonim IP satırlarını önceden oluştur"""
+    now = datetime.now()
+    with sqlite3.connect(path) as db:
+        db.executemany(
+            "INSERT OR IGNORE INTO api_keys (api_key, description, monthly_token_limit, tokens_used, last_reset_date) "
+            "VALUES (?, 'load test', ?, 0, ?)",
+            [(api_key, monthly_token_limit, now) for api_key in api_keys]
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO ip_rate_limits (ip_address, monthly_token_limit, tokens_used, request_count, last_reset_date) "
+            "VALUES (?, ?, 0, 0, ?)",
+            [(ip_address, monthly_token_limit, now) for ip_address in ip_addresses]
+        )
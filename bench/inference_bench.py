@@ -0,0 +1,351 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# python bench/inference_bench.py ile çalıştırıldığında da api_service bulunabilsin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoTokenizer, BertConfig
+from api_service import (
+    LABELS,
+    QUANTIZATION_SAMPLE_TEXTS,
+    HierarchicalOffensiveClassifier,
+    OnnxRuntimeModel,
+    export_onnx_model,
+    load_fp32_model,
+    predict_offensive_content,
+    predict_offensive_content_batch,
+    quantize_model
+)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "torch_int8", "onnxruntime")
+# Tahmin yolu metinleri bu uzunlukta keser; daha uzun metin üretilemez
+MAX_SEQ_LEN = 128
+COMPARED_METRICS = (("throughput", "higher"), ("p50_ms", "lower"), ("p95_ms", "lower"))
+
+def parse_int_list(value):
+    """Virgülle ayrılmış tam sayı listesini ayrıştır"""
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def has_trained_weights(model_path):
+    """Ağırlık dosyası var mı; git-lfs işaretçisi (indirilmemiş dosya) ağırlık sayılmaz"""
+    state_path = os.path.join(model_path, "pytorch_model.bin")
+    if not os.path.isfile(state_path) or os.path.getsize(state_path) < 1024:
+        return False
+    with open(state_path, "rb") as f:
+        return not f.read(64).startswith(b"version https://git-lfs")
+
+def load_bench_model(model_path, tokenizer, seed, random_num_layers):
+    """Eğitilmiş ağırlıklar varsa onları, yoksa aynı mimaride rastgele ağırlıklı modeli yükle"""
+    if has_trained_weights(model_path):
+        try:
+            return load_fp32_model(model_path, tokenizer, device=torch.device("cpu")), "trained"
+        except Exception as e:
+            logger.warning(f"Eğitilmiş model yüklenemedi, rastgele ağırlıklar kullanılacak: {e}")
+    
+    # Süreler ağırlık değerlerine bağlı değildir; mimari aynı olduğu sürece ölçüm temsilidir
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(tokenizer), num_hidden_layers=random_num_layers)
+    model = HierarchicalOffensiveClassifier(None, num_labels=len(LABELS), config=config)
+    model.eval()
+    logger.info(f"Rastgele ağırlıklı model oluşturuldu ({random_num_layers} katman)")
+    return model, "random"
+
+def available_backends(requested):
+    """İstenen arka uçlardan bu ortamda çalışabilenleri döndür"""
+    backends = []
+    for backend in requested:
+        if backend not in BACKENDS:
+            raise ValueError(f"Bilinmeyen arka uç: {backend} (seçenekler: {', '.join(BACKENDS)})")
+        if backend == "torch_int8" and not torch.backends.quantized.supported_engines:
+            logger.warning("Bu ortamda INT8 çekirdeği yok, torch_int8 atlanıyor")
+            continue
+        if backend == "onnxruntime":
+            try:
+                import onnxruntime  # noqa: F401
+            except ImportError:
+                logger.warning("onnxruntime yüklü değil, onnxruntime arka ucu atlanıyor")
+                continue
+        backends.append(backend)
+    return backends
+
+def build_texts(tokenizer, seq_len, count, rng):
+    """Yaklaşık seq_len token uzunluğunda (özel tokenler dahil) count adet metin üret"""
+    words = " ".join(QUANTIZATION_SAMPLE_TEXTS).split()
+    texts = []
+    for _ in range(count):
+        text_words = []
+        while True:
+            text_words.append(rng.choice(words))
+            if len(tokenizer(" ".join(text_words), truncation=True, max_length=MAX_SEQ_LEN)["input_ids"]) >= seq_len:
+                break
+        texts.append(" ".join(text_words))
+    return texts
+
+def percentile(sorted_values, fraction):
+    """Sıralı listede doğrusal aradeğerlemeli yüzdelik"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def reset_peak_rss():
+    """Linux'ta sürecin en yüksek bellek değerini (VmHWM) o anki kullanıma indir; desteklenmiyorsa False"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Sürecin en yüksek bellek kullanımı (MB); Linux'ta son reset_peak_rss çağrısından bu yana"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss sıfırlanamaz, süreç başından beri en yüksek değeri verir; Linux'ta KB, macOS'ta bayt döner
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_case(model, tokenizer, texts, chunk_size, warmup, iterations, max_seconds):
+    """
+    Tek bir durumu ölç; tek metinde tekil yol, diğerlerinde toplu yol kullanılır.
+    
+    En yüksek bellek değeri durum başında sıfırlanabiliyorsa peak_rss_mb yalnızca bu durumu
+    kapsar; sıfırlanamıyorsa (Linux dışı) önceki durumlardan etkileneceği için None yazılır.
+    """
+    per_case_rss = reset_peak_rss()
+    if len(texts) == 1:
+        call = lambda: predict_offensive_content(model, tokenizer, texts[0])
+    else:
+        call = lambda: predict_offensive_content_batch(model, tokenizer, texts, chunk_size=chunk_size)
+    
+    for _ in range(warmup):
+        call()
+    
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < iterations:
+        call_started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_started)
+        if time.perf_counter() - started >= max_seconds:
+            break
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "throughput": round(len(texts) * len(latencies) / elapsed, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb() if per_case_rss else None
+    }
+
+def case_key(case):
+    return (case["backend"], case["threads"], case["batch_size"], case["seq_len"])
+
+def compare_results(baseline, current, max_regression):
+    """
+    Ortak durumlarda throughput ve gecikmeyi karşılaştır; (eşiği aşan gerilemeler, temel
+    sonuçlarda karşılığı olmayan durumlar) döndürür. Hiçbir durum karşılaştırılamazsa ValueError.
+    """
+    if baseline["meta"].get("weights") != current["meta"].get("weights"):
+        logger.warning(f"Ağırlık türleri farklı (temel: {baseline['meta'].get('weights')}, "
+                       f"güncel: {current['meta'].get('weights')}), karşılaştırma yanıltıcı olabilir")
+    
+    baseline_cases = {case_key(case): case for case in baseline["results"]}
+    current_keys = {case_key(case) for case in current["results"]}
+    regressions = []
+    missing = []
+    compared = 0
+    
+    for case in current["results"]:
+        reference = baseline_cases.get(case_key(case))
+        if reference is None:
+            missing.append(case)
+            logger.error(f"Temel sonuçlarda yok: {case['backend']} threads={case['threads']} "
+                         f"seq_len={case['seq_len']} batch={case['batch_size']}")
+            continue
+        compared += 1
+        
+        for metric, better in COMPARED_METRICS:
+            old, new = reference[metric], case[metric]
+            if not old:
+                continue
+            # Pozitif değişim her iki metrik türünde de kötüleşme demektir
+            change = (old - new) / old * 100 if better == "higher" else (new - old) / old * 100
+            if change > max_regression:
+                regressions.append({
+                    "backend": case["backend"], "threads": case["threads"],
+                    "batch_size": case["batch_size"], "seq_len": case["seq_len"],
+                    "metric": metric, "baseline": old, "current": new, "regression_pct": round(change, 1)
+                })
+    
+    not_measured = len(baseline_cases.keys() - current_keys)
+    if not_measured:
+        logger.warning(f"Temel sonuçlardaki {not_measured} durum bu çalıştırmada ölçülmedi")
+    
+    if compared == 0:
+        raise ValueError("Temel sonuçlarla ortak durum yok; batch boyutu, uzunluk, iş parçacığı ve arka uç listelerini kontrol edin")
+    
+    logger.info(f"{compared} ortak durum karşılaştırıldı, {len(regressions)} gerileme, "
+                f"{len(missing)} karşılıksız durum (eşik: %{max_regression})")
+    return regressions, missing
+
+def run_benchmark(args):
+    """Arka uç, iş parçacığı, dizi uzunluğu ve batch boyutu kombinasyonlarını ölç"""
+    rng = random.Random(args.seed)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    fp32_model, weights = load_bench_model(args.model_path, tokenizer, args.seed, args.random_num_layers)
+    
+    backends = available_backends(args.backends.split(","))
+    thread_counts = parse_int_list(args.threads) if args.threads else sorted({1, os.cpu_count() or 1})
+    seq_lens = parse_int_list(args.seq_lens)
+    batch_sizes = parse_int_list(args.batch_sizes)
+    invalid_lens = [seq_len for seq_len in seq_lens if not 1 <= seq_len <= MAX_SEQ_LEN]
+    if invalid_lens:
+        raise ValueError(f"seq_lens 1 ile {MAX_SEQ_LEN} arasında olmalıdır: {', '.join(map(str, invalid_lens))}")
+    
+    # Aynı metinler tüm arka uç ve iş parçacığı sayılarında kullanılır
+    texts_by_len = {seq_len: build_texts(tokenizer, seq_len, max(batch_sizes), rng) for seq_len in seq_lens}
+    
+    results = []
+    # Durumlar en yüksek bellek değerini sıfırladığından çalıştırmanın tepe değeri ayrıca izlenir
+    run_peak_rss = peak_rss_mb()
+    with tempfile.TemporaryDirectory(prefix="temizdil-bench-") as work_dir:
+        onnx_path = None
+        for backend in backends:
+            if backend == "torch_int8":
+                backend_model = quantize_model(fp32_model)
+                backend_model.eval()
+            elif backend == "onnxruntime" and onnx_path is None:
+                onnx_path = args.onnx_path or os.path.join(work_dir, "model.onnx")
+                if not args.onnx_path:
+                    export_onnx_model(fp32_model, tokenizer, onnx_path)
+            
+            for threads in thread_counts:
+                torch.set_num_threads(threads)
+                if backend == "onnxruntime":
+                    backend_model = OnnxRuntimeModel(onnx_path, num_threads=threads)
+                elif backend == "torch":
+                    backend_model = fp32_model
+                
+                for seq_len in seq_lens:
+                    for batch_size in batch_sizes:
+                        texts = texts_by_len[seq_len][:batch_size]
+                        case = {
+                            "backend": backend,
+                            "threads": threads,
+                            "batch_size": batch_size,
+                            "seq_len": seq_len,
+                            "tokens": round(sum(len(tokenizer(text, truncation=True, max_length=MAX_SEQ_LEN)["input_ids"])
+                                                for text in texts) / len(texts), 1)
+                        }
+                        case.update(run_case(backend_model, tokenizer, texts, args.chunk_size, args.warmup,
+                                             args.iterations, args.max_case_seconds))
+                        results.append(case)
+                        run_peak_rss = max(run_peak_rss, peak_rss_mb())
+                        logger.info(f"{backend} threads={threads} seq_len={seq_len} batch={batch_size}: "
+                                    f"{case['throughput']:.1f} metin/sn, p50={case['p50_ms']:.1f} ms, "
+                                    f"p95={case['p95_ms']:.1f} ms, p99={case['p99_ms']:.1f} ms")
+    
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "model_path": args.model_path,
+            "weights": weights,
+            "random_num_layers": args.random_num_layers if weights == "random" else None,
+            "chunk_size": args.chunk_size,
+            "seed": args.seed,
+            "warmup": args.warmup,
+            "iterations": args.iterations,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "peak_rss_mb": max(run_peak_rss, peak_rss_mb()),
+        "results": results
+    }
+
+def main():
+    # Argüman ayrıştırıcı
+    parser = argparse.ArgumentParser(description="Çıkarım performans ölçümü ve temel sonuçlara göre gerileme kontrolü")
+    parser.add_argument("--model_path", type=str, default="./offensive_model_hierarchical",
+                        help="Model klasörü (ağırlık yoksa tokenizer ile rastgele ağırlıklı model kullanılır)")
+    parser.add_argument("--backends", type=str, default=",".join(BACKENDS),
+                        help="Ölçülecek arka uçlar, virgülle ayrılmış (kurulu olmayanlar atlanır)")
+    parser.add_argument("--onnx_path", type=str, default=None,
+                        help="Hazır ONNX dosyası (verilmezse model geçici klasöre dışa aktarılır)")
+    parser.add_argument("--batch_sizes", type=str, default="1,8,32,128,256", help="Batch boyutları, virgülle ayrılmış")
+    parser.add_argument("--seq_lens", type=str, default="8,32,128", help="Token cinsinden metin uzunlukları, virgülle ayrılmış")
+    parser.add_argument("--threads", type=str, default=None,
+                        help="torch iş parçacığı sayıları, virgülle ayrılmış (varsayılan: 1 ve çekirdek sayısı)")
+    parser.add_argument("--chunk_size", type=int, default=32, help="Toplu yolda tek ileri geçişteki en fazla metin")
+    parser.add_argument("--warmup", type=int, default=2, help="Ölçüm öncesi ısınma çağrısı sayısı")
+    parser.add_argument("--iterations", type=int, default=20, help="Durum başına ölçülecek çağrı sayısı")
+    parser.add_argument("--max_case_seconds", type=float, default=30,
+                        help="Bir durum bu süreyi aşarsa daha az çağrıyla bitirilir")
+    parser.add_argument("--random_num_layers", type=int, default=12,
+                        help="Rastgele ağırlıklı modelin katman sayısı (eğitilmiş ağırlık yoksa)")
+    parser.add_argument("--seed", type=int, default=42, help="Metin üretimi ve rastgele ağırlıklar için tohum")
+    parser.add_argument("--output", type=str, default=None, help="Sonuçların yazılacağı JSON dosyası")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Karşılaştırılacak temel sonuç dosyası (gerileme varsa çıkış kodu 1)")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Ölçüm yapmadan bu sonuç dosyasını --baseline ile karşılaştır")
+    parser.add_argument("--max_regression", type=float, default=10,
+                        help="İzin verilen en fazla gerileme yüzdesi (throughput, p50 ve p95)")
+    args = parser.parse_args()
+    
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare için --baseline gerekli")
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        report = run_benchmark(args)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logger.info(f"Sonuçlar yazıldı: {args.output}")
+        else:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+    
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        try:
+            regressions, missing = compare_results(baseline, report, args.max_regression)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        for regression in regressions:
+            logger.error(f"Gerileme: {regression['backend']} threads={regression['threads']} "
+                         f"seq_len={regression['seq_len']} batch={regression['batch_size']} {regression['metric']}: "
+                         f"{regression['baseline']} -> {regression['current']} (%{regression['regression_pct']})")
+        if regressions or missing:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
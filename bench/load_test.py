@@ -0,0 +1,442 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import secrets
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# python bench/load_test.py ile çalıştırıldığında da api_service bulunabilsin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+import api_service
+from api_service import QUANTIZATION_SAMPLE_TEXTS
+from bench.fake_mysql import SqlitePool, create_schema, seed_rows
+from bench.inference_bench import has_trained_weights, load_bench_model, percentile
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {
+    "predict": ("POST", "/predict"),
+    "batch_predict": ("POST", "/batch_predict"),
+    "usage_info": ("GET", "/usage_info")
+}
+SERVER_SUMMARY_FIELDS = ("db_pool", "usage_writer", "inference_executor", "micro_batch", "ip_rate_limiter", "api_key_cache", "prediction_cache")
+
+def load_test_api_key(index):
+    """Yerel sunucuya önceden eklenen yük testi anahtarı"""
+    return f"loadtest-key-{index:06d}"
+
+def anonymous_ip(index):
+    """Anonim çağıranlar için 10.0.0.0/8 içinden sabit IP"""
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+def parse_mix(value):
+    """predict=70,batch_predict=20,usage_info=10 biçimindeki trafik karışımını ayrıştır"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Bilinmeyen endpoint: {name} (seçenekler: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Trafik karışımında en az bir pozitif ağırlık olmalı")
+    return mix
+
+def parse_server_args(value):
+    """
+    --server_args değerini api_service argümanları olarak ayrıştır; yük testi sunucusunun
+    uygulayamayacağı argümanlarda ValueError fırlat.
+    """
+    parser = api_service.build_arg_parser()
+    server_args = parser.parse_args(shlex.split(value))
+    
+    error = api_service.validate_service_args(server_args)
+    if error:
+        raise ValueError(error)
+    
+    # Sunucu tek süreçte, yük testinin verdiği adres ve veritabanıyla çalışır
+    unsupported = []
+    if server_args.workers != 1:
+        unsupported.append("--workers")
+    if server_args.quota_reset_job or server_args.retention_job:
+        unsupported.append("--quota_reset_job/--retention_job")
+    for name in ("host", "port", "metrics_dir"):
+        if getattr(server_args, name) != parser.get_default(name):
+            unsupported.append(f"--{name}")
+    # MySQL'e özgü sorgular kullanan zamanlanmış işler yerel veritabanında çalıştırılmaz
+    for name in ("quota_reset_interval", "retention_interval_hours"):
+        value = getattr(server_args, name)
+        if value > 0 and value != parser.get_default(name):
+            unsupported.append(f"--{name}")
+    # Rastgele ağırlıklı modelde INT8 uyum kontrolü, kayıtlı INT8 modeli ve erken çıkış yok
+    if not has_trained_weights(server_args.model_path) and server_args.backend != "onnxruntime":
+        for name in ("quantized_path", "quantize_sample_file", "early_exit_threshold"):
+            if getattr(server_args, name) is not None:
+                unsupported.append(f"--{name}")
+    
+    if unsupported:
+        raise ValueError(f"Yük testi sunucusu şu argümanları desteklemiyor: {', '.join(unsupported)}")
+    
+    server_args.quota_reset_interval = 0
+    server_args.retention_interval_hours = 0
+    return server_args
+
+def random_model_loader(seed, random_num_layers):
+    """Eğitilmiş ağırlık yokken api_service.configure_service'e verilen, rastgele ağırlıklı modeli yükleyen fonksiyon"""
+    from transformers import AutoTokenizer
+    
+    def load(server_args, sample_texts):
+        tokenizer = AutoTokenizer.from_pretrained(server_args.model_path)
+        model, _ = load_bench_model(server_args.model_path, tokenizer, seed, random_num_layers)
+        if server_args.quantize == "int8":
+            model = api_service.quantize_model(model)
+            model.eval()
+        api_service.MODEL, api_service.TOKENIZER = model, tokenizer
+        api_service.MODEL_VERSION = f"random-{seed}-{server_args.quantize}"
+        if api_service.PREDICTION_CACHE is not None:
+            api_service.PREDICTION_CACHE.set_model_version(api_service.MODEL_VERSION)
+    
+    return load
+
+def run_server(args):
+    """api_service uygulamasını SQLite havuzu ve (ağırlık yoksa) rastgele ağırlıklı modelle waitress üzerinde çalıştır"""
+    from waitress import serve
+    
+    server_args = parse_server_args(args.server_args)
+    
+    if server_args.threads_per_worker:
+        torch.set_num_threads(server_args.threads_per_worker)
+    
+    if not server_args.disable_metrics:
+        try:
+            api_service.METRICS = api_service.ServiceMetrics()
+        except ImportError:
+            logger.warning("Metrikler kapalı: prometheus_client bulunamadı")
+    
+    create_schema(args.db_path)
+    seed_rows(args.db_path, [load_test_api_key(i) for i in range(args.api_keys)],
+              [anonymous_ip(i) for i in range(args.anonymous_ips)], args.monthly_token_limit)
+    api_service.DB_POOL_SIZE = server_args.db_pool_size
+    api_service.DB_POOL_TIMEOUT = server_args.db_pool_timeout_ms / 1000.0
+    api_service.DB_POOL = SqlitePool(args.db_path, pool_size=server_args.db_pool_size)
+    
+    model_loader = None
+    if not has_trained_weights(server_args.model_path) and server_args.backend != "onnxruntime":
+        model_loader = random_model_loader(args.seed, args.random_num_layers)
+    api_service.configure_service(server_args, model_loader)
+    api_service.start_worker_services(server_args)
+    
+    # SIGTERM ile kapanışta tampondaki kullanım kayıtları yazılsın
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Yük testi sunucusu başlatılıyor (port: {args.port}, iş parçacığı: {server_args.threads}, veritabanı: {args.db_path})")
+    try:
+        serve(api_service.app, host=args.host, port=args.port, threads=server_args.threads, trusted_proxy='*')
+    finally:
+        api_service.stop_worker_services()
+
+def wait_until_ready(host, port, timeout, process=None):
+    """Sunucu /health isteğine yanıt verene kadar bekle"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Yük testi sunucusu başlatılamadı (çıkış kodu: {process.returncode})")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Sunucu {timeout:.0f} saniye içinde hazır olmadı")
+
+class LoadGenerator:
+    """
+    Kapalı döngü HTTP yük üreticisi.
+    
+    Her sanal kullanıcı kendi kalıcı bağlantısıyla bir önceki yanıtı aldıktan sonra yeni
+    istek gönderir. Endpoint trafik karışımına, çağıran türü api_key_ratio'ya göre seçilir;
+    anonim çağıranlar X-Real-IP başlığıyla farklı IP'lerden geliyormuş gibi görünür.
+    """
+    def __init__(self, host, port, mix, api_keys, anonymous_ips, api_key_ratio=0.5, batch_size=8,
+                 unique_texts=True, timeout=30, seed=42):
+        self.host = host
+        self.port = port
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.api_keys = api_keys
+        self.anonymous_ips = anonymous_ips
+        self.api_key_ratio = api_key_ratio if api_keys else 0.0
+        self.batch_size = batch_size
+        self.unique_texts = unique_texts
+        self.timeout = timeout
+        self.seed = seed
+    
+    def _text(self, rng, counter):
+        text = rng.choice(QUANTIZATION_SAMPLE_TEXTS)
+        # Benzersiz metinler tahmin önbelleğini atlatır ve her istekte modeli çalıştırır
+        return f"{text} {counter}" if self.unique_texts else text
+    
+    def _worker(self, index, started, deadline, samples):
+        rng = random.Random(self.seed + index)
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        counter = index * 10_000_000
+        
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(self.endpoints, self.weights)[0]
+            method, path = ENDPOINTS[endpoint]
+            
+            headers = {"Content-Type": "application/json"}
+            if rng.random() < self.api_key_ratio:
+                caller = "api_key"
+                headers["X-API-Key"] = rng.choice(self.api_keys)
+            else:
+                caller = "anonymous"
+                headers["X-Real-IP"] = anonymous_ip(rng.randrange(self.anonymous_ips))
+            
+            body = None
+            if endpoint == "predict":
+                counter += 1
+                body = json.dumps({"text": self._text(rng, counter)})
+            elif endpoint == "batch_predict":
+                counter += self.batch_size
+                body = json.dumps({"texts": [self._text(rng, counter + i) for i in range(self.batch_size)]})
+            
+            request_started = time.monotonic()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                # Bağlantı hatası 0 durum koduyla kaydedilir ve yeni bağlantı açılır
+                status = 0
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            samples.append((request_started - started, endpoint, caller, status, time.monotonic() - request_started))
+        
+        conn.close()
+    
+    def run(self, concurrency, duration, warmup):
+        """Yükü warmup + duration saniye uygula ve tüm örnekleri döndür"""
+        started = time.monotonic()
+        deadline = started + warmup + duration
+        per_worker = [[] for _ in range(concurrency)]
+        workers = [
+            threading.Thread(target=self._worker, args=(i, started, deadline, per_worker[i]), name=f"load-{i}", daemon=True)
+            for i in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return [sample for samples in per_worker for sample in samples]
+
+def summarize(samples, duration):
+    """Örneklerden istek sayısı, RPS, hata oranı, durum kodları ve gecikme yüzdeliklerini hesapla"""
+    if not samples:
+        return {"requests": 0, "rps": 0.0, "error_rate": 0.0, "status_counts": {}}
+    
+    latencies = sorted(sample[4] for sample in samples)
+    status_counts = {}
+    for sample in samples:
+        status_counts[str(sample[3])] = status_counts.get(str(sample[3]), 0) + 1
+    errors = sum(1 for sample in samples if not 200 <= sample[3] < 400)
+    
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / duration, 2),
+        "error_rate": round(errors / len(samples), 4),
+        "status_counts": status_counts,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2)
+    }
+
+def fetch_server_summary(host, port, admin_password):
+    """Sunucunun havuz, yazıcı ve yürütücü sayaçlarını /admin/usage_summary'den al"""
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        conn.request("GET", "/admin/usage_summary", headers={"Authorization": f"Bearer {admin_password}"})
+        response = conn.getresponse()
+        summary = json.loads(response.read())
+        if response.status != 200:
+            logger.warning(f"Sunucu özeti alınamadı: {response.status} {summary}")
+            return None
+        return {field: summary.get(field) for field in SERVER_SUMMARY_FIELDS}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Sunucu özeti alınamadı: {e}")
+        return None
+
+def count_logged_predictions(db_path):
+    """Sunucu kapandıktan sonra api_usage_logs'a yazılan başarılı tahmin kaydı sayısı"""
+    pool = SqlitePool(db_path, pool_size=1)
+    try:
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM api_usage_logs WHERE is_successful = 1")
+        return cursor.fetchone()[0]
+    finally:
+        pool.close_all()
+
+def run_load_test(args):
+    """Gerekirse yerel sunucuyu başlat, yükü uygula ve raporu oluştur"""
+    mix = parse_mix(args.mix)
+    if not args.url:
+        # Argüman hataları sunucu süreci başlatılmadan bildirilsin
+        parse_server_args(args.server_args)
+    process = None
+    work_dir = None
+    db_path = None
+    admin_password = args.admin_password
+    
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+            api_keys = [key for key in (args.api_key_list or "").split(",") if key]
+        else:
+            host, port = "127.0.0.1", args.port
+            api_keys = [load_test_api_key(i) for i in range(args.api_keys)]
+            admin_password = secrets.token_hex(16)
+            work_dir = tempfile.mkdtemp(prefix="temizdil-load-")
+            db_path = os.path.join(work_dir, "load_test.db")
+            
+            command = [sys.executable, "-m", "bench.load_test", "--serve", "--port", str(port), "--db_path", db_path,
+                       "--api_keys", str(args.api_keys), "--anonymous_ips", str(args.anonymous_ips),
+                       "--monthly_token_limit", str(args.monthly_token_limit), "--random_num_layers", str(args.random_num_layers),
+                       "--seed", str(args.seed), "--server_args", args.server_args]
+            env = dict(os.environ, ADMIN_PASSWORD=admin_password)
+            repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            process = subprocess.Popen(command, cwd=repo_root, env=env)
+        
+        return collect_report(args, mix, host, port, api_keys, admin_password, process, db_path)
+    finally:
+        # Yerel sunucunun SQLite dosyası rapor oluşturulduktan sonra silinir
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def collect_report(args, mix, host, port, api_keys, admin_password, process, db_path):
+    """Yükü uygula, sunucuyu kapat ve raporu oluştur"""
+    try:
+        wait_until_ready(host, port, args.startup_timeout, process)
+        
+        generator = LoadGenerator(host, port, mix, api_keys, args.anonymous_ips, api_key_ratio=args.api_key_ratio,
+                                  batch_size=args.batch_size, unique_texts=not args.repeat_texts,
+                                  timeout=args.request_timeout, seed=args.seed)
+        logger.info(f"Yük uygulanıyor: {args.concurrency} eşzamanlı kullanıcı, {args.warmup:.0f}+{args.duration:.0f} saniye, karışım={mix}")
+        samples = generator.run(args.concurrency, args.duration, args.warmup)
+        measured = [sample for sample in samples if sample[0] >= args.warmup]
+        
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "target": args.url or f"http://{host}:{port} (yerel, SQLite)",
+                "server_args": args.server_args if not args.url else None,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "mix": mix,
+                "api_key_ratio": generator.api_key_ratio,
+                "batch_size": args.batch_size,
+                "unique_texts": not args.repeat_texts,
+                "seed": args.seed,
+                "cpu_count": os.cpu_count()
+            },
+            "overall": summarize(measured, args.duration),
+            "endpoints": {
+                endpoint: summarize([sample for sample in measured if sample[1] == endpoint], args.duration)
+                for endpoint in mix
+            },
+            "callers": {
+                caller: summarize([sample for sample in measured if sample[2] == caller], args.duration)
+                for caller in ("api_key", "anonymous")
+            },
+            "server": fetch_server_summary(host, port, admin_password) if admin_password else None
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    # Yerel sunucuda başarılı tüm tahminler (ısınma dahil) kapanışta loglara yazılmış olmalı
+    if db_path is not None:
+        report["accounting"] = {
+            "successful_predictions": sum(1 for sample in samples if sample[1] != "usage_info" and sample[3] == 200),
+            "logged_successful": count_logged_predictions(db_path)
+        }
+    
+    return report
+
+def main():
+    # Argüman ayrıştırıcı
+    parser = argparse.ArgumentParser(description="api_service için uçtan uca HTTP yük testi (yerel SQLite veritabanıyla)")
+    parser.add_argument("--url", type=str, default=None,
+                        help="Çalışan bir sunucunun adresi (verilmezse yerel sunucu SQLite ile başlatılır)")
+    parser.add_argument("--api_key_list", type=str, default=None, help="--url ile kullanılacak API anahtarları, virgülle ayrılmış")
+    parser.add_argument("--admin_password", type=str, default=None, help="--url ile sunucu özetini almak için admin şifresi")
+    parser.add_argument("--server_args", type=str, default="",
+                        help="Yerel sunucuya api_service.py argümanları olarak geçirilir (örn. \"--threads 16 --usage_flush_ms 0\")")
+    parser.add_argument("--port", type=int, default=5055, help="Yerel sunucunun portu")
+    parser.add_argument("--mix", type=str, default="predict=70,batch_predict=20,usage_info=10",
+                        help="Endpoint ağırlıkları")
+    parser.add_argument("--api_key_ratio", type=float, default=0.5, help="API anahtarıyla gelen isteklerin oranı")
+    parser.add_argument("--api_keys", type=int, default=100, help="Yerel veritabanına eklenecek API anahtarı sayısı")
+    parser.add_argument("--anonymous_ips", type=int, default=10000, help="Anonim isteklerin dağıtılacağı IP sayısı")
+    parser.add_argument("--monthly_token_limit", type=int, default=10**9,
+                        help="Yerel anahtar ve IP satırlarının aylık token limiti")
+    parser.add_argument("--batch_size", type=int, default=8, help="/batch_predict isteklerindeki metin sayısı")
+    parser.add_argument("--repeat_texts", action="store_true",
+                        help="Metinleri sabit örneklerden seç (tahmin önbelleği isabetlerini de ölçmek için)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Eşzamanlı sanal kullanıcı sayısı")
+    parser.add_argument("--duration", type=float, default=30, help="Ölçüm süresi (saniye)")
+    parser.add_argument("--warmup", type=float, default=5, help="Ölçüme dahil edilmeyen ısınma süresi (saniye)")
+    parser.add_argument("--request_timeout", type=float, default=30, help="Tek istek için zaman aşımı (saniye)")
+    parser.add_argument("--startup_timeout", type=float, default=300, help="Sunucunun hazır olması için beklenecek süre (saniye)")
+    parser.add_argument("--random_num_layers", type=int, default=12,
+                        help="Eğitilmiş ağırlık yoksa rastgele ağırlıklı modelin katman sayısı")
+    parser.add_argument("--seed", type=int, default=42, help="Trafik ve rastgele ağırlıklar için tohum")
+    parser.add_argument("--output", type=str, default=None, help="Raporun yazılacağı JSON dosyası")
+    # Yerel sunucu süreci için (run_load_test tarafından kullanılır)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db_path", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--host", type=str, default="127.0.0.1", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        run_server(args)
+        return
+    
+    report = run_load_test(args)
+    for endpoint, stats in report["endpoints"].items():
+        if stats["requests"]:
+            logger.info(f"{endpoint}: {stats['rps']:.1f} istek/sn, hata oranı={stats['error_rate']:.2%}, "
+                        f"p50={stats['p50_ms']:.1f} ms, p95={stats['p95_ms']:.1f} ms, p99={stats['p99_ms']:.1f} ms")
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Rapor yazıldı: {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
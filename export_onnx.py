@@ -0,0 +1,38 @@
+import argparse
+import logging
+import torch
+from transformers import AutoTokenizer
+from api_service import (
+    QUANTIZATION_SAMPLE_TEXTS,
+    OnnxRuntimeModel,
+    export_onnx_model,
+    load_fp32_model,
+    measure_agreement
+)
+
+logger = logging.getLogger(__name__)
+
+def main():
+    # Argüman ayrıştırıcı
+    parser = argparse.ArgumentParser(description="HierarchicalOffensiveClassifier modelini ONNX biçimine aktar")
+    parser.add_argument("--model_path", type=str, default="./offensive_model_hierarchical",
+                        help="Eğitilmiş model klasörü")
+    parser.add_argument("--output", type=str, default=None,
+                        help="ONNX dosyası (varsayılan: <model_path>/model.onnx)")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset sürümü")
+    args = parser.parse_args()
+    
+    output_path = args.output or f"{args.model_path}/model.onnx"
+    
+    # Modeli CPU üzerinde yükle ve dışa aktar
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = load_fp32_model(args.model_path, tokenizer, device=torch.device("cpu"))
+    export_onnx_model(model, tokenizer, output_path, opset_version=args.opset)
+    
+    # Dışa aktarılan grafiğin torch modeliyle aynı tahminleri verdiğini doğrula
+    agreement = measure_agreement(model, OnnxRuntimeModel(output_path), tokenizer, QUANTIZATION_SAMPLE_TEXTS)
+    logger.info(f"ONNX-torch uyum oranı: saldırganlık={agreement['offensive_agreement']:.3f}, "
+                f"tüm başlıklar={agreement['full_agreement']:.3f} ({agreement['samples']} örnek)")
+
+if __name__ == "__main__":
+    main()
@@ -313,43 +313,119 @@ function fetchAPI(url, options = {}) {
         });
 }
 
-// API anahtarlarını yükle
+// Liste sayfalama durumları (filtreler ve sonraki sayfanın imleci)
+const apiKeysListState = { q: '', min_tokens_used: '', sort: 'created_at', order: 'desc', nextCursor: null };
+const ipUsageListState = { ip_prefix: '', min_requests: '', sort: 'request_count', order: 'desc', nextCursor: null };
+
+// Filtre ve imleçten liste isteği adresini oluştur
+function buildListUrl(baseUrl, state, filterKeys, cursor) {
+    const params = new URLSearchParams();
+    filterKeys.forEach(key => {
+        if (state[key] !== '' && state[key] !== null && state[key] !== undefined) {
+            params.set(key, state[key]);
+        }
+    });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return `${baseUrl}?${params.toString()}`;
+}
+
+// Filtre alanları için ortak sınıflar
+const listInputClasses = 'px-3 py-1.5 text-sm border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500';
+const loadMoreButtonClasses = 'hidden px-3 py-1.5 text-sm bg-blue-600 text-white font-medium rounded-lg hover:bg-blue-700 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:ring-opacity-50';
+
+// API anahtarlarını yükle (filtreler korunur, liste ilk sayfadan başlar)
 function loadApiKeys() {
     const contentArea = document.querySelector('#apiKeysContent .p-6');
-    contentArea.innerHTML = '<p class="text-gray-600 mb-4">Yükleniyor...</p>';
+    const state = apiKeysListState;
+
+    contentArea.innerHTML = `
+        <form id="apiKeysFilterForm" class="flex flex-wrap gap-2 mb-4">
+            <input type="text" name="q" value="${state.q.replace(/"/g, '&quot;')}" placeholder="Açıklama veya anahtar ara" class="${listInputClasses}">
+            <input type="number" name="min_tokens_used" value="${state.min_tokens_used}" min="0" placeholder="En az kullanım" class="${listInputClasses}">
+            <select name="sort" class="${listInputClasses}">
+                <option value="created_at" ${state.sort === 'created_at' ? 'selected' : ''}>Oluşturulma</option>
+                <option value="tokens_used" ${state.sort === 'tokens_used' ? 'selected' : ''}>Kullanılan</option>
+                <option value="id" ${state.sort === 'id' ? 'selected' : ''}>ID</option>
+            </select>
+            <select name="order" class="${listInputClasses}">
+                <option value="desc" ${state.order === 'desc' ? 'selected' : ''}>Azalan</option>
+                <option value="asc" ${state.order === 'asc' ? 'selected' : ''}>Artan</option>
+            </select>
+            <button type="submit" class="px-3 py-1.5 text-sm bg-gray-600 text-white font-medium rounded-lg hover:bg-gray-700">Filtrele</button>
+        </form>
+        <div id="apiKeysList"><p class="text-gray-600 mb-4">Yükleniyor...</p></div>
+        <div class="flex justify-center mt-4">
+            <button id="apiKeysLoadMore" type="button" class="${loadMoreButtonClasses}">Daha Fazla Yükle</button>
+        </div>
+    `;
+
+    document.getElementById('apiKeysFilterForm').addEventListener('submit', function (e) {
+        e.preventDefault();
+        const formData = new FormData(this);
+        ['q', 'min_tokens_used', 'sort', 'order'].forEach(key => {
+            state[key] = formData.get(key).trim();
+        });
+        loadApiKeys();
+    });
 
-    fetchAPI('/admin/keys')
+    document.getElementById('apiKeysLoadMore').addEventListener('click', function () {
+        loadApiKeysPage(state.nextCursor);
+    });
+
+    loadApiKeysPage(null);
+}
+
+// API anahtarları listesinin bir sayfasını getirip tabloya ekle
+function loadApiKeysPage(cursor) {
+    const listArea = document.getElementById('apiKeysList');
+    const loadMoreBtn = document.getElementById('apiKeysLoadMore');
+    const state = apiKeysListState;
+    loadMoreBtn.disabled = true;
+
+    fetchAPI(buildListUrl('/admin/keys', state, ['q', 'min_tokens_used', 'sort', 'order'], cursor))
         .then(data => {
             if (data.error) {
-                contentArea.innerHTML = `<div class="p-4 bg-red-100 text-red-700 rounded-lg">${data.error}</div>`;
+                listArea.innerHTML = `<div class="p-4 bg-red-100 text-red-700 rounded-lg">${data.error}</div>`;
+                loadMoreBtn.classList.add('hidden');
                 return;
             }
 
-            if (!data.api_keys || data.api_keys.length === 0) {
-                contentArea.innerHTML = '<p class="text-gray-600 mb-4">Henüz hiç API anahtarı oluşturulmamış.</p>';
+            if (!cursor && (!data.api_keys || data.api_keys.length === 0)) {
+                const filtered = state.q || state.min_tokens_used;
+                listArea.innerHTML = filtered
+                    ? '<p class="text-gray-600 mb-4">Filtreyle eşleşen API anahtarı bulunamadı.</p>'
+                    : '<p class="text-gray-600 mb-4">Henüz hiç API anahtarı oluşturulmamış.</p>';
+                loadMoreBtn.classList.add('hidden');
                 return;
             }
 
-            let html = `
-                <div class="overflow-x-auto">
-                    <table class="min-w-full divide-y divide-gray-200">
-                        <thead class="bg-gray-50">
-                            <tr>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">ID</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">API Anahtarı</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Açıklama</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Sınırsız</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Aylık Limit</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Kullanılan</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Otomatik Reset</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son Reset</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Oluşturulma</th>
-                                <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İşlemler</th>
-                            </tr>
-                        </thead>
-                        <tbody class="bg-white divide-y divide-gray-200">
-            `;
+            if (!cursor) {
+                listArea.innerHTML = `
+                    <div class="overflow-x-auto">
+                        <table class="min-w-full divide-y divide-gray-200">
+                            <thead class="bg-gray-50">
+                                <tr>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">ID</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">API Anahtarı</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Açıklama</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Sınırsız</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Aylık Limit</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Kullanılan</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Otomatik Reset</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son Reset</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Oluşturulma</th>
+                                    <th scope="col" class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İşlemler</th>
+                                </tr>
+                            </thead>
+                            <tbody id="apiKeysTableBody" class="bg-white divide-y divide-gray-200"></tbody>
+                        </table>
+                    </div>
+                `;
+            }
 
+            let html = '';
             data.api_keys.forEach(key => {
                 const lastResetDate = formatDate(key.last_reset_date);
 
@@ -373,23 +449,23 @@ function loadApiKeys() {
                 `;
             });
 
-            html += `
-                        </tbody>
-                    </table>
-                </div>
-            `;
+            document.getElementById('apiKeysTableBody').insertAdjacentHTML('beforeend', html);
 
-            contentArea.innerHTML = html;
+            // Sonraki sayfa varsa butonu göster
+            state.nextCursor = data.next_cursor;
+            loadMoreBtn.classList.toggle('hidden', !data.next_cursor);
+            loadMoreBtn.disabled = false;
         })
         .catch(error => {
             if (error.message !== 'Yetkisiz erişim') {
                 console.error('API anahtarları yüklenirken hata:', error);
-                contentArea.innerHTML = '<div class="p-4 bg-red-100 text-red-700 rounded-lg">API anahtarları yüklenirken bir hata oluştu.</div>';
+                listArea.innerHTML = '<div class="p-4 bg-red-100 text-red-700 rounded-lg">API anahtarları yüklenirken bir hata oluştu.</div>';
+                loadMoreBtn.classList.add('hidden');
             }
         });
 }
 
-// IP kullanımını yükle
+// IP kullanımını yükle (filtreler korunur, liste ilk sayfadan başlar)
 function loadIpUsage() {
     const ipUsageContent = document.getElementById('ipUsageContent');
     if (!ipUsageContent) return;
@@ -397,46 +473,99 @@ function loadIpUsage() {
     const contentArea = ipUsageContent.querySelector('.p-6');
     if (!contentArea) return;
 
-    // Spinner göster
+    const state = ipUsageListState;
+
     contentArea.innerHTML = `
-        <div class="flex justify-center p-4">
-            <svg class="animate-spin h-8 w-8 text-blue-600" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24">
-                <circle class="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" stroke-width="4"></circle>
-                <path class="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
-            </svg>
+        <form id="ipUsageFilterForm" class="flex flex-wrap gap-2 mb-4">
+            <input type="text" name="ip_prefix" value="${state.ip_prefix.replace(/"/g, '&quot;')}" placeholder="IP öneki (örn. 192.168.)" class="${listInputClasses}">
+            <input type="number" name="min_requests" value="${state.min_requests}" min="0" placeholder="En az istek" class="${listInputClasses}">
+            <select name="sort" class="${listInputClasses}">
+                <option value="request_count" ${state.sort === 'request_count' ? 'selected' : ''}>İstek Sayısı</option>
+                <option value="tokens_used" ${state.sort === 'tokens_used' ? 'selected' : ''}>Kullanılan</option>
+                <option value="ip_address" ${state.sort === 'ip_address' ? 'selected' : ''}>IP Adresi</option>
+            </select>
+            <select name="order" class="${listInputClasses}">
+                <option value="desc" ${state.order === 'desc' ? 'selected' : ''}>Azalan</option>
+                <option value="asc" ${state.order === 'asc' ? 'selected' : ''}>Artan</option>
+            </select>
+            <button type="submit" class="px-3 py-1.5 text-sm bg-gray-600 text-white font-medium rounded-lg hover:bg-gray-700">Filtrele</button>
+        </form>
+        <div id="ipUsageList">
+            <div class="flex justify-center p-4">
+                <svg class="animate-spin h-8 w-8 text-blue-600" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24">
+                    <circle class="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" stroke-width="4"></circle>
+                    <path class="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
+                </svg>
+            </div>
+        </div>
+        <div class="flex justify-center mt-4">
+            <button id="ipUsageLoadMore" type="button" class="${loadMoreButtonClasses}">Daha Fazla Yükle</button>
         </div>
     `;
 
-    fetchAPI('/admin/list_ip_usage')
+    document.getElementById('ipUsageFilterForm').addEventListener('submit', function (e) {
+        e.preventDefault();
+        const formData = new FormData(this);
+        ['ip_prefix', 'min_requests', 'sort', 'order'].forEach(key => {
+            state[key] = formData.get(key).trim();
+        });
+        loadIpUsage();
+    });
+
+    document.getElementById('ipUsageLoadMore').addEventListener('click', function () {
+        loadIpUsagePage(state.nextCursor);
+    });
+
+    loadIpUsagePage(null);
+}
+
+// IP kullanım listesinin bir sayfasını getirip tabloya ekle
+function loadIpUsagePage(cursor) {
+    const listArea = document.getElementById('ipUsageList');
+    const loadMoreBtn = document.getElementById('ipUsageLoadMore');
+    const state = ipUsageListState;
+    loadMoreBtn.disabled = true;
+
+    fetchAPI(buildListUrl('/admin/list_ip_usage', state, ['ip_prefix', 'min_requests', 'sort', 'order'], cursor))
         .then(data => {
             if (data.error) {
-                contentArea.innerHTML = `<div class="p-4 bg-red-100 text-red-700 rounded-lg">${data.error}</div>`;
+                listArea.innerHTML = `<div class="p-4 bg-red-100 text-red-700 rounded-lg">${data.error}</div>`;
+                loadMoreBtn.classList.add('hidden');
                 return;
             }
 
-            if (!data.ip_usage || data.ip_usage.length === 0) {
-                contentArea.innerHTML = '<div class="p-4 bg-blue-100 text-blue-700 rounded-lg">Henüz IP kullanım bilgisi bulunmuyor.</div>';
+            if (!cursor && (!data.ip_usage || data.ip_usage.length === 0)) {
+                const filtered = state.ip_prefix || state.min_requests;
+                listArea.innerHTML = filtered
+                    ? '<div class="p-4 bg-blue-100 text-blue-700 rounded-lg">Filtreyle eşleşen IP kaydı bulunamadı.</div>'
+                    : '<div class="p-4 bg-blue-100 text-blue-700 rounded-lg">Henüz IP kullanım bilgisi bulunmuyor.</div>';
+                loadMoreBtn.classList.add('hidden');
                 return;
             }
 
-            // IP kullanım tablosu oluştur
-            let html = `
-                <div class="overflow-x-auto">
-                    <table class="min-w-full divide-y divide-gray-200">
-                        <thead class="bg-gray-50">
-                            <tr>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">IP Adresi</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Token Limiti</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Kullanılan</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İstek Sayısı</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son İstek</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son Resetleme</th>
-                                <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İşlemler</th>
-                            </tr>
-                        </thead>
-                        <tbody class="bg-white divide-y divide-gray-200">
-            `;
+            // İlk sayfada IP kullanım tablosunu oluştur
+            if (!cursor) {
+                listArea.innerHTML = `
+                    <div class="overflow-x-auto">
+                        <table class="min-w-full divide-y divide-gray-200">
+                            <thead class="bg-gray-50">
+                                <tr>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">IP Adresi</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Token Limiti</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Kullanılan</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İstek Sayısı</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son İstek</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Son Resetleme</th>
+                                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">İşlemler</th>
+                                </tr>
+                            </thead>
+                            <tbody id="ipUsageTableBody" class="bg-white divide-y divide-gray-200"></tbody>
+                        </table>
+                    </div>
+                `;
+            }
 
+            let html = '';
             data.ip_usage.forEach(ip => {
                 let lastResetDate = formatDate(ip.last_reset_date);
 
@@ -455,18 +584,18 @@ function loadIpUsage() {
                 `;
             });
 
-            html += `
-                        </tbody>
-                    </table>
-                </div>
-            `;
+            document.getElementById('ipUsageTableBody').insertAdjacentHTML('beforeend', html);
 
-            contentArea.innerHTML = html;
+            // Sonraki sayfa varsa butonu göster
+            state.nextCursor = data.next_cursor;
+            loadMoreBtn.classList.toggle('hidden', !data.next_cursor);
+            loadMoreBtn.disabled = false;
         })
         .catch(error => {
             if (error.message !== 'Yetkisiz erişim') {
                 console.error('IP kullanım bilgileri yüklenirken hata:', error);
-                contentArea.innerHTML = '<div class="p-4 bg-red-100 text-red-700 rounded-lg">IP kullanım bilgileri yüklenirken bir hata oluştu.</div>';
+                listArea.innerHTML = '<div class="p-4 bg-red-100 text-red-700 rounded-lg">IP kullanım bilgileri yüklenirken bir hata oluştu.</div>';
+                loadMoreBtn.classList.add('hidden');
             }
         });
 }
@@ -652,6 +781,7 @@ function createApiKey() {
     const monthlyLimit = parseInt(document.getElementById('monthlyLimit').value) || 100000;
     const isUnlimited = document.getElementById('isUnlimited').checked;
     const autoReset = document.getElementById('autoReset').checked;
+    const unlimitedIps = document.getElementById('unlimitedIps').value.trim();
 
     fetchAPI('/admin/keys', {
         method: 'POST',
@@ -659,6 +789,7 @@ function createApiKey() {
             description,
             monthly_token_limit: monthlyLimit,
             is_unlimited: isUnlimited,
+            unlimited_ips: unlimitedIps,
             auto_reset: autoReset
         })
     })
@@ -708,6 +839,7 @@ function editApiKey(keyId) {
             document.getElementById('monthlyLimit').value = apiKey.monthly_token_limit;
             document.getElementById('isUnlimited').checked = apiKey.is_unlimited;
             document.getElementById('autoReset').checked = apiKey.auto_reset;
+            document.getElementById('unlimitedIps').value = apiKey.unlimited_ips || '';
 
             // Modal başlığını ve buton yazısını ayarla
             apiKeyModalTitle.textContent = 'API Anahtarı Düzenle';
@@ -732,11 +864,13 @@ function updateApiKey() {
     const monthlyLimit = parseInt(document.getElementById('monthlyLimit').value) || 100000;
     const isUnlimited = document.getElementById('isUnlimited').checked;
     const autoReset = document.getElementById('autoReset').checked;
+    const unlimitedIps = document.getElementById('unlimitedIps').value.trim();
 
     const requestData = {
         description,
         monthly_token_limit: monthlyLimit,
         is_unlimited: isUnlimited,
+        unlimited_ips: unlimitedIps,
         auto_reset: autoReset
     };
 
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# pytest depo kökü dışından çalıştırıldığında da api_service ve bench bulunabilsin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_service
+from bench.fake_mysql import SqlitePool, create_schema
+
+@pytest.fixture
+def db_pool(tmp_path, monkeypatch):
+    """api_service.DB_POOL yerine geçici bir SQLite havuzu"""
+    path = str(tmp_path / "service.db")
+    create_schema(path)
+    pool = SqlitePool(path, pool_size=4)
+    monkeypatch.setattr(api_service, "DB_POOL", pool)
+    yield pool
+    pool.close_all()
+
+@pytest.fixture
+def db_query(db_pool):
+    """Havuzdan bağlantı alıp sorgu sonucunu döndüren yardımcı"""
+    def query(sql, params=()):
+        conn = db_pool.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            cursor.close()
+            conn.close()
+    return query
@@ -0,0 +1,58 @@
+import pytest
+
+import api_service
+from api_service import ApiKeyCache
+
+@pytest.fixture
+def admin_client(db_pool):
+    return api_service.app.test_client()
+
+def admin_headers():
+    return {"Authorization": f"Bearer {api_service.ADMIN_PASSWORD}"}
+
+def test_deleting_missing_key_returns_404(admin_client, db_query):
+    response = admin_client.delete("/admin/keys/999", headers=admin_headers())
+    
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "API anahtarı bulunamadı."}
+    assert db_query("SELECT * FROM api_key_invalidations") == []
+
+def test_deleting_key_is_committed_before_cache_invalidation(admin_client, db_pool, db_query, monkeypatch):
+    db_query("INSERT INTO api_keys (api_key) VALUES ('silinecek')")
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.set("silinecek", {"id": 1, "tokens_used": 0})
+    
+    # Önbellek bırakılırken satır başka bir bağlantıdan artık görünmemeli
+    seen_rows = []
+    invalidate = cache.invalidate
+    def checking_invalidate(**kwargs):
+        seen_rows.append(len(db_query("SELECT id FROM api_keys WHERE id = 1")))
+        invalidate(**kwargs)
+    monkeypatch.setattr(cache, "invalidate", checking_invalidate)
+    monkeypatch.setattr(api_service, "API_KEY_CACHE", cache)
+    
+    response = admin_client.delete("/admin/keys/1", headers=admin_headers())
+    
+    assert response.status_code == 200
+    assert seen_rows == [0]
+    assert cache.get("silinecek") == (False, None)
+    assert len(db_query("SELECT * FROM api_key_invalidations WHERE api_key_id = 1")) == 1
+
+def test_updating_key_is_committed_before_cache_invalidation(admin_client, db_query, monkeypatch):
+    db_query("INSERT INTO api_keys (api_key, monthly_token_limit) VALUES ('anahtar', 1000)")
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.set("anahtar", {"id": 1, "monthly_token_limit": 1000})
+    
+    seen_limits = []
+    invalidate = cache.invalidate
+    def checking_invalidate(**kwargs):
+        seen_limits.append(db_query("SELECT monthly_token_limit FROM api_keys WHERE id = 1")[0]["monthly_token_limit"])
+        invalidate(**kwargs)
+    monkeypatch.setattr(cache, "invalidate", checking_invalidate)
+    monkeypatch.setattr(api_service, "API_KEY_CACHE", cache)
+    
+    response = admin_client.put("/admin/keys/1", json={"monthly_token_limit": 50}, headers=admin_headers())
+    
+    assert response.status_code == 200
+    assert seen_limits == [50]
+    assert cache.get("anahtar") == (False, None)
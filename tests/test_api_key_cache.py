@@ -0,0 +1,73 @@
+import api_service
+from api_service import ApiKeyCache, publish_api_key_invalidations
+
+def publish(pool, events):
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    publish_api_key_invalidations(cursor, events)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def test_ttl_expiry(monkeypatch):
+    cache = ApiKeyCache(ttl_seconds=10)
+    cache.set("anahtar", {"id": 1, "tokens_used": 0})
+    assert cache.get("anahtar") == (True, {"id": 1, "tokens_used": 0})
+    
+    now = api_service.time.monotonic()
+    monkeypatch.setattr(api_service.time, "monotonic", lambda: now + 11)
+    assert cache.get("anahtar") == (False, None)
+
+def test_remote_invalidation_is_applied_on_sync(db_pool):
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.sync()
+    cache.set("silinen", {"id": 1, "tokens_used": 0})
+    cache.set("yeni", None)
+    cache.set("diger", {"id": 3, "tokens_used": 0})
+    
+    publish(db_pool, [(1, None), (None, "yeni")])
+    cache.sync()
+    
+    assert cache.get("silinen") == (False, None)
+    assert cache.get("yeni") == (False, None)
+    assert cache.get("diger")[0]
+    assert cache.stats()["remote_invalidations"] == 2
+
+def test_events_before_start_are_skipped(db_pool):
+    publish(db_pool, [(1, None)])
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.sync()
+    cache.set("anahtar", {"id": 1, "tokens_used": 0})
+    cache.sync()
+    
+    assert cache.get("anahtar")[0]
+
+def test_clear_event_drops_all_entries(db_pool):
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.sync()
+    cache.set("a", {"id": 1, "tokens_used": 0})
+    cache.set("b", {"id": 2, "tokens_used": 0})
+    
+    publish(db_pool, [(None, None)])
+    cache.sync()
+    
+    assert cache.stats()["entries"] == 0
+
+def test_quota_reset_invalidates_other_processes(db_pool, db_query):
+    old = api_service.datetime.now() - api_service.timedelta(days=31)
+    db_query(
+        "INSERT INTO api_keys (api_key, tokens_used, auto_reset, last_reset_date) VALUES ('eski', 500, 1, %s), ('yeni', 50, 1, %s)",
+        (old, api_service.datetime.now())
+    )
+    # Başka bir sürecin önbelleği
+    cache = ApiKeyCache(ttl_seconds=60)
+    cache.sync()
+    cache.set("eski", {"id": 1, "tokens_used": 500})
+    cache.set("yeni", {"id": 2, "tokens_used": 50})
+    
+    assert api_service.QuotaResetJob().run_once() == 1
+    cache.sync()
+    
+    assert cache.get("eski") == (False, None)
+    assert cache.get("yeni")[0]
+    assert db_query("SELECT tokens_used FROM api_keys WHERE id = 1")[0]["tokens_used"] == 0
@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+from mysql.connector.errors import PoolError
+
+import api_service
+from api_service import acquire_db_connection
+
+def test_waits_for_a_returned_connection(db_pool, monkeypatch):
+    monkeypatch.setattr(api_service, "DB_POOL_TIMEOUT", 5.0)
+    held = [acquire_db_connection() for _ in range(db_pool.pool_size)]
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(acquire_db_connection()))
+    waiter.start()
+    
+    held.pop().close()
+    waiter.join(timeout=5)
+    
+    assert len(acquired) == 1
+    assert api_service.db_pool_stats()["waits"] >= 1
+    for conn in held + acquired:
+        conn.close()
+
+def test_times_out_when_pool_stays_full(db_pool, monkeypatch):
+    monkeypatch.setattr(api_service, "DB_POOL_TIMEOUT", 0.05)
+    held = [acquire_db_connection() for _ in range(db_pool.pool_size)]
+    
+    with pytest.raises(PoolError):
+        acquire_db_connection()
+    
+    for conn in held:
+        conn.close()
+    # close() ikinci kez çağrıldığında semafor yeniden bırakılmaz
+    held[0].close()
+    conn = acquire_db_connection()
+    conn.close()
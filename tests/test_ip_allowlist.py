@@ -0,0 +1,63 @@
+import pytest
+
+from api_service import IpAllowlist, is_ip_allowed, parse_unlimited_ips
+
+def test_single_ips_and_cidr_blocks():
+    allowlist = IpAllowlist("10.0.0.5, 192.168.1.0/24, 2001:db8::/32")
+    
+    assert allowlist.contains("10.0.0.5")
+    assert not allowlist.contains("10.0.0.6")
+    assert allowlist.contains("192.168.1.0")
+    assert allowlist.contains("192.168.1.255")
+    assert not allowlist.contains("192.168.2.0")
+    assert allowlist.contains("2001:db8::1")
+    assert not allowlist.contains("2001:db9::1")
+
+def test_ipv4_ranges_do_not_match_ipv6_addresses():
+    allowlist = IpAllowlist("0.0.0.0/0")
+    
+    assert allowlist.contains("8.8.8.8")
+    assert not allowlist.contains("::1")
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    allowlist = IpAllowlist("10.0.0.0/25, 10.0.0.128/25, 10.0.0.10, 10.1.0.0/16")
+    
+    assert len(allowlist) == 2
+    assert allowlist.contains("10.0.0.200")
+    assert allowlist.contains("10.1.255.255")
+    assert not allowlist.contains("10.0.1.0")
+
+@pytest.mark.parametrize("value", [None, "", " , "])
+def test_empty_allowlist_matches_nothing(value):
+    allowlist = IpAllowlist(value)
+    
+    assert len(allowlist) == 0
+    assert allowlist.normalized() is None
+    assert not allowlist.contains("10.0.0.1")
+
+def test_invalid_entries_are_ignored_when_matching():
+    allowlist = IpAllowlist("bozuk, 10.0.0.1, 300.1.1.1")
+    
+    assert allowlist.invalid_entries == ["bozuk", "300.1.1.1"]
+    assert allowlist.contains("10.0.0.1")
+    assert not allowlist.contains("bozuk")
+
+def test_is_ip_allowed_accepts_raw_and_compiled_lists():
+    assert is_ip_allowed("10.0.0.1", "10.0.0.0/8")
+    assert is_ip_allowed("10.0.0.1", IpAllowlist("10.0.0.0/8"))
+    assert not is_ip_allowed("11.0.0.1", "10.0.0.0/8")
+
+def test_parse_normalizes_strings_and_lists():
+    assert parse_unlimited_ips(None) == (None, None)
+    assert parse_unlimited_ips(" 10.0.0.1 ,10.0.0.7/24") == ("10.0.0.1, 10.0.0.0/24", None)
+    assert parse_unlimited_ips(["10.0.0.1", "2001:DB8::1"]) == ("10.0.0.1, 2001:db8::1", None)
+    assert parse_unlimited_ips("") == (None, None)
+
+def test_parse_rejects_invalid_values():
+    value, error = parse_unlimited_ips("10.0.0.1, bozuk")
+    assert value is None
+    assert "bozuk" in error
+    
+    value, error = parse_unlimited_ips(42)
+    assert value is None
+    assert error == "unlimited_ips virgülle ayrılmış bir metin ya da liste olmalıdır."
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime
+
+import api_service
+from api_service import SlidingWindowRateLimiter
+
+def test_rejects_after_limit_within_window():
+    limiter = SlidingWindowRateLimiter(limit=3, window_seconds=60)
+    assert all(limiter.acquire("10.0.0.1") for _ in range(3))
+    assert not limiter.acquire("10.0.0.1")
+    assert limiter.acquire("10.0.0.2")
+    
+    stats = limiter.stats()
+    assert stats["allowed"] == 4
+    assert stats["rejected"] == 1
+
+def test_window_slides(monkeypatch):
+    limiter = SlidingWindowRateLimiter(limit=2, window_seconds=60)
+    now = time.time()
+    monkeypatch.setattr(api_service.time, "time", lambda: now)
+    limiter.acquire("10.0.0.1")
+    monkeypatch.setattr(api_service.time, "time", lambda: now + 30)
+    limiter.acquire("10.0.0.1")
+    assert not limiter.acquire("10.0.0.1")
+    
+    # İlk istek pencereden çıkınca bir istek daha yapılabilir
+    monkeypatch.setattr(api_service.time, "time", lambda: now + 61)
+    assert limiter.acquire("10.0.0.1")
+    assert not limiter.acquire("10.0.0.1")
+
+def test_check_without_consume_does_not_count():
+    limiter = SlidingWindowRateLimiter(limit=1, window_seconds=60)
+    assert limiter.acquire("10.0.0.1", consume=False)
+    assert limiter.acquire("10.0.0.1")
+    assert not limiter.acquire("10.0.0.1", consume=False)
+
+def test_reset_clears_window():
+    limiter = SlidingWindowRateLimiter(limit=1, window_seconds=60)
+    limiter.acquire("10.0.0.1")
+    limiter.reset("10.0.0.1")
+    assert limiter.acquire("10.0.0.1")
+
+def test_least_recently_used_ips_are_evicted():
+    limiter = SlidingWindowRateLimiter(limit=1, window_seconds=60, max_tracked=2)
+    for ip_address in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+        limiter.acquire(ip_address)
+    
+    assert limiter.stats()["tracked_ips"] == 2
+    assert limiter.stats()["evicted"] == 1
+    assert limiter.acquire("10.0.0.1")
+
+def test_sync_adds_increments(db_pool, db_query):
+    db_query("INSERT INTO ip_rate_limits (ip_address, request_count, last_request_time) VALUES ('10.0.0.1', 4, %s)",
+             (datetime.now(),))
+    limiter = SlidingWindowRateLimiter(limit=15, window_seconds=900)
+    limiter.acquire("10.0.0.1")
+    limiter.acquire("10.0.0.1")
+    limiter.sync()
+    limiter.acquire("10.0.0.1")
+    limiter.sync()
+    
+    assert db_query("SELECT request_count FROM ip_rate_limits")[0]["request_count"] == 7
+
+def test_sync_restarts_stale_counter(db_pool, db_query):
+    db_query("INSERT INTO ip_rate_limits (ip_address, request_count, last_request_time) VALUES ('10.0.0.1', 9, %s)",
+             (datetime.fromtimestamp(time.time() - 3600),))
+    limiter = SlidingWindowRateLimiter(limit=15, window_seconds=900)
+    limiter.acquire("10.0.0.1")
+    limiter.sync()
+    
+    assert db_query("SELECT request_count FROM ip_rate_limits")[0]["request_count"] == 1
+
+def test_load_restores_recent_window(db_pool, db_query):
+    db_query("INSERT INTO ip_rate_limits (ip_address, request_count, last_request_time) VALUES ('10.0.0.1', 3, %s)",
+             (datetime.now(),))
+    db_query("INSERT INTO ip_rate_limits (ip_address, request_count, last_request_time) VALUES ('10.0.0.2', 3, %s)",
+             (datetime.fromtimestamp(time.time() - 3600),))
+    limiter = SlidingWindowRateLimiter(limit=3, window_seconds=900)
+    limiter.load()
+    
+    assert not limiter.acquire("10.0.0.1")
+    assert limiter.acquire("10.0.0.2")
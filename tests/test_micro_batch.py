@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api_service
+from api_service import InferenceOverloadedError, MicroBatchScheduler
+
+PREDICTION = {"offensive_pred": 0, "multi_label_preds": None}
+
+def blocking_predict(release):
+    def predict(texts):
+        release.wait(timeout=10)
+        return [PREDICTION for _ in texts]
+    return predict
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+    scheduler = MicroBatchScheduler(blocking_predict(release), max_batch_size=1, max_wait_ms=0,
+                                    max_queue_size=1, queue_timeout_ms=5000, retry_after=lambda: 7).start()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        running = pool.submit(scheduler.submit, "ilk")
+        # İlk istek çalışıcıya alınana kadar bekle, ikincisi kuyruğu doldurur
+        while scheduler.stats()["batches"] == 0:
+            pass
+        queued = pool.submit(scheduler.submit, "ikinci")
+        while scheduler.stats()["queue_depth"] == 0:
+            pass
+        
+        with pytest.raises(InferenceOverloadedError) as error:
+            scheduler.submit("ucuncu")
+        assert error.value.retry_after == 7
+        
+        release.set()
+        assert running.result() == PREDICTION
+        assert queued.result() == PREDICTION
+    assert scheduler.stats()["rejected_full"] == 1
+
+def test_request_not_started_in_time_is_cancelled():
+    release = threading.Event()
+    scheduler = MicroBatchScheduler(blocking_predict(release), max_batch_size=1, max_wait_ms=0,
+                                    max_queue_size=4, queue_timeout_ms=50).start()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        running = pool.submit(scheduler.submit, "ilk")
+        while scheduler.stats()["batches"] == 0:
+            pass
+        
+        with pytest.raises(InferenceOverloadedError):
+            scheduler.submit("bekleyen")
+        
+        release.set()
+        assert running.result() == PREDICTION
+    
+    # İptal edilen istek modele gönderilmez
+    assert scheduler.submit("sonraki") == PREDICTION
+    stats = scheduler.stats()
+    assert stats["rejected_timeout"] == 1
+    assert stats["batched_requests"] == 2
+
+def test_flooded_predict_returns_503(db_pool, monkeypatch):
+    monkeypatch.setenv("ADMIN_PASSWORD", "test-admin")
+    release = threading.Event()
+    scheduler = MicroBatchScheduler(blocking_predict(release), max_batch_size=2, max_wait_ms=1,
+                                    max_queue_size=2, queue_timeout_ms=200).start()
+    monkeypatch.setattr(api_service, "SCHEDULER", scheduler)
+    client = api_service.app.test_client()
+    
+    def post(i):
+        response = client.post("/predict", json={"text": f"metin {i}"}, headers={"Admin-Password": "test-admin"})
+        return response.status_code, response.headers.get("Retry-After")
+    
+    # Çalışan batch, bekleyen istekler süre sınırını aştıktan sonra biter
+    threading.Timer(0.5, release.set).start()
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        responses = list(pool.map(post, range(12)))
+    
+    statuses = [status for status, _ in responses]
+    assert statuses.count(503) >= 8
+    assert all(retry_after == "1" for status, retry_after in responses if status == 503)
+    assert set(statuses) <= {200, 503}
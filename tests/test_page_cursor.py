@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+import api_service
+from api_service import decode_page_cursor, encode_page_cursor, fetch_keyset_page
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15)
+    token = encode_page_cursor("created_at", "desc", created_at, 42)
+    
+    assert "=" not in token
+    assert decode_page_cursor(token, "created_at", "desc", datetime.fromisoformat) == (created_at, 42)
+    assert decode_page_cursor(encode_page_cursor("tokens_used", "asc", 7, 3), "tokens_used", "asc", int) == (7, 3)
+
+def test_cursor_from_another_sort_is_rejected():
+    token = encode_page_cursor("tokens_used", "desc", 10, 1)
+    
+    with pytest.raises(ValueError, match="farklı bir sıralamaya"):
+        decode_page_cursor(token, "tokens_used", "asc", int)
+    with pytest.raises(ValueError, match="farklı bir sıralamaya"):
+        decode_page_cursor(token, "id", "desc", int)
+
+@pytest.mark.parametrize("token", ["", "bozuk!", "W10", encode_page_cursor("id", "desc", "x", "y")])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match="Geçersiz sayfa imleci"):
+        decode_page_cursor(token, "id", "desc", int)
+
+def test_keyset_pages_cover_rows_with_equal_sort_values(db_pool, db_query):
+    for i in range(5):
+        db_query("INSERT INTO api_keys (api_key, tokens_used) VALUES (%s, %s)", (f"anahtar{i}", 10 if i < 3 else 20))
+    
+    seen = []
+    token = None
+    while True:
+        args = {"sort": "tokens_used", "limit": 2, **({"cursor": token} if token else {})}
+        with api_service.app.test_request_context(query_string=args):
+            conn = db_pool.get_connection()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                rows, token = fetch_keyset_page(cursor, "api_keys", {"tokens_used": int, "id": int}, "tokens_used", [], [])
+            finally:
+                cursor.close()
+                conn.close()
+        seen.extend((row["tokens_used"], row["id"]) for row in rows)
+        if token is None:
+            break
+    
+    assert seen == [(20, 5), (20, 4), (10, 3), (10, 2), (10, 1)]
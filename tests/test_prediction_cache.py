@@ -0,0 +1,82 @@
+import sqlite3
+import time
+
+from api_service import PredictionCache
+
+PREDICTION = {"is_offensive": False, "offensive_probability": 0.1}
+
+def make_cache(**kwargs):
+    cache = PredictionCache(**kwargs)
+    cache.set_model_version("v1")
+    return cache
+
+def test_normalized_text_shares_entry():
+    cache = make_cache()
+    cache.set("merhaba   dünya", PREDICTION)
+    
+    assert cache.get(" merhaba dünya ") == PREDICTION
+    assert cache.stats()["hits"] == 1
+
+def test_lru_evicts_least_recently_used():
+    cache = make_cache(max_entries=2)
+    cache.set("a", PREDICTION)
+    cache.set("b", PREDICTION)
+    cache.get("a")
+    cache.set("c", PREDICTION)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == PREDICTION
+    assert cache.get("c") == PREDICTION
+    assert cache.stats()["evictions"] == 1
+
+def test_memory_cap_evicts_entries():
+    cache = make_cache(max_memory_mb=200 / (1024 * 1024))
+    for text in ("a", "b", "c"):
+        cache.set(text, PREDICTION)
+    
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 200
+    assert stats["entries"] < 3
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    cache = make_cache(ttl_seconds=10)
+    cache.set("a", PREDICTION)
+    
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("a") is None
+    
+    stats = cache.stats()
+    assert stats["expired"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 0
+
+def test_model_version_change_invalidates():
+    cache = make_cache()
+    cache.set("a", PREDICTION)
+    cache.set_model_version("v2")
+    
+    assert cache.get("a") is None
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = make_cache(disk_path=path)
+    reader = make_cache(disk_path=path)
+    writer.set("a", PREDICTION)
+    
+    assert reader.get("a") == PREDICTION
+    assert reader.stats()["disk_hits"] == 1
+
+def test_disk_tier_is_capped(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = make_cache(disk_path=path, max_disk_entries=20)
+    for i in range(50):
+        cache.set(f"metin {i}", PREDICTION)
+    
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+    finally:
+        conn.close()
+    assert rows <= 20 + cache.prune_interval
+    assert cache.stats()["disk_evictions"] > 0
@@ -0,0 +1,38 @@
+from api_service import QuotaLeaseManager
+
+def seed(db_query):
+    db_query("INSERT INTO api_keys (api_key, monthly_token_limit, tokens_used) VALUES ('anahtar', 1000, 0)")
+
+def key_row(db_query):
+    return db_query("SELECT tokens_used, leased_tokens FROM api_keys WHERE id = 1")[0]
+
+def test_unspent_lease_is_tracked_separately(db_pool, db_query):
+    seed(db_query)
+    leases = QuotaLeaseManager(fraction=0.1)
+    
+    assert leases.spend("key", 1, 30, None)
+    assert key_row(db_query) == {"tokens_used": 100, "leased_tokens": 100}
+    
+    leases.release_all()
+    assert key_row(db_query) == {"tokens_used": 30, "leased_tokens": 0}
+
+def test_renewal_reports_spent_tokens(db_pool, db_query):
+    seed(db_query)
+    leases = QuotaLeaseManager(fraction=0.1)
+    
+    assert leases.spend("key", 1, 60, None)
+    assert leases.spend("key", 1, 50, None)
+    # İlk dilim (100) yetmedi; 60 token raporlanıp yeni dilim (90) alındı
+    assert key_row(db_query) == {"tokens_used": 190, "leased_tokens": 130}
+    
+    leases.refund("key", 1, 50)
+    leases.release_all()
+    assert key_row(db_query) == {"tokens_used": 60, "leased_tokens": 0}
+
+def test_denied_when_quota_is_exhausted(db_pool, db_query):
+    seed(db_query)
+    leases = QuotaLeaseManager(fraction=0.1)
+    
+    assert not leases.spend("key", 1, 2000, None)
+    assert leases.stats()["denied"] == 1
+    assert key_row(db_query) == {"tokens_used": 0, "leased_tokens": 0}
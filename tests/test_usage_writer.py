@@ -0,0 +1,93 @@
+import api_service
+from api_service import UsageWriter
+
+def seed(db_query):
+    db_query("INSERT INTO api_keys (api_key, monthly_token_limit, tokens_used) VALUES ('anahtar', 1000, 10)")
+    db_query("INSERT INTO ip_rate_limits (ip_address, tokens_used, request_count) VALUES ('10.0.0.1', 5, 0)")
+
+def test_flush_writes_logs_and_aggregated_counters(db_pool, db_query):
+    seed(db_query)
+    writer = UsageWriter()
+    writer.add_log(1, "10.0.0.1", "/predict", 20, 5, True)
+    writer.add_log(None, "10.0.0.1", "/predict", 30, 7, False, "hata")
+    writer.add_key_tokens(1, 5)
+    writer.add_key_tokens(1, 3)
+    writer.add_ip_tokens(1, 7)
+    writer.add_ip_request(1)
+    writer.add_ip_request(1)
+    writer.flush()
+    
+    assert len(db_query("SELECT * FROM api_usage_logs")) == 2
+    assert db_query("SELECT tokens_used FROM api_keys WHERE id = 1")[0]["tokens_used"] == 18
+    ip_row = db_query("SELECT tokens_used, request_count FROM ip_rate_limits WHERE id = 1")[0]
+    assert ip_row == {"tokens_used": 12, "request_count": 2}
+    
+    daily = db_query("SELECT request_count, success_count, tokens_used FROM usage_rollup_daily WHERE scope = 'all'")
+    assert daily == [{"request_count": 2, "success_count": 1, "tokens_used": 12}]
+    
+    stats = writer.stats()
+    assert stats["flushes"] == 1
+    assert stats["written_logs"] == 2
+    assert stats["pending_logs"] == 0
+    assert stats["pending_counters"] == 0
+
+def test_refunds_do_not_go_below_zero(db_pool, db_query):
+    seed(db_query)
+    writer = UsageWriter()
+    writer.add_key_tokens(1, -50)
+    writer.flush()
+    
+    assert db_query("SELECT tokens_used FROM api_keys WHERE id = 1")[0]["tokens_used"] == 0
+
+def test_failed_flush_keeps_events_for_retry(db_pool, db_query, monkeypatch):
+    seed(db_query)
+    monkeypatch.setattr(api_service, "DB_POOL_TIMEOUT", 0.01)
+    writer = UsageWriter()
+    writer.add_log(1, "10.0.0.1", "/predict", 20, 5, True)
+    writer.add_key_tokens(1, 5)
+    
+    # Havuzdaki tüm bağlantılar meşgulken yazma başarısız olur
+    held = [db_pool.get_connection() for _ in range(db_pool.pool_size)]
+    writer.add_key_tokens(1, 2)
+    writer.flush()
+    assert writer.stats()["failed_flushes"] == 1
+    assert writer.stats()["pending_logs"] == 1
+    
+    for conn in held:
+        conn.close()
+    writer.flush()
+    
+    assert len(db_query("SELECT * FROM api_usage_logs")) == 1
+    assert db_query("SELECT tokens_used FROM api_keys WHERE id = 1")[0]["tokens_used"] == 17
+
+def test_pending_logs_are_capped():
+    writer = UsageWriter(max_pending=3)
+    for i in range(5):
+        writer.add_log(None, "10.0.0.1", "/predict", i, 1, True)
+    
+    stats = writer.stats()
+    assert stats["pending_logs"] == 3
+    assert stats["dropped_logs"] == 2
+
+def test_event_limit_wakes_the_writer():
+    writer = UsageWriter(max_events=2)
+    writer.add_key_tokens(1, 1)
+    assert not writer._wakeup.is_set()
+    writer.add_key_tokens(1, 1)
+    assert writer._wakeup.is_set()
+
+def test_overall_rollup_is_batched_across_flushes(db_pool, db_query):
+    seed(db_query)
+    writer = UsageWriter()
+    writer.add_log(1, "10.0.0.1", "/predict", 20, 5, True)
+    writer.flush()
+    writer.add_log(1, "10.0.0.1", "/predict", 20, 4, True)
+    writer.flush()
+    
+    # Genel satır aralık dolana kadar yazılmaz; anahtar satırı her flush'ta yazılır
+    daily = "SELECT request_count, tokens_used FROM usage_rollup_daily WHERE scope = %s"
+    assert db_query(daily, ("all",)) == [{"request_count": 1, "tokens_used": 5}]
+    assert db_query(daily, ("key",)) == [{"request_count": 2, "tokens_used": 9}]
+    
+    writer.stop()
+    assert db_query(daily, ("all",)) == [{"request_count": 2, "tokens_used": 9}]
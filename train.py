@@ -6,8 +6,52 @@ import numpy as np
 from sklearn.metrics import classification_report, f1_score
 import torch
 from torch import nn
+from torch.nn import functional as F
 from transformers import BertModel
+import argparse
+import copy
 import os
+import sys
+import joblib
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.pipeline import make_pipeline
+
+# 0. Komut satırı seçenekleri
+parser = argparse.ArgumentParser(description="Türkçe saldırgan içerik sınıflandırıcısını eğit")
+parser.add_argument("--output_dir", type=str, default=None,
+                    help="Modelin kaydedileceği klasör (varsayılan: normal eğitimde ./offensive_model_hierarchical, damıtmada ./offensive_model_student)")
+parser.add_argument("--epochs", type=int, default=4, help="Eğitim epoch sayısı")
+parser.add_argument("--distill", action="store_true",
+                    help="Eğitilmiş modeli öğretmen olarak kullanıp daha küçük bir öğrenci model damıt")
+parser.add_argument("--teacher_path", type=str, default="./offensive_model_hierarchical", help="Öğretmen model klasörü")
+parser.add_argument("--student_layers", type=int, default=6, help="Öğrenci modelin transformer katman sayısı")
+parser.add_argument("--student_hidden_size", type=int, default=None,
+                    help="Öğrenci modelin gizli katman boyutu (varsayılan: öğretmeninki; aynıysa katmanlar öğretmenden kopyalanır)")
+parser.add_argument("--temperature", type=float, default=2.0, help="Damıtma sıcaklığı")
+parser.add_argument("--alpha", type=float, default=0.5,
+                    help="Gerçek etiket kaybının ağırlığı (kalan ağırlık öğretmen çıktılarına uyum kaybına verilir)")
+parser.add_argument("--early_exit_layers", type=str, default=None,
+                    help="--teacher_path'teki eğitilmiş modeli dondurup yalnızca bu katmanlara eklenen saldırganlık "
+                         "çıkış sınıflandırıcılarını eğit, virgülle ayrılmış (örn. 3,6,9)")
+parser.add_argument("--fast_model", action="store_true",
+                    help="BERT yerine kaskadın ilk aşaması için TF-IDF karakter n-gram + doğrusal model eğit")
+parser.add_argument("--fast_model_path", type=str, default="./offensive_model_fast.joblib",
+                    help="Hızlı modelin kaydedileceği dosya")
+parser.add_argument("--fast_target_agreement", type=float, default=0.98,
+                    help="Hızlı modelin kendinden emin olduğu örneklerde tam modelle hedeflenen uyum oranı")
+args = parser.parse_args()
+
+if args.early_exit_layers and args.distill:
+    parser.error("--early_exit_layers ve --distill birlikte kullanılamaz; önce damıtın, sonra çıkışları öğrenci model üzerinde eğitin")
+
+if args.distill:
+    output_dir = args.output_dir or "./offensive_model_student"
+elif args.early_exit_layers:
+    output_dir = args.output_dir or "./offensive_model_early_exit"
+else:
+    output_dir = args.output_dir or "./offensive_model_hierarchical"
 
 # 1. Veri yükleme (orijinal TSV dosyası)
 df = pd.read_csv("./dataset/troff-v1.0.tsv", sep="\t", header=None, names=["text", "label"])
@@ -66,9 +110,10 @@ test_ds = Dataset.from_pandas(test_df)
 
 # 5. Özel model tanımlama - Hiyerarşik sınıflandırma için
 class HierarchicalOffensiveClassifier(nn.Module):
-    def __init__(self, model_name, num_labels=5):
+    def __init__(self, model_name, num_labels=5, config=None):
         super(HierarchicalOffensiveClassifier, self).__init__()
-        self.bert = BertModel.from_pretrained(model_name)
+        # config verilirse (öğrenci model) ağırlıklar yüklenmeden yeni bir BERT oluşturulur
+        self.bert = BertModel(config) if config is not None else BertModel.from_pretrained(model_name)
         self.dropout = nn.Dropout(0.1)
         self.num_labels = num_labels
         
@@ -83,9 +128,22 @@ class HierarchicalOffensiveClassifier(nn.Module):
         # Zorluk tahmini (X etiketi için)
         self.difficulty_classifier = nn.Linear(self.bert.config.hidden_size, 2)
         
+        # Ara katman çıkış sınıflandırıcıları (add_exit_classifiers ile eklenir)
+        self.exit_classifiers = nn.ModuleDict()
+        
         # Tüm tensörleri bitişik yap
         self._make_tensors_contiguous()
     
+    def add_exit_classifiers(self, layers):
+        """Verilen katmanlara saldırganlık için erken çıkış sınıflandırıcısı ekle"""
+        hidden_size = self.bert.config.hidden_size
+        for layer in layers:
+            self.exit_classifiers[str(layer)] = nn.Sequential(
+                nn.Linear(hidden_size, hidden_size), nn.Tanh(), nn.Linear(hidden_size, 2)
+            )
+        # api_service.py'nin çıkışları yeniden kurabilmesi için config.json'a yazılır
+        self.bert.config.early_exit_layers = sorted(int(layer) for layer in self.exit_classifiers)
+    
     def _make_tensors_contiguous(self):
         """Tüm model parametrelerini bitişik hale getir"""
         for name, param in self.named_parameters():
@@ -96,7 +154,8 @@ class HierarchicalOffensiveClassifier(nn.Module):
         outputs = self.bert(
             input_ids=input_ids,
             attention_mask=attention_mask,
-            token_type_ids=token_type_ids
+            token_type_ids=token_type_ids,
+            output_hidden_states=len(self.exit_classifiers) > 0
         )
         
         sequence_output = outputs.last_hidden_state
@@ -114,17 +173,96 @@ class HierarchicalOffensiveClassifier(nn.Module):
         # Zorluk çıktısı
         difficulty_logits = self.difficulty_classifier(pooled_output)
         
-        return {
+        results = {
             'offensive_logits': offensive_logits,
             'targeted_logits': targeted_logits,
             'target_type_logits': target_type_logits,
             'multi_label_logits': multi_label_logits,
             'difficulty_logits': difficulty_logits
         }
+        
+        # Erken çıkış sınıflandırıcıları ana modeli etkilemesin diye ara temsiller detach edilir
+        for layer, exit_classifier in self.exit_classifiers.items():
+            cls_output = outputs.hidden_states[int(layer)][:, 0].detach()
+            results[f'exit_logits_{layer}'] = exit_classifier(cls_output)
+        
+        return results
+
+def load_teacher_model(teacher_path):
+    """Eğitilmiş hiyerarşik modeli öğretmen olarak yükle ve dondur"""
+    teacher = HierarchicalOffensiveClassifier(teacher_path, num_labels=len(labels))
+    teacher.load_state_dict(torch.load(os.path.join(teacher_path, "pytorch_model.bin"), map_location="cpu"), strict=False)
+    teacher.eval()
+    for param in teacher.parameters():
+        param.requires_grad = False
+    return teacher
+
+# 5b. Kaskad için hızlı birinci aşama model
+def offensive_predictions_of_full_model(model_path, texts, batch_size=32):
+    """Eğitilmiş tam modelin saldırganlık tahminlerini döndür"""
+    full_tokenizer = AutoTokenizer.from_pretrained(model_path)
+    full_model = load_teacher_model(model_path)
+    predictions = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = full_tokenizer(texts[start:start + batch_size], return_tensors="pt", padding=True,
+                                    truncation=True, max_length=128)
+            predictions.extend(torch.argmax(full_model(**inputs)['offensive_logits'], dim=-1).tolist())
+    return np.array(predictions)
+
+def tune_confidence_threshold(confidences, fast_preds, reference_preds, target_agreement):
+    """Kendinden emin örneklerde uyum hedefini sağlayan, kapsamı en geniş güven eşiğini bul"""
+    for threshold in np.unique(confidences):
+        accepted = confidences >= threshold
+        agreement = (fast_preds[accepted] == reference_preds[accepted]).mean()
+        if agreement >= target_agreement:
+            return float(threshold), float(accepted.mean()), float(agreement)
+    return 1.01, 0.0, 1.0
+
+if args.fast_model:
+    # Çoklu etiketler ve zorluk etiketi birlikte tahmin edilir (son sütun: X)
+    fast_targets = np.array([row + [difficult] for row, difficult in zip(train_df['label_matrix'], train_df['is_difficult'])])
+    fast_model = make_pipeline(
+        TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), min_df=2, sublinear_tf=True, max_features=200000),
+        OneVsRestClassifier(LogisticRegression(max_iter=1000, C=4.0))
+    )
+    fast_model.fit(train_df['text'].tolist(), fast_targets)
+    
+    # Saldırganlık olasılığı = 1 - P(non)
+    test_texts = test_df['text'].tolist()
+    non_probs = fast_model.predict_proba(test_texts)[:, 0]
+    fast_preds = (non_probs < 0.5).astype(np.int64)
+    confidences = np.maximum(non_probs, 1 - non_probs)
+    
+    # Eşik tam modelin tahminlerine göre ayarlanır; model yoksa gerçek etiketler kullanılır
+    if os.path.exists(os.path.join(args.teacher_path, "pytorch_model.bin")):
+        reference_preds = offensive_predictions_of_full_model(args.teacher_path, test_texts)
+        reference_name = "tam model"
+    else:
+        reference_preds = test_df['offensive'].to_numpy()
+        reference_name = "gerçek etiketler"
+    
+    threshold, coverage, agreement = tune_confidence_threshold(confidences, fast_preds, reference_preds, args.fast_target_agreement)
+    print(f"Hızlı model doğruluğu (gerçek etiketler): {(fast_preds == test_df['offensive'].to_numpy()).mean():.4f}")
+    print(f"Güven eşiği {threshold:.4f}: örneklerin %{coverage * 100:.1f}'i hızlı katmanda yanıtlanır, "
+          f"{reference_name} ile uyum {agreement:.4f} (hedef {args.fast_target_agreement})")
+    
+    joblib.dump({
+        "pipeline": fast_model,
+        "labels": labels,
+        "confidence_threshold": threshold,
+        "target_agreement": args.fast_target_agreement,
+        "coverage": coverage,
+        "agreement": agreement
+    }, args.fast_model_path)
+    print(f"Hızlı model kaydedildi: {args.fast_model_path}")
+    sys.exit(0)
 
 # 6. Model ve tokenizer (Türkçe BERT)
 model_name = "dbmdz/bert-base-turkish-uncased"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+# Damıtmada ve erken çıkış eğitiminde eğitilmiş modelin kelime dağarcığı kullanılır
+tokenizer = AutoTokenizer.from_pretrained(args.teacher_path if args.distill or args.early_exit_layers else model_name)
 
 # 7. Yeni veri hazırlama yaklaşımı
 # Önce tokenize işlemi yapılır, sonra etiketler eklenir
@@ -175,8 +313,52 @@ test_ds.set_format(
     columns=["input_ids", "attention_mask", "token_type_ids", "labels", "offensive", "targeted", "target_type", "is_difficult"]
 )
 
+def build_student_model(teacher, num_layers, hidden_size=None):
+    """Öğretmenin yapılandırmasından daha az katmanlı (ve isteğe bağlı daha dar) bir öğrenci oluştur"""
+    student_config = copy.deepcopy(teacher.bert.config)
+    student_config.num_hidden_layers = num_layers
+    
+    if hidden_size and hidden_size != student_config.hidden_size:
+        student_config.hidden_size = hidden_size
+        student_config.num_attention_heads = max(1, hidden_size // 64)
+        student_config.intermediate_size = hidden_size * 4
+    
+    student = HierarchicalOffensiveClassifier(None, num_labels=len(labels), config=student_config)
+    
+    # Boyutlar aynıysa gömme katmanı, eşit aralıklı encoder katmanları ve başlıklar öğretmenden kopyalanır
+    if student_config.hidden_size == teacher.bert.config.hidden_size:
+        step = teacher.bert.config.num_hidden_layers / num_layers
+        student.bert.embeddings.load_state_dict(teacher.bert.embeddings.state_dict())
+        for i, layer in enumerate(student.bert.encoder.layer):
+            layer.load_state_dict(teacher.bert.encoder.layer[round((i + 1) * step) - 1].state_dict())
+        student.bert.pooler.load_state_dict(teacher.bert.pooler.state_dict())
+        for head in ["offensive_classifier", "targeted_classifier", "target_type_classifier",
+                     "multi_label_classifier", "difficulty_classifier"]:
+            getattr(student, head).load_state_dict(getattr(teacher, head).state_dict())
+    
+    student._make_tensors_contiguous()
+    return student
+
 # Transformers için özel sınıflandırıcı modeli
-model = HierarchicalOffensiveClassifier(model_name, num_labels=len(labels))
+teacher_model = None
+if args.distill:
+    teacher_model = load_teacher_model(args.teacher_path)
+    model = build_student_model(teacher_model, args.student_layers, args.student_hidden_size)
+    print(f"Öğrenci model: {args.student_layers} katman, gizli boyut {model.bert.config.hidden_size}, "
+          f"{sum(p.numel() for p in model.parameters()) / 1e6:.1f}M parametre "
+          f"(öğretmen: {sum(p.numel() for p in teacher_model.parameters()) / 1e6:.1f}M)")
+elif args.early_exit_layers:
+    # Çıkış sınıflandırıcıları eğitilmiş modelin temsilleri üzerinde eğitilir; gövde ve başlıklar donuk kalır
+    model = load_teacher_model(args.teacher_path)
+    exit_layers = [int(layer) for layer in args.early_exit_layers.split(",")]
+    num_layers = model.bert.config.num_hidden_layers
+    if any(layer < 1 or layer >= num_layers for layer in exit_layers):
+        parser.error(f"--early_exit_layers 1 ile {num_layers - 1} arasında olmalı")
+    model.add_exit_classifiers(exit_layers)
+    print(f"Erken çıkış sınıflandırıcıları eklendi: {model.bert.config.early_exit_layers} "
+          f"(eğitilen parametre: {sum(p.numel() for p in model.parameters() if p.requires_grad) / 1e6:.1f}M)")
+else:
+    model = HierarchicalOffensiveClassifier(model_name, num_labels=len(labels))
 
 # 8. Özel eğitim döngüsü (Trainer sınıfını özelleştirerek)
 class OffensiveTrainer(Trainer):
@@ -258,6 +440,11 @@ class OffensiveTrainer(Trainer):
             'difficulty_preds': difficulty_preds
         }
         
+        # Erken çıkış sınıflandırıcılarının "saldırgan değil" olasılıkları
+        for key in outputs:
+            if key.startswith('exit_logits_'):
+                predictions[key.replace('exit_logits_', 'exit_non_probs_')] = torch.softmax(outputs[key], dim=-1)[:, 0]
+        
         # Etiketleri sonuç sözlüğünde topla
         label_dict = {
             'offensive_labels': offensive_labels,
@@ -293,6 +480,58 @@ class OffensiveTrainer(Trainer):
         if hasattr(self.model, "bert") and hasattr(self.model.bert, "config"):
             self.model.bert.config.save_pretrained(output_dir)
 
+# Öğrenci modeli öğretmenin beş başlıktaki çıktılarına yaklaştıran eğitici
+class DistillationTrainer(OffensiveTrainer):
+    def __init__(self, *args, teacher_model=None, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher_model = teacher_model.to(self.args.device)
+        self.temperature = temperature
+        self.alpha = alpha
+    
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        # Öğretmen çıktılarını gerçek etiketler ayrılmadan önce al
+        model_inputs = {key: inputs[key] for key in ["input_ids", "attention_mask", "token_type_ids"]}
+        with torch.no_grad():
+            teacher_outputs = self.teacher_model(**model_inputs)
+        
+        # Gerçek etiketlere göre hiyerarşik kayıp
+        hard_loss, outputs = super().compute_loss(model, inputs, return_outputs=True)
+        
+        T = self.temperature
+        soft_loss = 0.0
+        
+        # Tek etiketli başlıklar için sıcaklıkla yumuşatılmış KL ıraksaması
+        for key in ["offensive_logits", "targeted_logits", "target_type_logits", "difficulty_logits"]:
+            soft_loss = soft_loss + F.kl_div(
+                F.log_softmax(outputs[key] / T, dim=-1),
+                F.softmax(teacher_outputs[key] / T, dim=-1),
+                reduction="batchmean"
+            ) * (T * T)
+        
+        # Çoklu etiket başlığı için öğretmen olasılıklarına karşı ikili çapraz entropi
+        soft_loss = soft_loss + F.binary_cross_entropy_with_logits(
+            outputs["multi_label_logits"] / T,
+            torch.sigmoid(teacher_outputs["multi_label_logits"] / T)
+        ) * (T * T)
+        
+        loss = self.alpha * hard_loss + (1 - self.alpha) * soft_loss
+        
+        return (loss, outputs) if return_outputs else loss
+
+# Donuk modele eklenen erken çıkış sınıflandırıcılarını yalnızca saldırganlık etiketiyle eğiten eğitici
+class ExitClassifierTrainer(OffensiveTrainer):
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        model_inputs = {key: inputs[key] for key in ["input_ids", "attention_mask", "token_type_ids"]}
+        outputs = model(**model_inputs)
+        
+        loss_fct_binary = nn.CrossEntropyLoss()
+        loss = sum(
+            loss_fct_binary(outputs[key], inputs["offensive"])
+            for key in outputs if key.startswith('exit_logits_')
+        )
+        
+        return (loss, outputs) if return_outputs else loss
+
 # 9. Metrik hesaplama
 def compute_metrics(eval_pred):
     predictions, labels = eval_pred
@@ -327,26 +566,50 @@ def compute_metrics(eval_pred):
         
     offensive_acc = (offensive_preds == offensive_labels).mean()
     
-    # Sonuçları raporla
-    return {
+    metrics = {
         "macro_f1": macro_f1,
         "weighted_f1": weighted_f1,
         "offensive_acc": offensive_acc
     }
+    
+    # Erken çıkış sınıflandırıcıları için doğruluk ve serviste kullanılan kural
+    # (örnek eşik 0.95: yalnızca "saldırgan değil" güveni eşiği geçenler çıkar) altında kapsam ve kesinlik
+    exit_accs = []
+    for key in predictions:
+        if not key.startswith('exit_non_probs_'):
+            continue
+        layer = key.replace('exit_non_probs_', '')
+        non_probs = predictions[key]
+        if isinstance(non_probs, torch.Tensor):
+            non_probs = non_probs.cpu().numpy()
+        
+        exit_acc = ((non_probs < 0.5).astype(np.int64) == offensive_labels).mean()
+        exiting = non_probs >= 0.95
+        metrics[f"exit_acc_{layer}"] = exit_acc
+        metrics[f"exit_coverage_{layer}"] = exiting.mean()
+        metrics[f"exit_precision_{layer}"] = (offensive_labels[exiting] == 0).mean() if exiting.any() else 1.0
+        exit_accs.append(exit_acc)
+    
+    if exit_accs:
+        metrics["exit_acc"] = float(np.mean(exit_accs))
+    
+    # Sonuçları raporla
+    return metrics
 
 # 10. Eğitim ayarları
 training_args = TrainingArguments(
-    output_dir="./offensive_model_hierarchical",
+    output_dir=output_dir,
     eval_strategy="epoch",
     save_strategy="epoch",
     per_device_train_batch_size=16,
     per_device_eval_batch_size=16,
-    num_train_epochs=4,
+    num_train_epochs=args.epochs,
     weight_decay=0.01,
     logging_dir="./logs",
     logging_steps=10,
     load_best_model_at_end=True,
-    metric_for_best_model="macro_f1",
+    # Erken çıkış eğitiminde yalnızca çıkış sınıflandırıcıları değiştiği için onların doğruluğu izlenir
+    metric_for_best_model="exit_acc" if args.early_exit_layers else "macro_f1",
     # Tensör dönüşüm hatalarını önlemek için
     dataloader_drop_last=True,
     remove_unused_columns=False,  # Özel model için gerekli
@@ -354,7 +617,15 @@ training_args = TrainingArguments(
 )
 
 # 11. Eğitici ve eğitim başlat
-trainer = OffensiveTrainer(
+trainer_class = OffensiveTrainer
+trainer_kwargs = {}
+if args.distill:
+    trainer_class = DistillationTrainer
+    trainer_kwargs = {"teacher_model": teacher_model, "temperature": args.temperature, "alpha": args.alpha}
+elif args.early_exit_layers:
+    trainer_class = ExitClassifierTrainer
+
+trainer = trainer_class(
     model=model,
     args=training_args,
     train_dataset=train_ds,
@@ -370,11 +641,12 @@ trainer = OffensiveTrainer(
         'targeted': torch.stack([f['targeted'] for f in data]),
         'target_type': torch.stack([f['target_type'] for f in data]),
         'is_difficult': torch.stack([f['is_difficult'] for f in data])
-    }
+    },
+    **trainer_kwargs
 )
 
 trainer.train()
 
 # 12. Model ve tokenizer kaydet
-trainer.save_model("offensive_model_hierarchical")
-tokenizer.save_pretrained("offensive_model_hierarchical")
+trainer.save_model(output_dir)
+tokenizer.save_pretrained(output_dir)